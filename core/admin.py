@@ -5,7 +5,8 @@ from .models import (
     Category, Supplier, Product, ProductBatch, PurchaseOrder, PurchaseOrderItem,
     PurchaseReturn, PurchaseReturnItem, StockAdjustment, Customer, Sale, SaleItem,
     UserProfile, PurchaseOrderCancellation, SupplierBill, Payment, StockMovement,
-    SaleReturn, SaleReturnItem, DuePayment, ViewPermission, UserViewPermission
+    SaleReturn, SaleReturnItem, DuePayment, DueAllocation, ViewPermission, UserViewPermission,
+    ExpiryAlert
 )
 
 # Inline Admin Classes
@@ -51,6 +52,12 @@ class DuePaymentInline(admin.TabularInline):
     fields = ['payment_date', 'amount', 'payment_method', 'reference_number']
     readonly_fields = ['payment_date']
 
+class DueAllocationInline(admin.TabularInline):
+    model = DueAllocation
+    extra = 0
+    fields = ['sale', 'amount']
+    raw_id_fields = ['sale']
+
 # Main Admin Classes
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -119,6 +126,16 @@ class ProductBatchAdmin(admin.ModelAdmin):
         })
     )
 
+@admin.register(ExpiryAlert)
+class ExpiryAlertAdmin(admin.ModelAdmin):
+    list_display = [
+        'product', 'batch', 'status', 'expiry_date', 'days_until_expiry',
+        'quantity', 'stock_value', 'alert_date'
+    ]
+    list_filter = ['status', 'alert_date']
+    search_fields = ['product__name', 'batch__batch_number']
+    date_hierarchy = 'alert_date'
+
 @admin.register(PurchaseOrder)
 class PurchaseOrderAdmin(admin.ModelAdmin):
     list_display = [
@@ -344,6 +361,7 @@ class DuePaymentAdmin(admin.ModelAdmin):
     list_filter = ['payment_method', 'payment_date']
     search_fields = ['customer__name', 'reference_number']
     readonly_fields = ['created_at', 'allocated_details_display']
+    inlines = [DueAllocationInline]
 
     def allocated_details_display(self, obj):
         return obj.allocated_details_display
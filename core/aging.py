@@ -0,0 +1,170 @@
+# core/aging.py
+"""
+Aging of receivables and payables.
+
+Open amounts fall in the buckets of ``BUCKETS`` by age in trading days:
+
+* receivables - the due of each ``due``/``partial`` Sale (total minus paid,
+  as ``Customer.update_due_amount``), aged from the sale date, per customer;
+* payables - the effective due of each SupplierBill (total minus purchase
+  returns minus paid, as ``SupplierBill.effective_due_amount``), aged from
+  the due date, per supplier. Bills not yet past due are ``not_due``.
+
+Each report is one ``GROUP BY`` query with a conditional ``Sum`` per bucket.
+The buckets are ranges on the raw date column, cut at trading-day starts
+(see ``core/business_calendar.py``), so no per-row date math runs in Python
+or SQL. Reports are cached for the day and dropped whenever a sale, bill,
+payment or return change commits (see the receivers at the bottom of
+``core/models.py``). Since a cached report outlives the change that
+invalidated it, it is always computed on the primary database, never on a
+lagging read replica.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, F, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from . import business_calendar
+from . import cache as cache_helper
+from .reports import MONEY, due_expression
+
+# (key, label, first day, last day); None for open-ended
+BUCKETS = (
+    ('days_0_30', '0-30 days', 0, 30),
+    ('days_31_60', '31-60 days', 31, 60),
+    ('days_61_90', '61-90 days', 61, 90),
+    ('days_90_plus', '90+ days', 91, None),
+)
+NOT_DUE = 'not_due'
+RECEIVABLES = 'receivables'
+PAYABLES = 'payables'
+KINDS = (RECEIVABLES, PAYABLES)
+# View code needed to read each report; None for any user
+PERMISSIONS = {RECEIVABLES: 'customer_due_report', PAYABLES: None}
+
+AGING_CACHE_TIMEOUT = 60 * 60 * 24
+AGING_NAMESPACE = 'aging'
+
+
+def _age_filter(field, today, first, last):
+    """``Q`` for ``field`` between ``first`` and ``last`` trading days before ``today``"""
+    q = Q()
+    if last is not None:
+        q &= business_calendar.since_filter(field, today - timedelta(days=last))
+    if first:
+        q &= business_calendar.until_filter(field, today - timedelta(days=first))
+    return q
+
+
+def _bucket_sums(amount, field, today, min_age=0):
+    """A conditional ``Sum`` of ``amount`` per bucket, counting ages from ``min_age`` days"""
+    return {
+        key: Sum(amount, filter=_age_filter(field, today, max(first, min_age), last), output_field=MONEY)
+        for key, _, first, last in BUCKETS
+    }
+
+
+def _effective_due():
+    """Effective due per bill: max(max(total - returned, 0) - paid, 0)"""
+    from .models import PurchaseReturn
+
+    returned = Coalesce(
+        Subquery(
+            PurchaseReturn.objects.filter(purchase_order=OuterRef('purchase_order')).order_by().values(
+                'purchase_order',
+            ).annotate(total=Sum('return_amount')).values('total')[:1],
+            output_field=MONEY,
+        ),
+        Value(0, output_field=MONEY),
+    )
+    zero = Value(0, output_field=MONEY)
+    return Greatest(
+        Greatest(F('total_amount') - returned, zero, output_field=MONEY) - F('paid_amount'),
+        zero,
+        output_field=MONEY,
+    )
+
+
+def _receivables(today):
+    from .models import Sale
+
+    return Sale.objects.using(DEFAULT_DB_ALIAS).filter(
+        customer__isnull=False,
+        payment_status__in=['due', 'partial'],
+    ).annotate(open_amount=due_expression()).values(
+        'customer_id', 'customer__name', 'customer__phone',
+    ).annotate(
+        total=Sum('open_amount'),
+        **_bucket_sums(F('open_amount'), 'sale_date', today),
+        invoices=Count('id'),
+        oldest=Min('sale_date'),
+    ).filter(total__gt=0).order_by('-total')
+
+
+def _payables(today):
+    from .models import SupplierBill
+
+    # Past due from the day after the due date, as SupplierBill.is_overdue
+    return SupplierBill.objects.using(DEFAULT_DB_ALIAS).exclude(status='returned').annotate(
+        open_amount=_effective_due(),
+    ).filter(open_amount__gt=0).values(
+        'supplier_id', 'supplier__name', 'supplier__phone',
+    ).annotate(
+        total=Sum('open_amount'),
+        not_due=Sum('open_amount', filter=business_calendar.since_filter('due_date', today), output_field=MONEY),
+        **_bucket_sums(F('open_amount'), 'due_date', today, min_age=1),
+        invoices=Count('id'),
+        oldest=Min('due_date'),
+    ).order_by('-total')
+
+
+def _compute(kind, today):
+    rows = _receivables(today) if kind == RECEIVABLES else _payables(today)
+    party = 'customer' if kind == RECEIVABLES else 'supplier'
+    amounts = ['total'] + [key for key, _, _, _ in BUCKETS] + ([NOT_DUE] if kind == PAYABLES else [])
+
+    parties = []
+    totals = dict.fromkeys(amounts, Decimal('0'))
+    totals['invoices'] = 0
+    for row in rows:
+        entry = {
+            'id': row[f'{party}_id'],
+            'name': row[f'{party}__name'],
+            'phone': row[f'{party}__phone'],
+            'invoices': row['invoices'],
+            'oldest': row['oldest'],
+            **{name: row[name] or Decimal('0') for name in amounts},
+        }
+        parties.append(entry)
+        for name in amounts:
+            totals[name] += entry[name]
+        totals['invoices'] += entry['invoices']
+    return {
+        'kind': kind,
+        'as_of': today,
+        'buckets': [(key, label) for key, label, _, _ in BUCKETS],
+        'parties': parties,
+        'totals': totals,
+    }
+
+
+def aging_report(kind, today=None):
+    """
+    ``{'kind', 'as_of', 'buckets', 'parties', 'totals'}`` for ``kind``
+    (``'receivables'`` or ``'payables'``), one entry per customer or supplier
+    with an open amount, largest first. Cached for the rest of the day.
+    """
+    if kind not in KINDS:
+        raise ValueError(f'Unknown aging report: {kind}')
+    today = today or business_calendar.today()
+    return cache_helper.get_or_set(
+        AGING_NAMESPACE, [kind, today.isoformat()],
+        lambda: _compute(kind, today), AGING_CACHE_TIMEOUT,
+    )
+
+
+def invalidate_aging_cache():
+    """Drop every cached report; called whenever a due amount changes"""
+    cache_helper.bump(AGING_NAMESPACE)
@@ -0,0 +1,258 @@
+# core/async_views.py
+"""
+Async versions of the small JSON lookups used while scanning and billing.
+
+They use Django's async ORM, so under the ASGI application (``shop_man/asgi.py``,
+e.g. ``uvicorn shop_man.asgi:application``) a lookup is served by the event
+loop instead of waiting for a free sync worker behind a report page. Responses
+are the same as the sync views they replace.
+
+``batch_lookup`` resolves many barcodes/SKUs/IDs in one request for scanners
+and tablets replaying a cart after reconnecting.
+"""
+import json
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db.models import F, Q
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+
+from . import business_calendar
+from .models import Category, Customer, Product, ProductBatch, Sale, Supplier
+
+BATCH_LOOKUP_MAX_ITEMS = getattr(settings, 'BATCH_LOOKUP_MAX_ITEMS', 200)
+
+
+def _product_json(product):
+    return {
+        'id': product.id,
+        'name': product.name,
+        'sku': product.sku,
+        'barcode': product.barcode,
+        'selling_price': str(product.selling_price),
+        'current_stock': product.current_stock,
+        'has_expiry': product.has_expiry,
+    }
+
+
+@login_required
+async def search_product_by_barcode(request):
+    """API endpoint to search product by barcode or name"""
+    query = request.GET.get('barcode', '').strip()
+    if not query:
+        return JsonResponse({'success': False, 'error': 'No search query provided'})
+
+    # Exact barcode match first (scanner input)
+    product = await Product.objects.filter(barcode=query).afirst()
+    if product is not None:
+        return JsonResponse({'success': True, 'product': _product_json(product)})
+
+    products = [
+        _product_json(product)
+        async for product in Product.objects.filter(
+            Q(name__icontains=query) | Q(barcode__icontains=query) | Q(sku__icontains=query)
+        )[:10]
+    ]
+    if products:
+        return JsonResponse({'success': True, 'products': products, 'multiple': True})
+
+    return JsonResponse({'success': False, 'error': 'No products found with that name or barcode'})
+
+
+async def search_customer(request):
+    """Search customers by name or phone"""
+    query = request.GET.get('q', '')
+    if len(query) < 2:
+        return JsonResponse({'success': False, 'message': 'Please enter at least 2 characters'})
+
+    customers = Customer.objects.filter(
+        Q(name__icontains=query) | Q(phone__icontains=query),
+        is_active=True
+    ).values('id', 'name', 'phone', 'total_due', 'credit_limit')[:10]
+
+    return JsonResponse({'success': True, 'customers': [customer async for customer in customers]})
+
+
+@login_required
+async def get_customer_due_details(request, customer_id):
+    """Get detailed due information for a customer"""
+    try:
+        customer = await Customer.objects.aget(id=customer_id)
+    except Customer.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'Customer not found'})
+
+    due_invoices = []
+    async for invoice in Sale.objects.filter(
+        customer=customer,
+        payment_status__in=['due', 'partial']
+    ).order_by('sale_date').values(
+        'id', 'invoice_number', 'sale_date', 'total_amount',
+        'paid_amount', 'payment_status'
+    ):
+        invoice['remaining_due'] = invoice['total_amount'] - invoice['paid_amount']
+        invoice['sale_date'] = invoice['sale_date'].strftime('%Y-%m-%d %H:%M')
+        due_invoices.append(invoice)
+
+    total_due = sum(invoice['remaining_due'] for invoice in due_invoices)
+
+    return JsonResponse({
+        'success': True,
+        'customer': {
+            'id': customer.id,
+            'name': customer.name,
+            'phone': customer.phone,
+            'total_due': float(total_due),
+            'credit_limit': float(customer.credit_limit),
+        },
+        'due_invoices': due_invoices,
+        'total_due_amount': float(total_due),
+        'due_invoice_count': len(due_invoices)
+    })
+
+
+@login_required
+async def get_batches_for_product(request, product_id):
+    """API endpoint to get batches for a product"""
+    batches = []
+    async for batch in ProductBatch.objects.filter(
+        product_id=product_id,
+        current_quantity__gt=0
+    ).values('id', 'batch_number', 'expiry_date', 'current_quantity').order_by('expiry_date'):
+        batch['expiry_date'] = batch['expiry_date'].strftime('%Y-%m-%d') if batch['expiry_date'] else None
+        batches.append(batch)
+
+    return JsonResponse(batches, safe=False)
+
+
+@login_required
+async def get_product_details(request):
+    """API endpoint to get product details for exchange"""
+    product_id = request.GET.get('product_id')
+    if not product_id:
+        return JsonResponse({'success': False, 'error': 'No product ID provided'})
+
+    try:
+        product = await Product.objects.aget(id=product_id)
+    except Product.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Product not found'})
+
+    return JsonResponse({
+        'success': True,
+        'product': {
+            'id': product.id,
+            'name': product.name,
+            'sku': product.sku,
+            'selling_price': str(product.selling_price),
+            'current_stock': product.current_stock,
+            'cost_price': str(product.cost_price),
+        }
+    })
+
+
+@require_http_methods(["GET"])
+async def search_categories(request):
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse([], safe=False)
+
+    results = [
+        {'id': category.id, 'name': category.name, 'description': category.description}
+        async for category in Category.objects.filter(name__icontains=query)[:10]
+    ]
+    return JsonResponse(results, safe=False)
+
+
+@require_http_methods(["GET"])
+async def search_suppliers(request):
+    query = request.GET.get('q', '').strip()
+    if len(query) < 2:
+        return JsonResponse([], safe=False)
+
+    results = [
+        {
+            'id': supplier.id,
+            'name': supplier.name,
+            'contact_person': supplier.contact_person,
+            'phone': supplier.phone
+        }
+        async for supplier in Supplier.objects.filter(name__icontains=query)[:10]
+    ]
+    return JsonResponse(results, safe=False)
+
+
+def _lookup_values(data, field):
+    """Unique, stripped values of ``data[field]`` in request order"""
+    values = data.get(field) or []
+    if not isinstance(values, list):
+        raise ValueError(f'{field} must be a list')
+    return list(dict.fromkeys(str(value).strip() for value in values))
+
+
+@login_required
+@require_http_methods(["POST"])
+async def batch_lookup(request):
+    """
+    Resolve many products at once.
+
+    Body: ``{"barcodes": [...], "skus": [...], "ids": [...]}``. Duplicates are
+    looked up once. The response has every matched product once under
+    ``products`` (with live stock and its sellable batches, earliest expiry
+    first), and per requested value either ``{"product_id": id}`` or
+    ``{"error": message}``. Products and batches are one query each.
+    """
+    try:
+        data = json.loads(request.body)
+        barcodes = _lookup_values(data, 'barcodes')
+        skus = _lookup_values(data, 'skus')
+        ids = _lookup_values(data, 'ids')
+    except (ValueError, AttributeError) as e:
+        return JsonResponse({'success': False, 'error': f'Invalid request: {e}'}, status=400)
+
+    if len(barcodes) + len(skus) + len(ids) > BATCH_LOOKUP_MAX_ITEMS:
+        return JsonResponse({
+            'success': False,
+            'error': f'At most {BATCH_LOOKUP_MAX_ITEMS} items can be looked up at once'
+        }, status=400)
+
+    product_ids = {int(value) for value in ids if value.isdigit()}
+    condition = Q(barcode__in=[value for value in barcodes if value]) | Q(sku__in=skus) | Q(id__in=product_ids)
+    products = {}
+    by_barcode = {}
+    by_sku = {}
+    async for product in Product.objects.filter(condition):
+        products[product.id] = dict(_product_json(product), batches=[])
+        by_barcode[product.barcode] = product.id
+        by_sku[product.sku] = product.id
+
+    # FEFO: sellable batches of every matched product, earliest expiry first
+    async for batch in ProductBatch.objects.filter(
+        product_id__in=products,
+        current_quantity__gt=0
+    ).exclude(
+        expiry_date__lt=business_calendar.today()
+    ).order_by(F('expiry_date').asc(nulls_last=True), 'id').values(
+        'id', 'product_id', 'batch_number', 'expiry_date', 'current_quantity'
+    ):
+        product_id = batch.pop('product_id')
+        batch['expiry_date'] = batch['expiry_date'].strftime('%Y-%m-%d') if batch['expiry_date'] else None
+        products[product_id]['batches'].append(batch)
+
+    results = {'barcodes': {}, 'skus': {}, 'ids': {}}
+    for field, values, found in (('barcodes', barcodes, by_barcode), ('skus', skus, by_sku)):
+        for value in values:
+            product_id = found.get(value) if value else None
+            results[field][value] = {'product_id': product_id} if product_id else {'error': 'Product not found'}
+    for value in ids:
+        if not value.isdigit():
+            results['ids'][value] = {'error': 'Invalid product ID'}
+        elif int(value) in products:
+            results['ids'][value] = {'product_id': int(value)}
+        else:
+            results['ids'][value] = {'error': 'Product not found'}
+
+    return JsonResponse({
+        'success': True,
+        'products': products,
+        **results,
+    })
@@ -0,0 +1,408 @@
+# core/backup.py
+"""
+MySQL backup engine used by the ``backup_database`` command.
+
+A backup is a directory holding one compressed SQL file per table plus a
+``manifest.json`` with the row count and SHA-256 of every file, so a restore can
+verify what it loaded.
+
+* Rows are streamed with a server-side cursor (``SSCursor``) and written as
+  multi-row ``INSERT`` statements straight into the compressed file - a table is
+  never held in memory.
+* Values are escaped by the MySQL driver itself (``connection.literal``), so
+  quotes, backslashes, dates, decimals and binary data round-trip exactly. The
+  driver escapes newlines too, which keeps every row on its own line and lets
+  the restore stream the file line by line.
+* Every table is read inside ``START TRANSACTION WITH CONSISTENT SNAPSHOT``.
+  With several workers, the tables are read-locked while each worker opens its
+  snapshot so all workers see the same point in time.
+
+Incremental backups
+-------------------
+Every manifest records a high-water mark per table - ``MAX(updated_at)``, or
+``MAX(created_at)`` for append-only tables - read inside the snapshot. An
+incremental backup exports only rows at or after the previous mark as
+``REPLACE`` statements (boundary rows are exported again, which is harmless);
+tables with neither column are copied whole. A chain is one full base followed
+by its increments, restored in order. Deleted rows and changes to tables that
+only have ``created_at`` are picked up by the next full base.
+"""
+import gzip
+import hashlib
+import json
+import os
+import queue
+import threading
+
+from django.db import connection, connections
+from django.utils import timezone
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = 'manifest.json'
+BACKUP_PREFIX = 'db_backup_'
+TRACK_COLUMNS = ('updated_at', 'created_at')    # preferred high-water column first
+
+COMPRESSIONS = ('gzip', 'zstd', 'none')
+EXTENSIONS = {'gzip': '.sql.gz', 'zstd': '.sql.zst', 'none': '.sql'}
+
+DEFAULT_CHUNK_ROWS = 1000            # rows per INSERT statement
+MAX_STATEMENT_BYTES = 1024 * 1024    # well below MySQL's default max_allowed_packet
+FETCH_ROWS = 5000                    # rows pulled from the server per round trip
+
+
+class BackupError(Exception):
+    pass
+
+
+def open_stream(path, compression, mode='rb'):
+    """Open ``path`` for binary reading or writing through the given compression"""
+    if compression == 'gzip':
+        return gzip.open(path, mode, compresslevel=6)
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise BackupError('zstd compression needs the "zstandard" package (pip install zstandard).')
+        return zstandard.open(path, mode)
+    if compression == 'none':
+        return open(path, mode)
+    raise BackupError(f'Unknown compression: {compression}')
+
+
+class _HashingWriter:
+    """Counts and hashes the uncompressed bytes on their way to ``stream``"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.bytes += len(data)
+        self.stream.write(data)
+
+
+def list_tables(cursor):
+    cursor.execute("SHOW FULL TABLES WHERE Table_type = 'BASE TABLE'")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def tracked_columns(cursor):
+    """``{table: column}`` for every table that has a high-water column"""
+    cursor.execute(
+        "SELECT TABLE_NAME, COLUMN_NAME FROM information_schema.COLUMNS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND COLUMN_NAME IN (%s, %s)",
+        list(TRACK_COLUMNS),
+    )
+    found = {}
+    for table, column in cursor.fetchall():
+        found.setdefault(table, set()).add(column)
+    return {
+        table: next(column for column in TRACK_COLUMNS if column in columns)
+        for table, columns in found.items()
+    }
+
+
+def start_snapshot(cursor):
+    cursor.execute("SET SESSION TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+    cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT")
+
+
+def dump_table(db_connection, table, out, where='', params=None, verb='INSERT',
+               include_schema=True, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """
+    Write ``table`` to ``out`` (anything with ``write(bytes)``) and return the
+    number of rows written. ``where``/``params`` restrict the rows (used by
+    incremental backups); ``verb`` is ``INSERT`` or ``REPLACE``.
+    """
+    import MySQLdb.cursors
+
+    out.write(f"-- Table `{table}`\n".encode())
+    out.write(b"SET NAMES utf8mb4;\nSET FOREIGN_KEY_CHECKS=0;\n")
+
+    if include_schema:
+        with db_connection.cursor() as cursor:
+            cursor.execute(f"SHOW CREATE TABLE `{table}`")
+            create_table_sql = cursor.fetchone()[1]
+        out.write(f"DROP TABLE IF EXISTS `{table}`;\n{create_table_sql};\n".encode())
+
+    db_connection.ensure_connection()
+    raw = db_connection.connection
+    rows = 0
+    stream = raw.cursor(MySQLdb.cursors.SSCursor)
+    try:
+        stream.execute(f"SELECT * FROM `{table}`{where}", params)
+        columns = ', '.join(f'`{col[0]}`' for col in stream.description)
+        header = f"{verb} INTO `{table}` ({columns}) VALUES\n".encode()
+
+        batch = []
+        batch_bytes = 0
+        while True:
+            chunk = stream.fetchmany(FETCH_ROWS)
+            if not chunk:
+                break
+            for row in chunk:
+                literal = raw.literal(row)
+                batch.append(literal)
+                batch_bytes += len(literal)
+                if len(batch) >= chunk_rows or batch_bytes >= MAX_STATEMENT_BYTES:
+                    out.write(header + b",\n".join(batch) + b";\n")
+                    rows += len(batch)
+                    batch = []
+                    batch_bytes = 0
+        if batch:
+            out.write(header + b",\n".join(batch) + b";\n")
+            rows += len(batch)
+    finally:
+        stream.close()
+
+    out.write(b"SET FOREIGN_KEY_CHECKS=1;\n")
+    return rows
+
+
+def dump_table_to_file(db_connection, table, directory, compression, track_column=None, since=None, **kwargs):
+    """
+    Dump one table to ``<directory>/<table><ext>`` and return its manifest entry.
+
+    With ``track_column`` the entry records the column's current maximum as the
+    table's high-water mark; with ``since`` as well, only rows at or after that
+    mark are written, as ``REPLACE`` statements without the table schema.
+    """
+    high_water = None
+    if track_column:
+        with db_connection.cursor() as cursor:
+            cursor.execute(f"SELECT MAX(`{track_column}`) FROM `{table}`")
+            high_water = cursor.fetchone()[0]
+        if since is not None:
+            kwargs.update(
+                where=f" WHERE `{track_column}` >= %s",
+                params=[since],
+                verb='REPLACE',
+                include_schema=False,
+            )
+
+    filename = table + EXTENSIONS[compression]
+    with open_stream(os.path.join(directory, filename), compression, 'wb') as stream:
+        writer = _HashingWriter(stream)
+        rows = dump_table(db_connection, table, writer, **kwargs)
+
+    entry = {
+        'file': filename,
+        'rows': rows,
+        'bytes': writer.bytes,
+        'sha256': writer.sha256.hexdigest(),
+        'incremental': since is not None,
+    }
+    if track_column:
+        entry['high_water'] = {
+            'column': track_column,
+            'value': str(high_water) if high_water is not None else since,
+        }
+    return entry
+
+
+def _dump_worker(jobs, results, errors, ready, directory, compression, table_options, progress):
+    """Runs in its own thread with its own connection and snapshot"""
+    db_connection = connections['default']
+    try:
+        with db_connection.cursor() as cursor:
+            start_snapshot(cursor)
+        ready.wait()
+        while not errors:
+            try:
+                table = jobs.get_nowait()
+            except queue.Empty:
+                break
+            entry = dump_table_to_file(
+                db_connection, table, directory, compression, **table_options.get(table, {})
+            )
+            results[table] = entry
+            if progress:
+                progress(table, entry)
+        with db_connection.cursor() as cursor:
+            cursor.execute("COMMIT")
+    except threading.BrokenBarrierError:
+        pass
+    except Exception as e:
+        errors.append(e)
+        ready.abort()
+    finally:
+        db_connection.close()
+
+
+def dump_tables(tables, directory, compression='gzip', workers=1, table_options=None, progress=None):
+    """
+    Dump ``tables`` into ``directory`` from one consistent snapshot and return
+    ``{table: manifest entry}``. ``table_options`` maps a table to extra
+    ``dump_table`` keyword arguments.
+    """
+    table_options = table_options or {}
+    results = {}
+
+    if workers <= 1:
+        with connection.cursor() as cursor:
+            start_snapshot(cursor)
+        try:
+            for table in tables:
+                results[table] = dump_table_to_file(
+                    connection, table, directory, compression, **table_options.get(table, {})
+                )
+                if progress:
+                    progress(table, results[table])
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("COMMIT")
+        return results
+
+    jobs = queue.Queue()
+    for table in tables:
+        jobs.put(table)
+    errors = []
+    ready = threading.Barrier(workers + 1)
+    threads = [
+        threading.Thread(
+            target=_dump_worker,
+            args=(jobs, results, errors, ready, directory, compression, table_options, progress),
+        )
+        for _ in range(workers)
+    ]
+
+    # Hold off writers until every worker has opened its snapshot
+    with connection.cursor() as cursor:
+        cursor.execute("LOCK TABLES " + ", ".join(f"`{table}` READ" for table in tables))
+        try:
+            for thread in threads:
+                thread.start()
+            try:
+                ready.wait()
+            except threading.BrokenBarrierError:
+                pass
+        finally:
+            cursor.execute("UNLOCK TABLES")
+
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def write_manifest(directory, manifest):
+    with open(os.path.join(directory, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def read_manifest(directory):
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        raise BackupError(f'No {MANIFEST_NAME} in {directory}')
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_backups(output_dir):
+    """Backup directories under ``output_dir`` with their manifests, oldest first"""
+    if not os.path.isdir(output_dir):
+        return []
+    backups = []
+    for name in sorted(os.listdir(output_dir)):
+        directory = os.path.join(output_dir, name)
+        if name.startswith(BACKUP_PREFIX) and os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+            backups.append((directory, read_manifest(directory)))
+    return backups
+
+
+def current_chain(output_dir):
+    """The latest full backup and the increments taken on top of it"""
+    chain = []
+    for directory, manifest in list_backups(output_dir):
+        if manifest['type'] == 'full':
+            chain = [(directory, manifest)]
+        elif chain and manifest.get('base') == os.path.basename(chain[0][0]):
+            chain.append((directory, manifest))
+    return chain
+
+
+def backup_chain(directory):
+    """
+    Backups needed to restore ``directory``: itself if it is a full backup,
+    otherwise its base followed by every increment up to and including it.
+    """
+    directory = os.path.normpath(directory)
+    manifest = read_manifest(directory)
+    if manifest['type'] == 'full':
+        return [(directory, manifest)]
+
+    chain = [(directory, manifest)]
+    parent_dir = os.path.dirname(directory)
+    while manifest['type'] != 'full':
+        parent = os.path.join(parent_dir, manifest['parent'])
+        if not os.path.isdir(parent):
+            raise BackupError(f"Backup {manifest['parent']} needed by {os.path.basename(directory)} is missing")
+        manifest = read_manifest(parent)
+        chain.append((parent, manifest))
+    chain.reverse()
+    return chain
+
+
+def run_backup(output_dir, compression='gzip', workers=1, tables=None, progress=None,
+               incremental=False, full_every=24):
+    """
+    Back up every table (or ``tables``) into a new ``db_backup_<timestamp>``
+    directory under ``output_dir`` and return ``(directory, manifest)``.
+
+    With ``incremental`` only changed rows are exported on top of the current
+    chain; a full base is taken instead when there is no chain yet or it
+    already holds ``full_every`` increments.
+    """
+    if compression not in COMPRESSIONS:
+        raise BackupError(f'Unknown compression: {compression}')
+
+    with connection.cursor() as cursor:
+        all_tables = list_tables(cursor)
+        track = tracked_columns(cursor)
+    if tables:
+        missing = set(tables) - set(all_tables)
+        if missing:
+            raise BackupError(f"Unknown tables: {', '.join(sorted(missing))}")
+        all_tables = [table for table in all_tables if table in tables]
+
+    chain = current_chain(output_dir) if incremental else []
+    parent = None
+    if chain and len(chain) <= full_every:
+        parent_dir, parent = chain[-1]
+        if set(parent['tables']) != set(all_tables):
+            # Table set changed (e.g. a migration) - start a new base
+            parent = None
+
+    table_options = {}
+    for table in all_tables:
+        options = {}
+        if table in track:
+            options['track_column'] = track[table]
+            mark = parent['tables'][table].get('high_water') if parent else None
+            if mark and mark['column'] == track[table] and mark['value'] is not None:
+                options['since'] = mark['value']
+        table_options[table] = options
+
+    started = timezone.now()
+    directory = os.path.join(output_dir, f"{BACKUP_PREFIX}{started.strftime('%Y%m%d_%H%M%S')}")
+    os.makedirs(directory)
+
+    entries = dump_tables(all_tables, directory, compression, workers, table_options, progress)
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'type': 'incremental' if parent else 'full',
+        'database': connection.settings_dict['NAME'],
+        'started_at': started.isoformat(),
+        'finished_at': timezone.now().isoformat(),
+        'compression': compression,
+        'tables': {table: entries[table] for table in all_tables},
+    }
+    if parent:
+        manifest['base'] = os.path.basename(chain[0][0])
+        manifest['parent'] = os.path.basename(parent_dir)
+    write_manifest(directory, manifest)
+    return directory, manifest
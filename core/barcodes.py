@@ -0,0 +1,146 @@
+# core/barcodes.py
+"""
+Barcode allocation helpers.
+
+Two schemes are supported:
+
+* ``sku``   - the original ``BC-<sku>`` style codes (Code128 friendly). Collisions
+              get a ``-1``, ``-2`` ... suffix.
+* ``ean13`` - numeric EAN-13 codes taken from an in-store prefix (``20`` by
+              default, the GS1 restricted-circulation range) with a valid check digit.
+
+Every allocation reads the existing codes it could collide with in ONE query and
+then works in memory, so importing thousands of products costs the same number of
+queries as importing one.
+"""
+from django.conf import settings
+from django.db.models import Q
+
+EAN13_PREFIX = getattr(settings, 'BARCODE_EAN13_PREFIX', '20')
+
+
+def ean13_check_digit(digits):
+    """Return the EAN-13 check digit for a 12 digit string"""
+    if len(digits) != 12 or not digits.isdigit():
+        raise ValueError('EAN-13 needs exactly 12 digits to compute a check digit.')
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_ean13(code):
+    """Check length, digits and check digit of an EAN-13 code"""
+    if not code or len(code) != 13 or not code.isdigit():
+        return False
+    return ean13_check_digit(code[:12]) == code[12]
+
+
+def code128_checksum(data):
+    """
+    Return the Code128 (code set B) check symbol value for ``data``.
+    Printers add this symbol themselves; it is exposed for label software that needs it.
+    """
+    total = 104  # Start B
+    for position, char in enumerate(data, start=1):
+        value = ord(char) - 32
+        if not 0 <= value <= 95:
+            raise ValueError(f'Character {char!r} cannot be encoded in Code128 set B.')
+        total += position * value
+    return total % 103
+
+
+def base_barcode_for_sku(sku):
+    """Base barcode used by the sku scheme"""
+    return sku.replace('SKU-', 'BC-')
+
+
+def _existing_barcodes(prefixes, exclude_pk=None):
+    """Fetch every barcode starting with any of ``prefixes`` in a single query"""
+    from .models import Product
+
+    prefixes = {p for p in prefixes if p}
+    if not prefixes:
+        return set()
+
+    condition = Q()
+    for prefix in prefixes:
+        condition |= Q(barcode__startswith=prefix)
+
+    queryset = Product.objects.filter(condition)
+    if exclude_pk:
+        queryset = queryset.exclude(pk=exclude_pk)
+    return set(queryset.values_list('barcode', flat=True))
+
+
+def _next_free(base, taken):
+    """First of base, base-1, base-2 ... that is not in ``taken``"""
+    if base not in taken:
+        return base
+    counter = 1
+    while f"{base}-{counter}" in taken:
+        counter += 1
+    return f"{base}-{counter}"
+
+
+def allocate_sku_barcode(sku, exclude_pk=None):
+    """Allocate one ``BC-...`` barcode for a sku"""
+    base = base_barcode_for_sku(sku)
+    return _next_free(base, _existing_barcodes([base], exclude_pk=exclude_pk))
+
+
+def reserve_ean13(count, prefix=None):
+    """
+    Reserve ``count`` consecutive EAN-13 codes after the highest one already
+    used under ``prefix``. Returns a list of codes with valid check digits.
+    """
+    from .models import Product
+
+    prefix = prefix or EAN13_PREFIX
+    body_length = 12 - len(prefix)
+    if body_length <= 0 or not prefix.isdigit():
+        raise ValueError('EAN-13 prefix must be 1-11 digits.')
+
+    # Codes are fixed width, so the lexical max is also the numeric max
+    last = Product.objects.filter(
+        barcode__regex=rf'^{prefix}[0-9]{{{body_length + 1}}}$'
+    ).order_by('-barcode').values_list('barcode', flat=True).first()
+
+    next_number = int(last[len(prefix):12]) + 1 if last else 1
+    if next_number + count - 1 >= 10 ** body_length:
+        raise ValueError(f'EAN-13 range for prefix {prefix} is exhausted.')
+
+    codes = []
+    for number in range(next_number, next_number + count):
+        digits = f"{prefix}{number:0{body_length}d}"
+        codes.append(digits + ean13_check_digit(digits))
+    return codes
+
+
+def allocate_barcodes(products, scheme='sku', prefix=None):
+    """
+    Fill in ``barcode`` for every product in ``products`` that has none.
+
+    Products are modified in place but not saved, so the caller can follow up
+    with ``bulk_create``/``bulk_update``. Returns the list of products that got
+    a new barcode.
+    """
+    pending = [p for p in products if not p.barcode]
+    if not pending:
+        return []
+
+    if scheme == 'ean13':
+        for product, code in zip(pending, reserve_ean13(len(pending), prefix=prefix)):
+            product.barcode = code
+        return pending
+
+    if scheme != 'sku':
+        raise ValueError(f'Unknown barcode scheme: {scheme}')
+
+    pending = [p for p in pending if p.sku]
+    taken = _existing_barcodes(base_barcode_for_sku(p.sku) for p in pending)
+    # Barcodes already held by the products being imported count as taken too
+    taken.update(p.barcode for p in products if p.barcode)
+
+    for product in pending:
+        product.barcode = _next_free(base_barcode_for_sku(product.sku), taken)
+        taken.add(product.barcode)
+    return pending
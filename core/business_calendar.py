@@ -0,0 +1,106 @@
+# core/business_calendar.py
+"""
+The shop's trading calendar.
+
+Times are stored in UTC; the shop trades in ``SHOP_TIME_ZONE``, and a trading
+day runs from ``TRADING_DAY_START`` local time to the same time the next day,
+so with ``TRADING_DAY_START = '02:00'`` a sale at 01:30 belongs to the day
+before. Reports, rollups and anything keyed by "today" go through these
+helpers instead of ``__date`` lookups or ``timezone.now().date()``, which cut
+days at midnight in whatever time zone happens to be active.
+
+``day_filter('sale_date', start, end)`` is an index-friendly range on the raw
+column; ``trading_day_expression('sale_date')`` is the column shifted by the
+day start, for truncating to trading days in SQL with ``tzinfo=shop_timezone()``.
+"""
+from datetime import datetime, time, timedelta
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db.models import DateTimeField, ExpressionWrapper, F, Q
+from django.utils import timezone
+
+SHOP_TIME_ZONE = getattr(settings, 'SHOP_TIME_ZONE', settings.TIME_ZONE)
+TRADING_DAY_START = getattr(settings, 'TRADING_DAY_START', '00:00')
+
+
+@lru_cache(maxsize=None)
+def shop_timezone():
+    return ZoneInfo(SHOP_TIME_ZONE)
+
+
+@lru_cache(maxsize=None)
+def day_start_offset():
+    """``TRADING_DAY_START`` as a timedelta after local midnight"""
+    start = time.fromisoformat(TRADING_DAY_START)
+    return timedelta(hours=start.hour, minutes=start.minute)
+
+
+def local_time(value=None):
+    """``value`` (default now) in the shop's time zone"""
+    return timezone.localtime(value or timezone.now(), shop_timezone())
+
+
+def trading_date(value=None):
+    """The trading day an aware datetime (default now) falls in"""
+    return (local_time(value) - day_start_offset()).date()
+
+
+def today():
+    return trading_date()
+
+
+def day_start(day):
+    """Aware datetime at which trading day ``day`` starts"""
+    return timezone.make_aware(datetime.combine(day, time.min) + day_start_offset(), shop_timezone())
+
+
+def day_window(start, end=None):
+    """``(since, until)`` covering trading days ``start`` to ``end`` (default ``start``), ``until`` excluded"""
+    return day_start(start), day_start((end or start) + timedelta(days=1))
+
+
+def day_filter(field, start, end=None):
+    """``Q`` for ``field`` within trading days ``start`` to ``end`` (default ``start``)"""
+    since, until = day_window(start, end)
+    return Q(**{f'{field}__gte': since, f'{field}__lt': until})
+
+
+def since_filter(field, start):
+    """``Q`` for ``field`` on or after the start of trading day ``start``"""
+    return Q(**{f'{field}__gte': day_start(start)})
+
+
+def until_filter(field, end):
+    """``Q`` for ``field`` up to the end of trading day ``end``"""
+    return Q(**{f'{field}__lt': day_start(end + timedelta(days=1))})
+
+
+def trading_hours(day):
+    """The naive local start of every wall-clock hour of trading day ``day``"""
+    first = datetime.combine(day, time.min) + day_start_offset()
+    return [first + timedelta(hours=hour) for hour in range(24)]
+
+
+def hour_window(day, hour):
+    """
+    ``(since, until)`` of local hour ``hour`` (0-23) of trading day ``day``;
+    hours before the day start are the early hours of the next calendar day
+    """
+    local = datetime.combine(day, time(hour))
+    if timedelta(hours=hour) < day_start_offset():
+        local += timedelta(days=1)
+    since = timezone.make_aware(local, shop_timezone())
+    return since, since + timedelta(hours=1)
+
+
+def trading_day_expression(field):
+    """
+    ``field`` moved back by the trading day start, so truncating it to a day
+    (with ``tzinfo=shop_timezone()``) gives the trading day
+    """
+    offset = day_start_offset()
+    if not offset:
+        return F(field)
+    return ExpressionWrapper(F(field) - offset, output_field=DateTimeField())
@@ -0,0 +1,77 @@
+# core/cache.py
+"""
+Small helpers around Django's cache for the report and lookup caches.
+
+Keys are grouped in namespaces. Every namespace has a version number stored
+in the cache itself and baked into its keys, so ``bump(namespace)`` drops
+every entry of the namespace at once - on any backend, without scanning keys.
+
+    summary = cache_helper.get_or_set('expiry_summary', [today, category_id], compute, timeout)
+    cache_helper.bump('expiry_summary')
+"""
+import time
+
+from django.core.cache import cache
+
+
+def _version_key(namespace):
+    return f"{namespace}:version"
+
+
+def _new_version():
+    # A version key can be evicted on its own; restarting from a clock value
+    # instead of 1 keeps entries cached under an earlier version from coming back
+    return time.time_ns()
+
+
+def get_version(namespace):
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # add() so two processes starting together agree on the version
+        cache.add(_version_key(namespace), _new_version(), None)
+        version = cache.get(_version_key(namespace))
+        if version is None:
+            version = _new_version()
+    return version
+
+
+def bump(namespace):
+    """Invalidate every key of ``namespace``"""
+    try:
+        cache.incr(_version_key(namespace))
+    except ValueError:
+        cache.set(_version_key(namespace), _new_version(), None)
+
+
+def _key(namespace, version, parts):
+    suffix = ':'.join('' if part is None else str(part) for part in parts)
+    return f"{namespace}:v{version}:{suffix}"
+
+
+def make_key(namespace, parts=()):
+    """Versioned cache key for ``parts`` within ``namespace``"""
+    return _key(namespace, get_version(namespace), parts)
+
+
+def get_or_set(namespace, parts, compute, timeout=None):
+    """Cached value for ``parts``, calling ``compute()`` on a miss"""
+    key = make_key(namespace, parts)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+def get_many(namespace, parts_list):
+    """``{parts: value}`` for the entries of ``parts_list`` that are cached"""
+    version = get_version(namespace)
+    keys = {_key(namespace, version, parts): parts for parts in parts_list}
+    found = cache.get_many(list(keys))
+    return {keys[key]: value for key, value in found.items()}
+
+
+def set_many(namespace, values, timeout=None):
+    """Cache ``{parts: value}``"""
+    version = get_version(namespace)
+    cache.set_many({_key(namespace, version, parts): value for parts, value in values.items()}, timeout)
@@ -0,0 +1,39 @@
+# core/checks.py
+"""
+System checks.
+
+With a non-UTC ``SHOP_TIME_ZONE`` every ``Trunc*`` series and local-time
+lookup goes through MySQL's ``CONVERT_TZ``, which returns NULL when the
+server's time zone tables are not loaded - reports would then come back
+empty rather than fail. ``check_time_zone_support`` turns that into an error
+on ``migrate`` and ``check --database``.
+"""
+from django.core.checks import Error, Tags, register
+from django.db import DatabaseError, connections
+
+from .business_calendar import SHOP_TIME_ZONE
+
+
+@register(Tags.database)
+def check_time_zone_support(app_configs=None, databases=None, **kwargs):
+    errors = []
+    if SHOP_TIME_ZONE == 'UTC':
+        return errors
+    for alias in databases or ():
+        connection = connections[alias]
+        if connection.vendor != 'mysql':
+            continue
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT CONVERT_TZ('2000-01-01', 'UTC', %s)", [SHOP_TIME_ZONE])
+                converted = cursor.fetchone()[0]
+        except DatabaseError:
+            continue
+        if converted is None:
+            errors.append(Error(
+                f"MySQL on database '{alias}' cannot convert to SHOP_TIME_ZONE '{SHOP_TIME_ZONE}'.",
+                hint="Load the time zone tables (mysql_tzinfo_to_sql /usr/share/zoneinfo | mysql -u root mysql) "
+                     "or set SHOP_TIME_ZONE=UTC.",
+                id='core.E001',
+            ))
+    return errors
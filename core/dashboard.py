@@ -0,0 +1,117 @@
+# core/dashboard.py
+"""
+Dashboard tiles.
+
+All tiles come from a handful of combined aggregates and are cached for a few
+seconds, so staff auto-refreshing the dashboard do not each hit the database.
+Sale, payment and bill writes drop the cached copy (see the receivers at the
+bottom of ``core/models.py``); stock-only changes show up once it expires.
+"""
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Count, Sum, F, Q
+from django.utils.functional import cached_property
+
+from . import business_calendar
+from . import cache as cache_helper
+
+CACHE_TIMEOUT = getattr(settings, 'DASHBOARD_CACHE_SECONDS', 10)
+LOW_STOCK_PAGE_SIZE = 10
+RECENT_SALES_LIMIT = 10
+
+
+CACHE_NAMESPACE = 'dashboard_metrics'
+
+
+def invalidate_dashboard_cache():
+    cache_helper.bump(CACHE_NAMESPACE)
+
+
+def _compute_metrics(today):
+    from .models import Sale, Product, SupplierBill, ExpiryAlert
+
+    sales = Sale.objects.filter(business_calendar.day_filter('sale_date', today)).aggregate(
+        total_sales=Sum('total_amount'),
+        net_sales=Sum(F('total_amount') - F('returned_amount')),
+        total_transactions=Count('id'),
+    )
+
+    products = Product.objects.aggregate(
+        total_products=Count('id'),
+        low_stock_count=Count('id', filter=Q(current_stock__lte=F('min_stock_level'))),
+    )
+
+    overdue = Q(status='overdue', due_date__lt=business_calendar.day_start(today))
+    bills = SupplierBill.objects.aggregate(
+        total_bills=Count('id'),
+        total_amount=Sum('total_amount'),
+        total_paid=Sum('paid_amount'),
+        total_due=Sum('due_amount'),
+        overdue_count=Count('id', filter=overdue),
+        overdue_amount=Sum('due_amount', filter=overdue),
+    )
+
+    # Expiry alerts written by the nightly refresh_expiry_alerts command
+    expiry = ExpiryAlert.objects.filter(alert_date=today).aggregate(
+        expired_count=Count('id', filter=Q(status='expired')),
+        expired_value=Sum('stock_value', filter=Q(status='expired')),
+        near_expiry_count=Count('id', filter=Q(status='near_expiry')),
+        near_expiry_value=Sum('stock_value', filter=Q(status='near_expiry')),
+    )
+
+    recent_sales = list(
+        Sale.objects.select_related('sold_by').order_by('-sale_date')[:RECENT_SALES_LIMIT]
+    )
+
+    return {
+        'daily_sales': sales['total_sales'] or 0,
+        'daily_net_sales': sales['net_sales'] or 0,
+        'total_transactions': sales['total_transactions'] or 0,
+        'total_products': products['total_products'],
+        'low_stock_count': products['low_stock_count'],
+        'recent_sales': recent_sales,
+        'total_bills': bills['total_bills'] or 0,
+        'total_bill_amount': bills['total_amount'] or 0,
+        'total_paid': bills['total_paid'] or 0,
+        'total_due': bills['total_due'] or 0,
+        'overdue_bills_count': bills['overdue_count'] or 0,
+        'overdue_amount': bills['overdue_amount'] or 0,
+        'expired_alerts_count': expiry['expired_count'],
+        'expired_alerts_value': expiry['expired_value'] or 0,
+        'near_expiry_alerts_count': expiry['near_expiry_count'],
+        'near_expiry_alerts_value': expiry['near_expiry_value'] or 0,
+    }
+
+
+def get_dashboard_metrics(today=None):
+    """Every dashboard tile, cached for ``DASHBOARD_CACHE_SECONDS``"""
+    today = today or business_calendar.today()
+    return cache_helper.get_or_set(
+        CACHE_NAMESPACE, [today.isoformat()], lambda: _compute_metrics(today), CACHE_TIMEOUT,
+    )
+
+
+class _KnownCountPaginator(Paginator):
+    """Paginator that reuses a count already computed with the metrics"""
+
+    def __init__(self, object_list, per_page, count):
+        super().__init__(object_list, per_page)
+        self._known_count = count
+
+    @cached_property
+    def count(self):
+        return self._known_count
+
+
+def low_stock_page(page_number, low_stock_count):
+    """One page of low-stock products, most short of their minimum first"""
+    from .models import Product
+
+    products = Product.objects.filter(
+        current_stock__lte=F('min_stock_level')
+    ).only(
+        'id', 'name', 'sku', 'current_stock', 'min_stock_level'
+    ).annotate(
+        shortfall=F('min_stock_level') - F('current_stock')
+    ).order_by('-shortfall', 'name')
+    return _KnownCountPaginator(products, LOW_STOCK_PAGE_SIZE, low_stock_count).get_page(page_number)
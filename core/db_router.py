@@ -0,0 +1,104 @@
+# core/db_router.py
+"""
+Sends the reads of report views to a read replica.
+
+Views opt in with ``@read_only_db`` (``core.decorators``). Inside such a view
+reads go to the ``REPLICA_DATABASE`` alias, unless:
+
+* no replica is configured, or it is more than ``REPLICA_MAX_LAG`` seconds
+  behind the primary (or replication is stopped / the replica is unreachable);
+* the request is not a GET/HEAD;
+* a transaction is open on the primary;
+* the view has already written something - later reads then stay on the
+  primary so they see that write.
+
+Writes always go to the primary, with or without the decorator.
+"""
+import logging
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+LAG_CACHE_KEY = 'replica_lag'
+LAG_CHECK_SECONDS = 5
+
+_state = ContextVar('replica_state', default=None)
+
+
+def replica_alias():
+    """The configured replica alias, or None when there is none"""
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    return alias if alias in settings.DATABASES else None
+
+
+def replica_lag(alias):
+    """
+    Seconds the replica is behind, 0 for a server that is not replicating
+    (e.g. a standalone copy used for testing), or None when replication is
+    stopped or the replica cannot be reached.
+    """
+    try:
+        with connections[alias].cursor() as cursor:
+            try:
+                cursor.execute("SHOW REPLICA STATUS")
+            except DatabaseError:
+                cursor.execute("SHOW SLAVE STATUS")  # MySQL before 8.0.22
+            row = cursor.fetchone()
+            if row is None:
+                return 0
+            status = dict(zip([column[0] for column in cursor.description], row))
+    except DatabaseError as e:
+        logger.warning("Replica %s unavailable: %s", alias, e)
+        return None
+    return status.get('Seconds_Behind_Source', status.get('Seconds_Behind_Master'))
+
+
+def replica_is_usable(alias):
+    """Lag check, cached for a few seconds so it is not run on every request"""
+    lag = cache.get(LAG_CACHE_KEY)
+    if lag is None:
+        lag = replica_lag(alias)
+        # -1 stands for "unusable" since None means "not cached"
+        lag = -1 if lag is None else lag
+        cache.set(LAG_CACHE_KEY, lag, LAG_CHECK_SECONDS)
+    return 0 <= lag <= getattr(settings, 'REPLICA_MAX_LAG', 30)
+
+
+def enter_read_only(request):
+    """Start routing reads for ``request``; returns a token for ``exit_read_only``"""
+    alias = replica_alias() if request.method in ('GET', 'HEAD') else None
+    if alias and not replica_is_usable(alias):
+        logger.info("Replica %s is lagging or down, reading from primary", alias)
+        alias = None
+    return _state.set({'alias': alias, 'wrote': False})
+
+
+def exit_read_only(token):
+    _state.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if not state or not state['alias'] or state['wrote']:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return state['alias']
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
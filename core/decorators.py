@@ -2,6 +2,16 @@
 from django.http import HttpResponseForbidden
 from django.contrib.auth.decorators import login_required
 from functools import wraps
+from .db_router import enter_read_only, exit_read_only
+
+def is_admin_user(user):
+    return user.is_superuser or hasattr(user, 'userprofile') and user.userprofile.can_access_admin
+
+def can_access_view(user, view_code):
+    """The check of ``view_permission_required``, for views that serve several view codes"""
+    if is_admin_user(user):
+        return True
+    return hasattr(user, 'userprofile') and user.userprofile.has_view_permission(view_code)
 
 def view_permission_required(view_code):
     """
@@ -35,4 +45,18 @@ def admin_required(view_func):
             (hasattr(request.user, 'userprofile') and request.user.userprofile.can_access_admin)):
             return view_func(request, *args, **kwargs)
         return HttpResponseForbidden("Admin access required.")
-    return _wrapped_view
\ No newline at end of file
+    return _wrapped_view
+
+def read_only_db(view_func):
+    """
+    Decorator for report views: their reads go to the read replica when one
+    is configured and up to date (see core/db_router.py)
+    """
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        token = enter_read_only(request)
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            exit_read_only(token)
+    return _wrapped_view
@@ -0,0 +1,123 @@
+# core/dues.py
+"""
+Due payments.
+
+``allocate_due_payment`` is the one place a customer's due payment is
+applied to their invoices, oldest first (FIFO by sale date). It locks the
+customer and their due sales once, works out the whole allocation in
+memory, and writes it with a fixed number of queries whatever the number of
+invoices: one ``bulk_update`` of the sales' paid amount and status, the
+``DuePayment`` with its ``allocated_details``, its ``DueAllocation`` rows,
+and a single recalculation of ``Customer.total_due``.
+
+``bulk_update`` skips ``Sale.save()`` and the post_save receivers, so the
+stored invoice files of the paid sales are invalidated here.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from .invoices import DIGEST_FIELDS, invalidate_invoices
+
+ADVANCE = 'ADVANCE'
+
+
+def _allocate(sales, amount):
+    """
+    Apply ``amount`` to ``sales`` in order; returns ``(allocations, remaining)``
+    with ``(sale, due before, amount applied)`` per sale paid
+    """
+    allocations = []
+    remaining = amount
+    for sale in sales:
+        if remaining <= 0:
+            break
+        due = max(Decimal('0'), sale.total_amount - sale.paid_amount)
+        applied = min(remaining, due)
+        if applied <= 0:
+            continue
+        sale.paid_amount += applied
+        # Same rules as Sale.save()
+        sale.payment_status = 'paid' if sale.paid_amount >= sale.total_amount else 'partial'
+        sale.change_amount = max(Decimal('0'), sale.paid_amount - sale.total_amount)
+        allocations.append((sale, due, applied))
+        remaining -= applied
+    return allocations, remaining
+
+
+def allocate_due_payment(customer, amount, received_by, payment_method='cash', notes='',
+                         reference_number='', allow_advance=False):
+    """
+    Record a due payment of ``amount`` from ``customer`` and apply it to their
+    due invoices, oldest first. Returns the ``DuePayment``. Raises
+    ``ValueError`` for a non-positive amount, or one above the total due
+    unless ``allow_advance`` keeps the rest as an advance.
+    """
+    from .models import Customer, DueAllocation, DuePayment, Sale
+
+    amount = Decimal(amount)
+    if amount <= 0:
+        raise ValueError('Payment amount must be greater than zero')
+
+    with transaction.atomic():
+        # Serialises payments of the same customer
+        customer = Customer.objects.select_for_update().get(pk=customer.pk)
+        sales = list(
+            Sale.objects.select_for_update().filter(
+                customer=customer,
+                payment_status__in=['due', 'partial'],
+            ).order_by('sale_date', 'id').only(
+                'id', 'invoice_number', 'sale_date', 'total_amount', 'paid_amount',
+                'change_amount', 'payment_status', *DIGEST_FIELDS.values(),
+            )
+        )
+        total_due = sum((max(Decimal('0'), sale.total_amount - sale.paid_amount) for sale in sales), Decimal('0'))
+        if not allow_advance:
+            if not total_due:
+                raise ValueError('Customer has no due invoices')
+            if amount > total_due:
+                raise ValueError(f'Payment amount (৳{amount}) exceeds total due (৳{total_due})')
+
+        allocations, remaining = _allocate(sales, amount)
+        allocated_details = [
+            {
+                'invoice_number': sale.invoice_number,
+                'sale_date': sale.sale_date.strftime('%Y-%m-%d'),
+                'due_amount': float(due),
+                'allocated_amount': float(applied),
+                'remaining_due_after': float(due - applied),
+            }
+            for sale, due, applied in allocations
+        ]
+        if remaining > 0:
+            allocated_details.append({
+                'invoice_number': ADVANCE,
+                'sale_date': None,
+                'due_amount': 0,
+                'allocated_amount': float(remaining),
+                'remaining_due_after': 0,
+                'notes': 'Advance payment for future purchases',
+            })
+
+        paid_sales = [sale for sale, _, _ in allocations]
+        Sale.objects.bulk_update(paid_sales, ['paid_amount', 'payment_status', 'change_amount'])
+        invalidate_invoices({
+            sale.pk: {kind: getattr(sale, field) for kind, field in DIGEST_FIELDS.items()}
+            for sale in paid_sales
+        })
+
+        # DuePayment.save() recalculates the customer's total_due
+        due_payment = DuePayment.objects.create(
+            customer=customer,
+            amount=amount,
+            payment_method=payment_method,
+            reference_number=reference_number,
+            notes=notes,
+            received_by=received_by,
+            allocated_details=allocated_details,
+        )
+        DueAllocation.objects.bulk_create([
+            DueAllocation(due_payment=due_payment, sale=sale, amount=applied)
+            for sale, _, applied in allocations
+        ])
+    return due_payment
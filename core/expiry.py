@@ -0,0 +1,244 @@
+# core/expiry.py
+"""
+Expiry classification for product batches.
+
+Every live batch (``current_quantity > 0``) falls in exactly one bucket:
+
+* ``expired``     - expiry date before today
+* ``near_expiry`` - expires within the product's own ``expiry_warning_days``,
+  or within a fixed number of days when a report asks for one
+* ``good``        - everything else, including batches without an expiry date
+
+The bucket is computed in SQL with a ``Case`` expression, so a report can
+filter, count and sum by bucket in a single query. The summary counts are cached
+for the day and dropped whenever a batch changes.
+
+Expired stock is written off in bulk by ``write_off_expired_batches``.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, When, Value, CharField, Count, Sum, F, Q, DecimalField, ExpressionWrapper
+from django.utils import timezone
+
+from . import business_calendar
+from . import cache as cache_helper
+
+EXPIRED = 'expired'
+NEAR_EXPIRY = 'near_expiry'
+GOOD = 'good'
+
+BUCKETS = (EXPIRED, NEAR_EXPIRY, GOOD)
+
+SUMMARY_CACHE_TIMEOUT = 60 * 60 * 24
+SUMMARY_NAMESPACE = 'expiry_summary'
+
+
+def _warning_day_values():
+    """Distinct expiry_warning_days in use - normally a handful of values"""
+    from .models import Product
+    return sorted(set(
+        Product.objects.filter(has_expiry=True).values_list('expiry_warning_days', flat=True)
+    ))
+
+
+def bucket_expression(today=None, warning_days=None, days=None):
+    """
+    ``Case`` expression that yields the expiry bucket of a ProductBatch row,
+    honouring each product's ``expiry_warning_days``, or a window of ``days``
+    for every product when given.
+    """
+    today = today or business_calendar.today()
+    whens = [When(expiry_date__lt=today, then=Value(EXPIRED))]
+    if days is not None:
+        whens.append(When(expiry_date__lte=today + timedelta(days=days), then=Value(NEAR_EXPIRY)))
+    else:
+        if warning_days is None:
+            warning_days = _warning_day_values()
+        for warning in warning_days:
+            whens.append(When(
+                product__expiry_warning_days=warning,
+                expiry_date__lte=today + timedelta(days=warning),
+                then=Value(NEAR_EXPIRY),
+            ))
+    return Case(*whens, default=Value(GOOD), output_field=CharField())
+
+
+def stock_value_expression():
+    return ExpressionWrapper(
+        F('current_quantity') * F('product__cost_price'),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+
+
+def classify_batches(queryset=None, today=None, warning_days=None, days=None):
+    """Annotate live batches with ``expiry_bucket`` and ``stock_value_db``"""
+    from .models import ProductBatch
+
+    if queryset is None:
+        queryset = ProductBatch.objects.all()
+    return queryset.filter(current_quantity__gt=0).annotate(
+        expiry_bucket=bucket_expression(today, warning_days, days),
+        stock_value_db=stock_value_expression(),
+    )
+
+
+def batches_in_bucket(bucket, queryset=None, today=None):
+    """Live batches that fall in ``bucket``"""
+    return classify_batches(queryset, today).filter(expiry_bucket=bucket)
+
+
+def invalidate_expiry_cache():
+    """Drop every cached summary; called whenever batch quantities change"""
+    cache_helper.bump(SUMMARY_NAMESPACE)
+
+
+def get_expiry_summary(today=None, category_id=None, days=None):
+    """
+    Per-bucket batch counts, quantities and stock values in one aggregate query,
+    near expiry meaning within ``days`` when given. Cached for the rest of the day.
+    """
+    today = today or business_calendar.today()
+    return cache_helper.get_or_set(
+        SUMMARY_NAMESPACE, [today.isoformat(), category_id or 'all', 'product' if days is None else days],
+        lambda: _compute_summary(today, category_id, days), SUMMARY_CACHE_TIMEOUT,
+    )
+
+
+def _compute_summary(today, category_id, days=None):
+    from .models import ProductBatch
+
+    queryset = ProductBatch.objects.all()
+    if category_id:
+        queryset = queryset.filter(product__category_id=category_id)
+
+    aggregates = {}
+    for bucket in BUCKETS:
+        in_bucket = Q(expiry_bucket=bucket)
+        aggregates[f'{bucket}_count'] = Count('id', filter=in_bucket)
+        aggregates[f'{bucket}_quantity'] = Sum('current_quantity', filter=in_bucket)
+        aggregates[f'{bucket}_value'] = Sum('stock_value_db', filter=in_bucket)
+
+    totals = classify_batches(queryset, today, days=days).aggregate(**aggregates)
+
+    summary = {'total_batches': 0}
+    for bucket in BUCKETS:
+        summary[bucket] = {
+            'count': totals[f'{bucket}_count'] or 0,
+            'quantity': totals[f'{bucket}_quantity'] or 0,
+            'value': totals[f'{bucket}_value'] or Decimal('0'),
+        }
+        summary['total_batches'] += summary[bucket]['count']
+
+    return summary
+
+
+def product_expiry_quantities(product_ids, today=None):
+    """
+    ``{product_id: {'expired': qty, 'near_expiry': qty}}`` for many products
+    with one grouped query.
+    """
+    from .models import ProductBatch
+
+    rows = classify_batches(
+        ProductBatch.objects.filter(product_id__in=product_ids, product__has_expiry=True), today
+    ).exclude(expiry_bucket=GOOD).values('product_id', 'expiry_bucket').annotate(
+        quantity=Sum('current_quantity')
+    ).order_by()
+
+    result = {pid: {EXPIRED: 0, NEAR_EXPIRY: 0} for pid in product_ids}
+    for row in rows:
+        result[row['product_id']][row['expiry_bucket']] = row['quantity'] or 0
+    return result
+
+
+def build_alerts(today=None):
+    """Unsaved ExpiryAlert rows for every expired or near-expiry batch"""
+    from .models import ExpiryAlert
+
+    today = today or business_calendar.today()
+    batches = classify_batches(today=today).exclude(expiry_bucket=GOOD).values(
+        'id', 'product_id', 'expiry_bucket', 'expiry_date', 'current_quantity', 'stock_value_db'
+    )
+    return [
+        ExpiryAlert(
+            product_id=batch['product_id'],
+            batch_id=batch['id'],
+            status=batch['expiry_bucket'],
+            expiry_date=batch['expiry_date'],
+            days_until_expiry=(batch['expiry_date'] - today).days,
+            quantity=batch['current_quantity'],
+            stock_value=batch['stock_value_db'] or Decimal('0'),
+            alert_date=today,
+        )
+        for batch in batches
+    ]
+
+
+def write_off_expired_batches(user, before=None, batch_ids=None, reason='Expired'):
+    """
+    Write off the full remaining quantity of every batch that expired before
+    ``before`` (default: today), optionally limited to ``batch_ids``.
+
+    The batches are locked and read once; batch quantities and product stock are
+    then changed with one UPDATE each, and the StockAdjustment / StockMovement
+    ledger rows are inserted with ``bulk_create``. Must be called inside a
+    transaction. Returns ``{'batches': n, 'quantity': units, 'products': n}``.
+    """
+    from .models import ProductBatch, Product, StockAdjustment, StockMovement
+
+    before = before or business_calendar.today()
+    queryset = ProductBatch.objects.select_for_update().filter(
+        expiry_date__lt=before, current_quantity__gt=0
+    )
+    if batch_ids is not None:
+        queryset = queryset.filter(id__in=batch_ids)
+
+    batches = list(queryset.order_by('id').values('id', 'product_id', 'batch_number', 'current_quantity'))
+    if not batches:
+        return {'batches': 0, 'quantity': 0, 'products': 0}
+
+    now = timezone.now()
+    adjustments = []
+    movements = []
+    per_product = {}
+    for batch in batches:
+        quantity = batch['current_quantity']
+        per_product[batch['product_id']] = per_product.get(batch['product_id'], 0) + quantity
+        adjustments.append(StockAdjustment(
+            product_id=batch['product_id'],
+            batch_id=batch['id'],
+            adjustment_type='expiry_writeoff',
+            quantity=quantity,
+            reason=f'Expiry write-off: {reason}',
+            adjusted_by=user,
+        ))
+        movements.append(StockMovement(
+            product_id=batch['product_id'],
+            movement_type='adjustment_out',
+            quantity=-quantity,
+            batch_number=batch['batch_number'],
+            notes=f'Expiry write-off: {reason}',
+            movement_date=now,
+        ))
+
+    # queryset.update() bypasses ProductBatch.save(), which would turn a zero
+    # current_quantity back into the original quantity
+    ProductBatch.objects.filter(id__in=[b['id'] for b in batches]).update(current_quantity=0)
+    Product.objects.filter(id__in=per_product).update(
+        current_stock=F('current_stock') - Case(
+            *[When(id=product_id, then=Value(quantity)) for product_id, quantity in per_product.items()],
+            default=Value(0),
+        )
+    )
+    StockAdjustment.objects.bulk_create(adjustments, batch_size=500)
+    StockMovement.objects.bulk_create(movements, batch_size=500)
+
+    transaction.on_commit(invalidate_expiry_cache)
+
+    return {
+        'batches': len(batches),
+        'quantity': sum(per_product.values()),
+        'products': len(per_product),
+    }
@@ -4,6 +4,7 @@ from datetime import date
 from datetime import timedelta
 from django.core.exceptions import ValidationError
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
+from . import business_calendar
 from .models import (
     Payment, Product, StockAdjustment, Sale, PurchaseOrder, 
     SupplierBill, UserProfile, ProductBatch, PurchaseReturn, 
@@ -346,7 +347,7 @@ class PurchaseOrderForm(forms.ModelForm):
             # normalize to date if datetime
             if hasattr(expected_date, "date"):
                 expected_date = expected_date.date()
-            if expected_date < timezone.now().date():
+            if expected_date < business_calendar.today():
                 raise forms.ValidationError("Expected date cannot be in the past.")
         return expected_date
 
@@ -644,7 +645,7 @@ class PaymentForm(forms.ModelForm):
         
         # Set initial payment date to today if not provided
         if not self.instance.pk and 'payment_date' not in self.data:
-            self.fields['payment_date'].initial = timezone.now().date()
+            self.fields['payment_date'].initial = business_calendar.today()
     
     def clean_amount(self):
         amount = self.cleaned_data.get('amount')
@@ -663,7 +664,7 @@ class PaymentForm(forms.ModelForm):
         payment_date = self.cleaned_data.get('payment_date')
         if payment_date:
             # Ensure both are date objects for comparison
-            today = timezone.now().date()
+            today = business_calendar.today()
             
             # If payment_date is a datetime, extract the date part
             if hasattr(payment_date, 'date'):
@@ -748,7 +749,7 @@ class BatchCreationForm(forms.Form):
                     label=f'Expiry Date for {product.name}',
                     required=True,
                     widget=forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
-                    initial=timezone.now().date() + timedelta(days=365)  # Default 1 year
+                    initial=business_calendar.today() + timedelta(days=365)  # Default 1 year
                 )
             else:
                 self.fields[f'expiry_date_{item.id}'] = forms.DateField(
@@ -771,7 +772,7 @@ class BatchCreationForm(forms.Form):
             batch = ProductBatch.objects.create(
                 product=item.product,
                 batch_number=batch_number,
-                manufacture_date=timezone.now().date(),
+                manufacture_date=business_calendar.today(),
                 expiry_date=expiry_date,
                 quantity=item.quantity,
                 current_quantity=item.quantity,
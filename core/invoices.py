@@ -0,0 +1,286 @@
+# core/invoices.py
+"""
+Stored invoice PDFs and thermal-printer receipts.
+
+The PDF and the plain-text receipt of a sale are rendered once - lazily on the
+first request, or right after checkout with ``PRERENDER_INVOICES`` - and kept
+on disk under ``INVOICE_STORAGE_DIR``, content-addressed by their SHA-256
+(``ab/abcdef....pdf``). The digests are stored on the Sale, so a reprint is
+one query plus a file read, and the digest doubles as the ETag.
+
+Anything that changes what the invoice shows - a save of the sale (payments,
+returned amount) or a return against it - clears the digests and deletes the
+files (see the receivers at the bottom of ``core/models.py``); the next
+request renders them again.
+
+With ``INVOICE_SENDFILE_HEADER`` set (``X-Sendfile`` for Apache,
+``X-Accel-Redirect`` for nginx) the web server sends the file itself.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.http import FileResponse, HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, Spacer, Table
+
+from .pdf_utils import format_currency, render_story, safe_text, styles, table_style
+
+logger = logging.getLogger(__name__)
+
+STORAGE_DIR = getattr(settings, 'INVOICE_STORAGE_DIR', os.path.join(settings.BASE_DIR, 'invoices'))
+SENDFILE_HEADER = getattr(settings, 'INVOICE_SENDFILE_HEADER', None)
+SENDFILE_URL = getattr(settings, 'INVOICE_SENDFILE_URL', '/protected/invoices/')
+PRERENDER = getattr(settings, 'PRERENDER_INVOICES', False)
+SHOP_NAME = getattr(settings, 'SHOP_NAME', 'Shop Management System')
+RECEIPT_WIDTH = getattr(settings, 'RECEIPT_WIDTH', 42)  # characters per line: 32 for 58mm, 42/48 for 80mm paper
+
+PDF = 'pdf'
+RECEIPT = 'txt'
+CONTENT_TYPES = {PDF: 'application/pdf', RECEIPT: 'text/plain; charset=utf-8'}
+DIGEST_FIELDS = {PDF: 'invoice_pdf_sha256', RECEIPT: 'receipt_sha256'}
+
+
+def _relative_path(digest, kind):
+    return os.path.join(digest[:2], f'{digest}.{kind}')
+
+
+def stored_path(digest, kind):
+    return os.path.join(STORAGE_DIR, _relative_path(digest, kind))
+
+
+def _store(content, kind):
+    """Write ``content`` under its SHA-256 unless already there; returns the digest"""
+    digest = hashlib.sha256(content).hexdigest()
+    path = stored_path(digest, kind)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so a reader never sees a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return digest
+
+
+def _items(sale):
+    """``(name, sku, quantity, unit_price, total_price)`` for each sale item"""
+    return list(sale.items.order_by('id').values_list(
+        'product__name', 'product__sku', 'quantity', 'unit_price', 'total_price',
+    ))
+
+
+def _totals(sale):
+    """``(label, amount)`` lines under the items, as shown on both documents"""
+    lines = [
+        ('Subtotal', sale.subtotal),
+        ('Discount', -sale.discount_amount),
+        ('Tax', sale.tax_amount),
+        ('Total', sale.total_amount),
+        ('Paid', sale.paid_amount),
+        ('Change', sale.change_amount),
+    ]
+    if sale.returned_amount:
+        lines.append(('Returned', -sale.returned_amount))
+    lines.append(('Due', max(Decimal('0'), sale.total_amount - sale.paid_amount)))
+    return lines
+
+
+def render_invoice_pdf(sale, items):
+    style = styles()
+    sold_at = timezone.localtime(sale.sale_date)
+    cashier = sale.sold_by.get_full_name() or sale.sold_by.username
+
+    story = [
+        Paragraph(SHOP_NAME, style['company']),
+        Paragraph(f"INVOICE #{sale.invoice_number}", style['title']),
+    ]
+
+    details = Table([
+        [Paragraph("<b>Bill To:</b>", style['info']), Paragraph(safe_text(sale.customer_name or 'Walk-in Customer', 60), style['info']),
+         Paragraph("<b>Date:</b>", style['info']), Paragraph(sold_at.strftime('%b %d, %Y %I:%M %p'), style['info'])],
+        [Paragraph("<b>Phone:</b>", style['info']), Paragraph(sale.customer_phone or '-', style['info']),
+         Paragraph("<b>Sold By:</b>", style['info']), Paragraph(safe_text(cashier, 40), style['info'])],
+    ], colWidths=[0.9*inch, 2.6*inch, 0.9*inch, 2.6*inch])
+    details.setStyle(table_style('details'))
+    story += [details, Spacer(1, 12)]
+
+    rows = [('#', 'Item', 'Qty', 'Unit Price', 'Amount')]
+    for sn, (name, sku, quantity, unit_price, total_price) in enumerate(items, 1):
+        rows.append((
+            str(sn),
+            Paragraph(f"{safe_text(name, 60)}<br/><font size=7>SKU: {sku}</font>", style['normal']),
+            str(quantity),
+            format_currency(unit_price),
+            format_currency(total_price),
+        ))
+    table = Table(rows, colWidths=[0.4*inch, 3.6*inch, 0.7*inch, 1.1*inch, 1.2*inch], repeatRows=1)
+    table.setStyle(table_style('invoice'))
+    story += [table, Spacer(1, 12)]
+
+    totals = Table(
+        [(label, format_currency(amount)) for label, amount in _totals(sale)],
+        colWidths=[1.5*inch, 1.3*inch], hAlign='RIGHT',
+    )
+    totals.setStyle(table_style('invoice_totals'))
+    story += [
+        totals,
+        Spacer(1, 12),
+        Paragraph(f"Payment status: {sale.get_payment_status_display()}", style['normal']),
+    ]
+
+    return render_story(story, SHOP_NAME, f"Invoice {sale.invoice_number}", invariant=True)
+
+
+def render_receipt(sale, items, width=None):
+    """
+    Fixed-width receipt for an ESC/POS thermal printer's text mode. Amounts
+    have no currency sign since the printers' code pages lack it.
+    """
+    width = width or RECEIPT_WIDTH
+    rule = '-' * width
+    sold_at = timezone.localtime(sale.sale_date)
+
+    def pair(left, right):
+        left = left[:width - len(right) - 1]
+        return f"{left}{right:>{width - len(left)}}"
+
+    lines = [
+        SHOP_NAME[:width].center(width).rstrip(),
+        rule,
+        f"Invoice: {sale.invoice_number}",
+        f"Date: {sold_at:%Y-%m-%d %H:%M}",
+        f"Cashier: {sale.sold_by.username}"[:width],
+        f"Customer: {sale.customer_name or 'Walk-in Customer'}"[:width],
+    ]
+    if sale.customer_phone:
+        lines.append(f"Phone: {sale.customer_phone}"[:width])
+    lines.append(rule)
+
+    for name, sku, quantity, unit_price, total_price in items:
+        lines.append(str(name)[:width])
+        lines.append(pair(f"  {quantity} x {unit_price:,.2f}", f"{total_price:,.2f}"))
+    lines.append(rule)
+
+    for label, amount in _totals(sale):
+        lines.append(pair(label, f"{amount:,.2f}"))
+    lines += [
+        rule,
+        'Thank you for shopping!'.center(width).rstrip(),
+        '',
+    ]
+    return '\n'.join(lines).encode('utf-8')
+
+
+def render_invoice_files(sale_id):
+    """
+    Render and store the PDF and receipt of a sale; returns
+    ``{kind: digest}``. The digests are only saved if the sale did not
+    change while rendering.
+    """
+    from .models import Sale
+
+    sale = Sale.objects.select_related('sold_by').get(pk=sale_id)
+    items = _items(sale)
+    digests = {
+        PDF: _store(render_invoice_pdf(sale, items), PDF),
+        RECEIPT: _store(render_receipt(sale, items), RECEIPT),
+    }
+    Sale.objects.filter(
+        pk=sale.pk,
+        paid_amount=sale.paid_amount,
+        returned_amount=sale.returned_amount,
+        total_amount=sale.total_amount,
+    ).update(**{DIGEST_FIELDS[kind]: digest for kind, digest in digests.items()})
+    return digests
+
+
+def prerender_after_commit(sale_id):
+    """Render a new sale's invoice files once its transaction commits"""
+    def render():
+        try:
+            render_invoice_files(sale_id)
+        except Exception:
+            # The files are rendered on first request instead
+            logger.exception("Could not pre-render invoice for sale %s", sale_id)
+
+    if PRERENDER:
+        transaction.on_commit(render)
+
+
+def invalidate_invoice(sale_id, digests=None):
+    """
+    Forget the stored files of a sale and delete them after commit.
+    ``digests`` are the current digests when the caller already has them.
+    """
+    from .models import Sale
+
+    if digests is None:
+        digests = Sale.objects.filter(pk=sale_id).values_list(*DIGEST_FIELDS.values()).first() or ()
+        digests = dict(zip(DIGEST_FIELDS, digests))
+    invalidate_invoices({sale_id: digests})
+
+
+def invalidate_invoices(digests_by_sale):
+    """
+    ``invalidate_invoice`` for many sales with one update:
+    ``digests_by_sale`` maps sale ids to their current ``{kind: digest}``
+    """
+    from .models import Sale
+
+    stored = {
+        sale_id: {kind: digest for kind, digest in digests.items() if digest}
+        for sale_id, digests in digests_by_sale.items()
+    }
+    stored = {sale_id: digests for sale_id, digests in stored.items() if digests}
+    if not stored:
+        return
+
+    Sale.objects.filter(pk__in=stored).update(**{field: '' for field in DIGEST_FIELDS.values()})
+
+    def remove():
+        for digests in stored.values():
+            for kind, digest in digests.items():
+                try:
+                    os.remove(stored_path(digest, kind))
+                except FileNotFoundError:
+                    pass
+
+    transaction.on_commit(remove)
+
+
+def invoice_file_response(request, sale, kind):
+    """
+    The stored PDF (``kind='pdf'``) or receipt (``'txt'``) of ``sale``,
+    rendered first if needed. Answers ``If-None-Match`` with 304.
+    """
+    digest = getattr(sale, DIGEST_FIELDS[kind])
+    if not digest or not os.path.exists(stored_path(digest, kind)):
+        digest = render_invoice_files(sale.pk)[kind]
+
+    etag = f'"{digest}"'
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        filename = f'invoice_{sale.invoice_number}.{kind}'
+        if SENDFILE_HEADER:
+            response = HttpResponse(content_type=CONTENT_TYPES[kind])
+            response[SENDFILE_HEADER] = SENDFILE_URL + _relative_path(digest, kind).replace(os.sep, '/')
+            response['Content-Disposition'] = f'inline; filename="{filename}"'
+        else:
+            response = FileResponse(
+                open(stored_path(digest, kind), 'rb'), filename=filename, content_type=CONTENT_TYPES[kind],
+            )
+    response['ETag'] = etag
+    # Always revalidate: the same URL serves a new file after a return
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
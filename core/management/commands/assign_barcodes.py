@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from core.models import Product
+from core.barcodes import allocate_barcodes
+
+class Command(BaseCommand):
+    help = 'Assign barcodes to all products that do not have one'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scheme',
+            choices=['sku', 'ean13'],
+            default='sku',
+            help='sku: BC-<sku> codes, ean13: numeric in-store EAN-13 codes',
+        )
+        parser.add_argument(
+            '--prefix',
+            help='EAN-13 prefix to allocate from (default: BARCODE_EAN13_PREFIX setting or 20)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be assigned without saving',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            products = list(
+                Product.objects.select_for_update().filter(Q(barcode__isnull=True) | Q(barcode=''))
+            )
+
+            if not products:
+                self.stdout.write(self.style.SUCCESS('All products already have barcodes'))
+                return
+
+            for product in products:
+                product.barcode = None
+
+            assigned = allocate_barcodes(products, scheme=options['scheme'], prefix=options.get('prefix'))
+
+            for product in assigned:
+                self.stdout.write(f'{product.sku}: {product.barcode}')
+
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING('DRY RUN - No changes will be made'))
+                transaction.set_rollback(True)
+                return
+
+            Product.objects.bulk_update(assigned, ['barcode'], batch_size=500)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Successfully assigned {len(assigned)} barcodes')
+        )
@@ -0,0 +1,60 @@
+# management/commands/backfill_due_allocations.py
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.models import DueAllocation, DuePayment, Sale
+
+
+class Command(BaseCommand):
+    help = (
+        'Create DueAllocation rows for due payments recorded before allocations were '
+        'stored, from their allocated_details. Customer statements need them to avoid '
+        'counting a due payment twice.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report without writing')
+
+    def handle(self, *args, **options):
+        payments = DuePayment.objects.filter(allocations__isnull=True).order_by('id')
+        created = 0
+        unresolved = []
+
+        for payment in payments.iterator():
+            details = payment.allocated_details if isinstance(payment.allocated_details, list) else []
+            amounts = {}
+            for detail in details:
+                invoice_number = detail.get('invoice_number')
+                try:
+                    amount = Decimal(str(detail.get('allocated_amount', 0)))
+                except InvalidOperation:
+                    continue
+                # Advances are not applied to an invoice
+                if invoice_number and invoice_number != 'ADVANCE' and amount > 0:
+                    amounts[invoice_number] = amounts.get(invoice_number, Decimal('0')) + amount
+
+            sales = dict(Sale.objects.filter(
+                customer_id=payment.customer_id, invoice_number__in=amounts,
+            ).values_list('invoice_number', 'id'))
+            allocations = [
+                DueAllocation(due_payment=payment, sale_id=sales[invoice_number], amount=amount)
+                for invoice_number, amount in amounts.items()
+                if invoice_number in sales
+            ]
+            if not allocations:
+                unresolved.append(payment.id)
+                continue
+            if not options['dry_run']:
+                with transaction.atomic():
+                    DueAllocation.objects.bulk_create(allocations)
+            created += len(allocations)
+
+        prefix = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(f'{prefix} {created} allocations'))
+        if unresolved:
+            self.stdout.write(self.style.WARNING(
+                f'{len(unresolved)} due payments have no usable allocation details: '
+                + ', '.join(str(payment_id) for payment_id in unresolved)
+            ))
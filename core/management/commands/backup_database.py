@@ -1,75 +1,67 @@
 # management/commands/backup_database.py
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
-from django.db import connection
-import os
-from datetime import datetime
+from core.backup import COMPRESSIONS, BackupError, run_backup
 
 class Command(BaseCommand):
-    help = 'Backup MySQL database using pure Python'
+    help = 'Backup MySQL database to a compressed, consistent snapshot with a manifest'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output-dir',
+            default=getattr(settings, 'BACKUP_DIR', 'backups'),
+            help='Directory the backup folder is created in (default: BACKUP_DIR setting or ./backups)',
+        )
+        parser.add_argument(
+            '--compress',
+            choices=COMPRESSIONS,
+            default='gzip',
+            help='Compression for the table files (default: gzip)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of tables dumped in parallel (default: 1)',
+        )
+        parser.add_argument(
+            '--tables',
+            nargs='+',
+            help='Only back up these tables',
+        )
+        parser.add_argument(
+            '--incremental',
+            action='store_true',
+            help='Export only rows changed since the previous backup in the output directory',
+        )
+        parser.add_argument(
+            '--full-every',
+            type=int,
+            default=24,
+            help='With --incremental, take a new full base after this many increments (default: 24)',
+        )
 
     def handle(self, *args, **options):
-        db_settings = settings.DATABASES['default']
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        backup_file = f'db_backup_{timestamp}.sql'
-        
+        def progress(table, entry):
+            self.stdout.write(f"  {table}: {entry['rows']} rows")
+
         try:
-            with connection.cursor() as cursor:
-                # Get all tables
-                cursor.execute("SHOW TABLES")
-                tables = [row[0] for row in cursor.fetchall()]
-                
-                backup_content = []
-                backup_content.append("-- MySQL Database Backup")
-                backup_content.append(f"-- Generated: {timestamp}")
-                backup_content.append(f"-- Database: {db_settings['NAME']}")
-                backup_content.append("SET FOREIGN_KEY_CHECKS=0;\n")
-                
-                for table in tables:
-                    # Get table structure
-                    cursor.execute(f"SHOW CREATE TABLE `{table}`")
-                    create_table_sql = cursor.fetchone()[1]
-                    backup_content.append(f"\n-- Table structure for table `{table}`")
-                    backup_content.append(f"DROP TABLE IF EXISTS `{table}`;")
-                    backup_content.append(create_table_sql + ";")
-                    
-                    # Get table data
-                    cursor.execute(f"SELECT * FROM `{table}`")
-                    rows = cursor.fetchall()
-                    
-                    if rows:
-                        backup_content.append(f"\n-- Dumping data for table `{table}`")
-                        
-                        # Get column names
-                        cursor.execute(f"DESCRIBE `{table}`")
-                        columns = [col[0] for col in cursor.fetchall()]
-                        
-                        for row in rows:
-                            values = []
-                            for value in row:
-                                if value is None:
-                                    values.append("NULL")
-                                elif isinstance(value, (int, float)):
-                                    values.append(str(value))
-                                else:
-                                    # Escape special characters
-                                    value_str = str(value).replace("'", "''").replace("\\", "\\\\")
-                                    values.append(f"'{value_str}'")
-                            
-                            insert_sql = f"INSERT INTO `{table}` ({', '.join([f'`{col}`' for col in columns])}) VALUES ({', '.join(values)});"
-                            backup_content.append(insert_sql)
-                
-                backup_content.append("\nSET FOREIGN_KEY_CHECKS=1;")
-                
-                # Write to file
-                with open(backup_file, 'w', encoding='utf-8') as f:
-                    f.write('\n'.join(backup_content))
-                
-                self.stdout.write(
-                    self.style.SUCCESS(f'Backup created successfully: {backup_file}')
-                )
-                
-        except Exception as e:
-            self.stdout.write(
-                self.style.ERROR(f'Backup failed: {e}')
-            )
\ No newline at end of file
+            directory, manifest = run_backup(
+                options['output_dir'],
+                compression=options['compress'],
+                workers=max(1, options['workers']),
+                tables=options['tables'],
+                progress=progress,
+                incremental=options['incremental'],
+                full_every=options['full_every'],
+            )
+        except (BackupError, OSError) as e:
+            raise CommandError(f'Backup failed: {e}')
+
+        total_rows = sum(entry['rows'] for entry in manifest['tables'].values())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{manifest['type'].capitalize()} backup created successfully: {directory} "
+                f"({len(manifest['tables'])} tables, {total_rows} rows)"
+            )
+        )
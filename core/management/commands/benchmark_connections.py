@@ -0,0 +1,113 @@
+# management/commands/benchmark_connections.py
+import statistics
+import time
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from core.models import Product
+
+class Command(BaseCommand):
+    help = 'Compare request latency on the scanner and POS endpoints with and without persistent DB connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=200,
+            help='Requests per endpoint and setting (default: 200)',
+        )
+        parser.add_argument(
+            '--conn-max-age',
+            type=int,
+            nargs='+',
+            help='CONN_MAX_AGE values to compare (default: 0 and the configured value)',
+        )
+        parser.add_argument(
+            '--user',
+            help='Username the requests are made as (default: first superuser)',
+        )
+
+    def handle(self, *args, **options):
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('No user to run the requests as')
+
+        product = Product.objects.exclude(barcode__isnull=True).exclude(barcode='').first()
+        if product is None:
+            raise CommandError('Benchmark needs at least one product with a barcode')
+
+        endpoints = [
+            ('scanner', '/api/search-product/', f'barcode={product.barcode}'),
+            ('pos', '/pos/', ''),
+        ]
+
+        # A session cookie from the test client; the requests themselves go
+        # through the real WSGI handler so request_started/request_finished
+        # close or keep the connection exactly as in production
+        client = Client()
+        client.force_login(user)
+        cookie = '; '.join(f'{morsel.key}={morsel.value}' for morsel in client.cookies.values())
+
+        configured = connection.settings_dict['CONN_MAX_AGE']
+        max_ages = options['conn_max_age'] or ([0, configured] if configured != 0 else [0])
+
+        handler = WSGIHandler()
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        connection_created.connect(count_connection)
+        try:
+            for max_age in max_ages:
+                connection.close()
+                connection.settings_dict['CONN_MAX_AGE'] = max_age
+                for name, path, query in endpoints:
+                    opened.clear()
+                    timings = []
+                    for _ in range(options['requests']):
+                        started = time.perf_counter()
+                        status = self._request(handler, path, query, cookie)
+                        timings.append((time.perf_counter() - started) * 1000)
+                        if status != 200:
+                            raise CommandError(f'{path} returned {status}')
+                    timings.sort()
+                    self.stdout.write(
+                        f"CONN_MAX_AGE={max_age!s:>5}  {name:<8} "
+                        f"mean {statistics.mean(timings):7.2f} ms  "
+                        f"p50 {timings[len(timings) // 2]:7.2f} ms  "
+                        f"p95 {timings[int(len(timings) * 0.95) - 1]:7.2f} ms  "
+                        f"connections opened {len(opened)}"
+                    )
+        finally:
+            connection_created.disconnect(count_connection)
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = configured
+
+    def _request(self, handler, path, query, cookie):
+        status = []
+        environ = {
+            'REQUEST_METHOD': 'GET',
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'SERVER_NAME': (settings.ALLOWED_HOSTS or ['localhost'])[0].lstrip('.').replace('*', 'localhost'),
+            'SERVER_PORT': '443',
+            'HTTP_COOKIE': cookie,
+            'wsgi.url_scheme': 'https',
+            'wsgi.input': BytesIO(),
+            'wsgi.errors': BytesIO(),
+        }
+        response = handler(environ, lambda code, headers, exc_info=None: status.append(int(code.split()[0])))
+        for _ in response:
+            pass
+        response.close()
+        return status[0]
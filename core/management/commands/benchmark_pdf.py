@@ -0,0 +1,104 @@
+# management/commands/benchmark_pdf.py
+import random
+import resource
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core import business_calendar
+from core.pdf_utils import write_sales_report_pdf
+
+class Command(BaseCommand):
+    help = 'Render the sales report PDF from synthetic rows and report render time, page count and memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=10000,
+            help='Number of sales in the report (default: 10000)',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['detailed', 'summary'],
+            default='detailed',
+            help='Report format (default: detailed)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Number of renders; the first includes loading fonts and styles (default: 3)',
+        )
+        parser.add_argument(
+            '--output',
+            help='Also write the last PDF to this file',
+        )
+
+    def handle(self, *args, **options):
+        context = {
+            'report_type': 'daily',
+            'date_range': 'this_month',
+            'report_format': options['format'],
+            'today': business_calendar.today(),
+            'request_user': 'benchmark',
+            'total_transactions': options['rows'],
+        }
+
+        for run in range(1, max(1, options['repeat']) + 1):
+            with tempfile.TemporaryFile() as output:
+                started = time.perf_counter()
+                # Rows are generated lazily, like the database iterator the view uses
+                rows = self._rows(options['rows'])
+                if options['format'] == 'summary':
+                    rows = self._day_rows(rows)
+                stats = write_sales_report_pdf(context, output, rows)
+                total = time.perf_counter() - started
+                size = output.tell()
+                if options['output'] and run == options['repeat']:
+                    output.seek(0)
+                    with open(options['output'], 'wb') as f:
+                        f.write(output.read())
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            self.stdout.write(
+                f"run {run}: {options['rows']} rows -> {stats.pages} pages, {size / 1024:.0f} KiB, "
+                f"render {stats.seconds:.2f}s, total {total:.2f}s, peak RSS {peak:.0f} MiB"
+            )
+
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+
+    def _rows(self, count):
+        """``SALE_ROW_FIELDS`` tuples spread over 30 days"""
+        rng = random.Random(42)
+        now = timezone.now()
+        users = ['admin', 'cashier1', 'cashier2']
+        for index in range(count):
+            total = Decimal(rng.randint(100, 500000)) / 100
+            discount = (total * rng.choice([0, 0, 5, 10]) / 100).quantize(Decimal('0.01'))
+            tax = Decimal('0.00')
+            returned = total if rng.random() < 0.02 else Decimal('0.00')
+            paid = total if rng.random() < 0.9 else (total / 2).quantize(Decimal('0.01'))
+            yield (
+                now - timedelta(minutes=index * 30 * 24 * 60 // max(count, 1)),
+                f'{index:09d}',
+                f'Customer {index % 500}',
+                total, discount, tax, total - returned, max(total - paid, 0), paid,
+                rng.choice(users),
+            )
+
+    def _day_rows(self, rows):
+        """The ``SALE_ROW_FIELDS`` tuples summed into ``SALE_DAY_FIELDS`` tuples, as the database would"""
+        days = {}
+        for sale_date, _, _, total, discount, tax, net, due, paid, sold_by in rows:
+            day = days.setdefault(sale_date.date(), [Decimal('0')] * 7 + [set()])
+            for index, amount in enumerate((total, discount, tax, net, due, paid, total - net)):
+                day[index] += amount
+            day[7].add(sold_by)
+        return [
+            (date, *day[:7], len(day[7]), min(day[7]), max(day[7]))
+            for date, day in sorted(days.items())
+        ]
@@ -1,5 +1,5 @@
 from django.core.management.base import BaseCommand
-from django.utils import timezone
+from core import business_calendar
 from core.models import SupplierBill
 from django.db.models import Q
 import datetime
@@ -17,7 +17,7 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         
-        today = timezone.now().date()
+        today = business_calendar.today()
         
         # Find bills that are due and should be marked as overdue
         due_bills = SupplierBill.objects.filter(
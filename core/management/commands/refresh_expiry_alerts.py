@@ -0,0 +1,48 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core import business_calendar
+from core.models import ExpiryAlert
+from core.expiry import EXPIRED, NEAR_EXPIRY, build_alerts, invalidate_expiry_cache
+
+class Command(BaseCommand):
+    help = 'Rebuild today\'s expiry alerts (run nightly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=90,
+            help='Delete alerts older than this many days (default: 90)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be created without saving',
+        )
+
+    def handle(self, *args, **options):
+        today = business_calendar.today()
+        alerts = build_alerts(today)
+
+        expired = sum(1 for alert in alerts if alert.status == EXPIRED)
+        near_expiry = sum(1 for alert in alerts if alert.status == NEAR_EXPIRY)
+        self.stdout.write(f'{expired} expired and {near_expiry} near expiry batches')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('DRY RUN - No changes will be made'))
+            return
+
+        with transaction.atomic():
+            ExpiryAlert.objects.filter(alert_date=today).delete()
+            ExpiryAlert.objects.bulk_create(alerts, batch_size=500)
+            purged, _ = ExpiryAlert.objects.filter(
+                alert_date__lt=today - timedelta(days=options['keep_days'])
+            ).delete()
+
+        # Day rollover moves batches between buckets without any batch being saved
+        invalidate_expiry_cache()
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Created {len(alerts)} expiry alerts, purged {purged} old alerts')
+        )
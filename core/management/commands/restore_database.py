@@ -0,0 +1,88 @@
+# management/commands/restore_database.py
+import os
+from django.core.management.base import BaseCommand, CommandError
+from core.backup import BackupError, backup_chain
+from core.restore import restore_backup
+
+class Command(BaseCommand):
+    help = 'Restore a backup made by backup_database, or an old db_backup_*.sql file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'backup',
+            help='Backup directory (an increment is replayed on top of its base) or a .sql/.sql.gz dump file',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Worker processes loading tables in parallel (default: number of CPUs)',
+        )
+        parser.add_argument(
+            '--no-defer-indexes',
+            action='store_false',
+            dest='defer_indexes',
+            help='Create secondary indexes and foreign keys before loading rows',
+        )
+        parser.add_argument(
+            '--skip-verify',
+            action='store_false',
+            dest='verify',
+            help='Do not check checksums and row counts against the manifest',
+        )
+        parser.add_argument(
+            '--noinput', '--no-input',
+            action='store_false',
+            dest='interactive',
+            help='Do not ask for confirmation',
+        )
+
+    def handle(self, *args, **options):
+        path = options['backup']
+        if not os.path.exists(path):
+            raise CommandError(f'Restore failed: {path} does not exist')
+
+        if os.path.isdir(path):
+            try:
+                chain = backup_chain(path)
+            except (BackupError, OSError) as e:
+                raise CommandError(f'Restore failed: {e}')
+            self.stdout.write('Backups to restore, in order:')
+            for directory, manifest in chain:
+                total_rows = sum(entry['rows'] for entry in manifest['tables'].values())
+                self.stdout.write(
+                    f"  {os.path.basename(directory)} ({manifest['type']}, "
+                    f"{len(manifest['tables'])} tables, {total_rows} rows)"
+                )
+        else:
+            self.stdout.write(f'Restoring dump file {path} (single process, no manifest to verify)')
+
+        if options['interactive']:
+            confirm = input(
+                'This will DROP and recreate every table in the backup. Type "yes" to continue: '
+            )
+            if confirm != 'yes':
+                self.stdout.write(self.style.WARNING('Restore cancelled'))
+                return
+
+        def progress(table, rows, expected, seconds):
+            expected = f'/{expected}' if expected is not None else ''
+            self.stdout.write(f'  {table}: {rows}{expected} rows in {seconds:.1f}s')
+
+        try:
+            problems = restore_backup(
+                path,
+                workers=max(1, options['workers']),
+                defer_indexes=options['defer_indexes'],
+                verify=options['verify'],
+                progress=progress,
+            )
+        except (BackupError, OSError) as e:
+            raise CommandError(f'Restore failed: {e}')
+
+        if problems:
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(f'  {problem}'))
+            raise CommandError(f'Restore finished but {len(problems)} table(s) do not match the manifest')
+
+        self.stdout.write(self.style.SUCCESS('Restore completed successfully'))
@@ -0,0 +1,60 @@
+from datetime import datetime
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from core import business_calendar
+from core.expiry import write_off_expired_batches
+
+class Command(BaseCommand):
+    help = 'Write off all stock in batches that expired before a date'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before',
+            help='Write off batches expiring before this date, YYYY-MM-DD (default: today)',
+        )
+        parser.add_argument(
+            '--user',
+            help='Username recorded on the stock adjustments (default: first superuser)',
+        )
+        parser.add_argument(
+            '--reason',
+            default='Expired',
+            help='Reason recorded on the stock adjustments',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show what would be written off without saving',
+        )
+
+    def handle(self, *args, **options):
+        if options['before']:
+            try:
+                before = datetime.strptime(options['before'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('--before must be a date in YYYY-MM-DD format')
+        else:
+            before = business_calendar.today()
+
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('id').first()
+        if user is None:
+            raise CommandError('No user found to record the write-off against')
+
+        with transaction.atomic():
+            result = write_off_expired_batches(user, before=before, reason=options['reason'])
+
+            self.stdout.write(
+                f"{result['batches']} batches, {result['quantity']} units, "
+                f"{result['products']} products expiring before {before}"
+            )
+
+            if options['dry_run']:
+                self.stdout.write(self.style.WARNING('DRY RUN - No changes will be made'))
+                transaction.set_rollback(True)
+                return
+
+        self.stdout.write(self.style.SUCCESS(f"Written off {result['batches']} expired batches"))
@@ -1,33 +1,99 @@
 # core/middleware.py
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
 from django.http import HttpResponseForbidden
-from django.urls import reverse
 
 class AdminAccessMiddleware:
+    """
+    Denies the Django admin to users without admin access. Runs natively under
+    both WSGI and ASGI; under ASGI only /admin/ requests touch the database
+    from the sync thread.
+    """
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        response = self.get_response(request)
-        return response
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.path.startswith('/admin/'):
+            denied = self.check_admin_access(request.user)
+            if denied:
+                return denied
+        return self.get_response(request)
 
-    def process_view(self, request, view_func, view_args, view_kwargs):
-        # Check if the request is for admin URLs
+    async def __acall__(self, request):
         if request.path.startswith('/admin/'):
-            # Allow superusers
-            if request.user.is_superuser:
-                return None
-                
-            # Check if user has admin access through profile
-            if hasattr(request.user, 'userprofile'):
-                if request.user.userprofile.can_access_admin:
-                    return None
+            user = await request.auser()
+            denied = await sync_to_async(self.check_admin_access)(user)
+            if denied:
+                return denied
+        return await self.get_response(request)
+
+    def check_admin_access(self, user):
+        """None if ``user`` may use the admin, else the response to send"""
+        # Allow superusers
+        if user.is_superuser:
+            return None
             
-            # Redirect or deny access for non-admin users
-            return HttpResponseForbidden("""
-                <h1>Access Denied</h1>
-                <p>You don't have permission to access the Django admin interface.</p>
-                <p>Please contact your system administrator if you need access.</p>
-                <a href="/">Return to Dashboard</a>
-            """)
+        # Check if user has admin access through profile
+        if hasattr(user, 'userprofile'):
+            if user.userprofile.can_access_admin:
+                return None
         
-        return None
\ No newline at end of file
+        # Redirect or deny access for non-admin users
+        return HttpResponseForbidden("""
+            <h1>Access Denied</h1>
+            <p>You don't have permission to access the Django admin interface.</p>
+            <p>Please contact your system administrator if you need access.</p>
+            <a href="/">Return to Dashboard</a>
+        """)
+
+
+class SessionTouchMiddleware:
+    """
+    Keeps active sessions from expiring without writing the session on every
+    request (SESSION_SAVE_EVERY_REQUEST). An unmodified session is saved - which
+    pushes its expiry forward - at most once per SESSION_TOUCH_INTERVAL seconds.
+    """
+    TOUCH_KEY = '_last_touch'
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.interval = getattr(settings, 'SESSION_TOUCH_INTERVAL', 300)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+
+        session = getattr(request, 'session', None)
+        if session is None or session.modified or session.is_empty():
+            return response
+
+        now = int(time.time())
+        if now - session.get(self.TOUCH_KEY, 0) >= self.interval:
+            session[self.TOUCH_KEY] = now
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+
+        session = getattr(request, 'session', None)
+        if session is None or session.modified or session.is_empty():
+            return response
+
+        now = int(time.time())
+        if now - await session.aget(self.TOUCH_KEY, 0) >= self.interval:
+            await session.aset(self.TOUCH_KEY, now)
+        return response
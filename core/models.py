@@ -7,6 +7,8 @@ from datetime import datetime, timedelta
 from django.core.exceptions import ValidationError
 from decimal import Decimal
 
+from . import business_calendar
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -68,25 +70,26 @@ class Product(models.Model):
         if self.barcode and len(self.barcode) < 3:
             raise ValidationError('Barcode must be at least 3 characters long.')
     
+    def _expiry_quantities(self):
+        """Expired and near-expiry quantities, fetched together and kept for this instance"""
+        if not hasattr(self, '_expiry_cache'):
+            from .expiry import product_expiry_quantities
+            self._expiry_cache = product_expiry_quantities([self.pk])[self.pk]
+        return self._expiry_cache
+
     @property
     def near_expiry_stock(self):
         """Get quantity of products nearing expiry"""
-        if not self.has_expiry:
+        if not self.has_expiry or not self.pk:
             return 0
-        warning_date = timezone.now().date() + timedelta(days=self.expiry_warning_days)
-        return self.batches.filter(
-            expiry_date__lte=warning_date,
-            expiry_date__gte=timezone.now().date()
-        ).aggregate(total=Sum('current_quantity'))['total'] or 0
+        return self._expiry_quantities()['near_expiry']
     
     @property
     def expired_stock(self):
         """Get quantity of expired products"""
-        if not self.has_expiry:
+        if not self.has_expiry or not self.pk:
             return 0
-        return self.batches.filter(expiry_date__lt=timezone.now().date()).aggregate(
-            total=Sum('current_quantity')
-        )['total'] or 0
+        return self._expiry_quantities()['expired']
     
     @property
     def stock_status(self):
@@ -108,15 +111,9 @@ class Product(models.Model):
     def generate_barcode(self):
         """Generate a unique barcode if not provided"""
         if not self.barcode:
-            base_barcode = self.sku.replace('SKU-', 'BC-')
-            counter = 1
-            new_barcode = base_barcode
-            
-            while Product.objects.filter(barcode=new_barcode).exclude(pk=self.pk).exists():
-                new_barcode = f"{base_barcode}-{counter}"
-                counter += 1
-            
-            self.barcode = new_barcode
+            # Single query for the whole BC-<sku> family instead of one per collision
+            from .barcodes import allocate_sku_barcode
+            self.barcode = allocate_sku_barcode(self.sku, exclude_pk=self.pk)
     
     @classmethod
     def find_by_barcode(cls, barcode):
@@ -166,21 +163,21 @@ class ProductBatch(models.Model):
 
     @property
     def is_expired(self):
-        return bool(self.expiry_date and self.expiry_date < timezone.now().date())
+        return bool(self.expiry_date and self.expiry_date < business_calendar.today())
 
     @property
     def is_near_expiry(self):
         if not self.expiry_date:
             return False
         warning_days = getattr(self.product, 'expiry_warning_days', 30)
-        warning_date = timezone.now().date() + timedelta(days=warning_days)
+        warning_date = business_calendar.today() + timedelta(days=warning_days)
         return self.expiry_date <= warning_date and not self.is_expired
 
     @property
     def days_until_expiry(self):
         if not self.expiry_date:
             return None
-        return (self.expiry_date - timezone.now().date()).days
+        return (self.expiry_date - business_calendar.today()).days
 
     @property
     def stock_value(self):
@@ -238,10 +235,11 @@ class PurchaseOrder(models.Model):
     
     def generate_po_number(self):
         """Generate PO number in format YYMMDDXXX (without PO- prefix)"""
-        date_str = timezone.now().strftime('%y%m%d')  # YYMMDD format
+        today = business_calendar.today()
+        date_str = today.strftime('%y%m%d')  # YYMMDD format of the trading day
         
         # Get the last PO number for today
-        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        today_start = business_calendar.day_start(today)
         today_pos = PurchaseOrder.objects.filter(created_at__gte=today_start)
         
         if today_pos.exists():
@@ -284,7 +282,7 @@ class PurchaseOrder(models.Model):
             batch = ProductBatch.objects.create(
                 product=product,
                 batch_number=batch_number,
-                manufacture_date=timezone.now().date(),
+                manufacture_date=business_calendar.today(),
                 expiry_date=item.expiry_date if product.has_expiry else None,
                 quantity=item.quantity,
                 current_quantity=item.quantity,
@@ -354,7 +352,7 @@ class PurchaseOrderItem(models.Model):
         batch = ProductBatch.objects.create(
             product=self.product,
             batch_number=self.batch_number,
-            manufacture_date=timezone.now().date(),
+            manufacture_date=business_calendar.today(),
             expiry_date=self.expiry_date if self.product.has_expiry else None,
             quantity=self.quantity,
             current_quantity=self.quantity,
@@ -521,75 +519,18 @@ class Customer(models.Model):
 
     def allocate_payment(self, payment_amount, payment_method='cash', notes='', received_by=None):
         """
-        Allocate payment to due invoices using FIFO method
+        Allocate payment to due invoices using FIFO method; anything above the
+        total due is kept as an advance
         Returns: list of allocated payments with details
         """
-        from django.db import transaction
-        
-        allocated_payments = []
-        remaining_amount = payment_amount
-        
-        # Get due sales ordered by date (oldest first)
-        due_sales = Sale.objects.filter(
-            customer=self,
-            payment_status__in=['due', 'partial']
-        ).order_by('sale_date')
-        
-        with transaction.atomic():
-            for sale in due_sales:
-                if remaining_amount <= 0:
-                    break
-                    
-                sale_due = sale.remaining_due
-                payment_to_apply = min(remaining_amount, sale_due)
-                
-                # Record allocation
-                allocated_payments.append({
-                    'invoice_number': sale.invoice_number,
-                    'sale_date': sale.sale_date,
-                    'due_amount': float(sale_due),
-                    'allocated_amount': float(payment_to_apply),
-                    'remaining_due_after': float(sale_due - payment_to_apply)
-                })
-                
-                # Update sale
-                sale.paid_amount += payment_to_apply
-                remaining_amount -= payment_to_apply
-                
-                # Update sale payment status
-                if sale.paid_amount >= sale.total_amount:
-                    sale.payment_status = 'paid'
-                else:
-                    sale.payment_status = 'partial'
-                
-                sale.save()
-            
-            # If there's any remaining amount after paying all dues, 
-            # it could be treated as advance or refunded
-            if remaining_amount > 0:
-                allocated_payments.append({
-                    'invoice_number': 'ADVANCE',
-                    'sale_date': timezone.now(),
-                    'due_amount': 0,
-                    'allocated_amount': float(remaining_amount),
-                    'remaining_due_after': 0,
-                    'notes': 'Advance payment for future purchases'
-                })
-            
-            # Create due payment record
-            due_payment = DuePayment.objects.create(
-                customer=self,
-                amount=payment_amount,
-                payment_method=payment_method,
-                notes=notes,
-                received_by=received_by,
-                allocated_details=allocated_payments
-            )
-            
-            # Update customer total_due
-            self.update_due_amount()
-        
-        return allocated_payments
+        from .dues import allocate_due_payment
+
+        due_payment = allocate_due_payment(
+            self, payment_amount, received_by,
+            payment_method=payment_method, notes=notes, allow_advance=True,
+        )
+        self.refresh_from_db(fields=['total_due'])
+        return due_payment.allocated_details
 
 
 class Sale(models.Model):
@@ -616,9 +557,20 @@ class Sale(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     tax_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0)
     discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    # Client-generated key sent by the till; a retried or replayed checkout
+    # with the same key returns this sale instead of creating another
+    idempotency_key = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    # SHA-256 of the stored invoice PDF and receipt (see core/invoices.py);
+    # blank until rendered and again after anything changes the sale
+    invoice_pdf_sha256 = models.CharField(max_length=64, blank=True, default='', editable=False)
+    receipt_sha256 = models.CharField(max_length=64, blank=True, default='', editable=False)
 
     class Meta:
         ordering = ['-sale_date']
+        indexes = [
+            # Customer statements and due lookups
+            models.Index(fields=['customer', 'sale_date']),
+        ]
 
     def __str__(self):
         return f"Invoice-{self.invoice_number}"
@@ -685,10 +637,11 @@ class Sale(models.Model):
 
     def generate_invoice_number(self):
         """Generate invoice number in format YYMMDDXXX (without INV- prefix)"""
-        date_str = timezone.now().strftime('%y%m%d')  # YYMMDD format
+        today = business_calendar.today()
+        date_str = today.strftime('%y%m%d')  # YYMMDD format of the trading day
         
         # Get the last invoice number for today
-        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        today_start = business_calendar.day_start(today)
         today_sales = Sale.objects.filter(created_at__gte=today_start)
         
         if today_sales.exists():
@@ -1007,7 +960,7 @@ class SupplierBill(models.Model):
             # Check if overdue
             if self.due_amount > 0:
                 due_date = self.due_date.date() if hasattr(self.due_date, 'date') else self.due_date
-                today = timezone.now().date()
+                today = business_calendar.today()
                 
                 if due_date < today:
                     self.status = 'overdue'
@@ -1043,7 +996,7 @@ class SupplierBill(models.Model):
             return False
             
         due_date = self.due_date.date() if hasattr(self.due_date, 'date') else self.due_date
-        today = timezone.now().date()
+        today = business_calendar.today()
         
         return due_date < today
     
@@ -1054,7 +1007,7 @@ class SupplierBill(models.Model):
             return 0
             
         due_date = self.due_date.date() if hasattr(self.due_date, 'date') else self.due_date
-        today = timezone.now().date()
+        today = business_calendar.today()
         return (today - due_date).days
     
     @property
@@ -1164,6 +1117,33 @@ class StockMovement(models.Model):
     def __str__(self):
         return f"{self.movement_type} - {self.product.name}"
 
+class ExpiryAlert(models.Model):
+    """Snapshot of expired / near-expiry batches, rebuilt nightly by refresh_expiry_alerts"""
+    ALERT_STATUS = (
+        ('expired', 'Expired'),
+        ('near_expiry', 'Near Expiry'),
+    )
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='expiry_alerts')
+    batch = models.ForeignKey(ProductBatch, on_delete=models.CASCADE, related_name='expiry_alerts')
+    status = models.CharField(max_length=20, choices=ALERT_STATUS)
+    expiry_date = models.DateField()
+    days_until_expiry = models.IntegerField()
+    quantity = models.IntegerField()
+    stock_value = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    alert_date = models.DateField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['expiry_date']
+        unique_together = ('batch', 'alert_date')
+        indexes = [
+            models.Index(fields=['alert_date', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_status_display()} - {self.product.name} ({self.batch.batch_number})"
+
 class SaleReturn(models.Model):
     RETURN_REASONS = [
         ('defective', 'Defective Product'),
@@ -1382,6 +1362,15 @@ class DuePayment(models.Model):
         except (TypeError, KeyError):
             return "Error parsing allocation details"
 
+class DueAllocation(models.Model):
+    """The part of a due payment applied to one invoice"""
+    due_payment = models.ForeignKey(DuePayment, on_delete=models.CASCADE, related_name='allocations')
+    sale = models.ForeignKey(Sale, on_delete=models.CASCADE, related_name='due_allocations')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.amount} of Due Payment-{self.due_payment_id} to Invoice-{self.sale_id}"
+
 class ViewPermission(models.Model):
     """Model to define which views users can access"""
     VIEW_CHOICES = (
@@ -1457,7 +1446,7 @@ class UserViewPermission(models.Model):
         return f"{self.user.username} - {self.permission.name}"
 
 # Signals
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 @receiver(post_save, sender=PurchaseOrder)
@@ -1485,4 +1474,57 @@ def create_product_batches(sender, instance, created, **kwargs):
             quantity=instance.quantity,
             current_quantity=instance.quantity,
             purchase_order_item=instance
-        )
\ No newline at end of file
+        )
+
+@receiver(post_save, sender=ProductBatch)
+@receiver(post_delete, sender=ProductBatch)
+def invalidate_expiry_summary(sender, instance, **kwargs):
+    from .expiry import invalidate_expiry_cache
+    invalidate_expiry_cache()
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+@receiver(post_save, sender=DuePayment)
+@receiver(post_delete, sender=DuePayment)
+@receiver(post_save, sender=SupplierBill)
+@receiver(post_delete, sender=SupplierBill)
+def invalidate_dashboard_metrics(sender, instance, **kwargs):
+    from .dashboard import invalidate_dashboard_cache
+    invalidate_dashboard_cache()
+
+
+@receiver(post_save, sender=Sale)
+@receiver(post_delete, sender=Sale)
+@receiver(post_save, sender=DuePayment)
+@receiver(post_delete, sender=DuePayment)
+@receiver(post_save, sender=SupplierBill)
+@receiver(post_delete, sender=SupplierBill)
+@receiver(post_save, sender=PurchaseReturn)
+@receiver(post_delete, sender=PurchaseReturn)
+def invalidate_aging(sender, instance, **kwargs):
+    from .aging import invalidate_aging_cache
+    # After the commit, so a report computed meanwhile cannot cache the old numbers
+    transaction.on_commit(invalidate_aging_cache)
+
+
+@receiver(post_save, sender=Sale)
+def invalidate_sale_invoice(sender, instance, created, **kwargs):
+    if not created:
+        from .invoices import invalidate_invoice
+        invalidate_invoice(instance.pk)
+
+
+@receiver(post_delete, sender=Sale)
+def delete_sale_invoice(sender, instance, **kwargs):
+    from .invoices import invalidate_invoice
+    invalidate_invoice(instance.pk, {'pdf': instance.invoice_pdf_sha256, 'txt': instance.receipt_sha256})
+
+
+@receiver(post_save, sender=SaleReturn)
+@receiver(post_delete, sender=SaleReturn)
+def invalidate_returned_sale_invoice(sender, instance, **kwargs):
+    from .invoices import invalidate_invoice
+    invalidate_invoice(instance.sale_id)
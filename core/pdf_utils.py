@@ -1,288 +1,518 @@
-import os
+# core/pdf_utils.py
+"""
+PDF rendering for the sales report.
+
+Fonts, paragraph styles and table styles are built once per process (on first
+use) and reused by every document. Tables are built from plain tuples - see
+``sale_rows`` and ``sale_day_rows`` - rather than from model instances, so
+rendering never touches the ORM. The summary report is one ``GROUP BY`` date
+query and never reads individual sales. ``render_story`` returns the PDF as ``RenderedPdf``: the bytes, plus
+the page count and how long the render took.
+
+The detailed report is laid out as a series of tables of
+``DETAILED_CHUNK_ROWS`` rows each, built one at a time while the rows are read
+from a database iterator, and ``sales_report_pdf_response`` writes the PDF to a
+temporary file that is streamed to the client. Layout work and memory for the
+table stay proportional to one chunk, however many sales the report covers.
+"""
+import logging
+import tempfile
+import time
+from collections import namedtuple
+from decimal import Decimal
+from functools import lru_cache
 from io import BytesIO
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak
+
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+from reportlab.lib.enums import TA_CENTER, TA_LEFT
 from reportlab.lib import colors
 from reportlab.lib.units import inch
-from reportlab.pdfgen import canvas
 from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from django.conf import settings
-from django.http import HttpResponse
+from reportlab.pdfbase.ttfonts import TTFont, TTFError
+from django.db.models import Count, ExpressionWrapper, F, Max, Min, QuerySet, Sum
+from django.db.models.functions import TruncDate
+from django.http import FileResponse, HttpResponse
 from datetime import datetime
-import math
 
-# Register multilingual fonts
-def register_fonts():
-    """Register multilingual fonts for PDF generation"""
-    try:
-        # Try to register Arial Unicode MS for full Unicode support
-        pdfmetrics.registerFont(TTFont('ArialUnicode', 'arialuni.ttf'))
-        return 'ArialUnicode'
-    except:
+from .reports import MONEY, actual_paid_expression, by_id, due_expression
+
+logger = logging.getLogger(__name__)
+
+# Tried in order; the first one found gives full Unicode (e.g. Bangla) support
+FONT_CANDIDATES = (
+    ('ArialUnicode', 'arialuni.ttf'),
+    ('DejaVuSans', 'DejaVuSans.ttf'),
+    ('FreeSans', 'FreeSans.ttf'),
+)
+FALLBACK_FONT = 'Helvetica'  # limited Unicode support
+
+MARGIN = 0.5 * inch
+
+SUMMARY_HEADERS = (
+    'S/N', 'Date', 'Gross Sales', 'Discount', 'Tax', 'Net Sales',
+    'Due Amount', 'Paid Amount', 'Returns', 'Sales Person',
+)
+SUMMARY_COL_WIDTHS = [0.4*inch, 0.8*inch, 0.9*inch, 0.7*inch, 0.6*inch, 0.9*inch, 0.8*inch, 0.8*inch, 0.7*inch, 1.2*inch]
+
+DETAILED_HEADERS = (
+    'S/N', 'Date', 'Invoice No', 'Customer', 'Gross Sales',
+    'Discount', 'Tax', 'Net Sales', 'Due Amount', 'Paid Amount', 'Sold By',
+)
+DETAILED_COL_WIDTHS = [0.3*inch, 0.6*inch, 0.8*inch, 1.0*inch, 0.8*inch, 0.7*inch, 0.6*inch, 0.8*inch, 0.7*inch, 0.7*inch, 0.9*inch]
+# Sales per table in the detailed report; also the database fetch size
+DETAILED_CHUNK_ROWS = 200
+
+# Fields of the tuples ``sale_rows`` yields, in order
+SALE_ROW_FIELDS = (
+    'sale_date', 'invoice_number', 'customer_name', 'total_amount', 'discount_amount',
+    'tax_amount', 'net_amount', 'remaining_due', 'actual_paid', 'sold_by',
+)
+# Fields of the tuples ``sale_day_rows`` yields, in order: one per day, with
+# the number of distinct sellers and the first and last of their usernames
+SALE_DAY_FIELDS = (
+    'date', 'gross_sales', 'discount', 'tax', 'net_sales', 'due_amount',
+    'paid_amount', 'returns', 'seller_count', 'first_seller', 'last_seller',
+)
+
+
+@lru_cache(maxsize=None)
+def font_name():
+    """Register the first available Unicode font; done once per process"""
+    for name, filename in FONT_CANDIDATES:
         try:
-            # Fallback to DejaVu Sans which supports many languages
-            pdfmetrics.registerFont(TTFont('DejaVuSans', 'DejaVuSans.ttf'))
-            return 'DejaVuSans'
-        except:
-            try:
-                # Fallback to FreeSans
-                pdfmetrics.registerFont(TTFont('FreeSans', 'FreeSans.ttf'))
-                return 'FreeSans'
-            except:
-                # Use default Helvetica (limited Unicode support)
-                return 'Helvetica'
-
-# Call this function once when the module loads
-FONT_NAME = register_fonts()
-
-def generate_sales_report_pdf(context):
-    """Generate PDF sales report using ReportLab with multilingual support"""
-    try:
-        buffer = BytesIO()
-        doc = SimpleDocTemplate(
-            buffer, 
-            pagesize=A4, 
-            topMargin=0.5*inch, 
-            bottomMargin=0.5*inch,
-            leftMargin=0.5*inch,
-            rightMargin=0.5*inch
-        )
-        
-        # Get styles
-        styles = getSampleStyleSheet()
-        
-        # Create custom styles with multilingual font support
-        title_style = ParagraphStyle(
-            'CustomTitle',
-            parent=styles['Heading1'],
-            fontName=FONT_NAME,
-            fontSize=14,
-            spaceAfter=20,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#2c3e50')
-        )
-        
-        company_style = ParagraphStyle(
-            'CompanyStyle',
-            parent=styles['Heading2'],
-            fontName=FONT_NAME,
-            fontSize=16,
-            spaceAfter=10,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#34495e')
-        )
-        
-        subtitle_style = ParagraphStyle(
-            'SubtitleStyle',
-            parent=styles['Heading3'],
-            fontName=FONT_NAME,
-            fontSize=12,
-            spaceAfter=15,
-            alignment=TA_CENTER,
-            textColor=colors.HexColor('#7f8c8d')
-        )
-        
-        info_style = ParagraphStyle(
-            'InfoStyle',
-            parent=styles['Normal'],
-            fontName=FONT_NAME,
-            fontSize=9,
-            spaceAfter=3,
-            alignment=TA_LEFT
-        )
-        
-        normal_style = ParagraphStyle(
-            'CustomNormal',
-            parent=styles['Normal'],
-            fontName=FONT_NAME,
-            fontSize=9,
-            spaceAfter=6
-        )
-        
-        # Build the story (content)
-        story = []
-        
-        # Company Header - Multilingual support
-        company_name = context.get('company_name', 'SHOP MANAGEMENT SYSTEM')
-        report_title = context.get('report_title', 'SALES REPORT')
-        
-        story.append(Paragraph(company_name, company_style))
-        story.append(Paragraph(report_title, title_style))
-        
-        # Report Information
-        current_datetime = datetime.now().strftime("%B %d, %Y at %I:%M %p")
-        story.append(Paragraph(f"Generated on: {current_datetime}", subtitle_style))
-        
-        # Report Details
-        report_type = context.get('report_type', 'daily').replace('_', ' ').title()
-        date_info = get_date_range_info(context)
-        
-        details_data = [
-            [Paragraph("<b>Report Type:</b>", info_style), Paragraph(report_type, info_style)],
-            [Paragraph("<b>Date Range:</b>", info_style), Paragraph(date_info, info_style)],
-        ]
-        
-        # Add filters information
-        filters_info = get_filters_info(context)
-        if filters_info:
-            details_data.append([Paragraph("<b>Filters:</b>", info_style), Paragraph(filters_info, info_style)])
-        
-        # Add generated by information
-        generated_by = context.get('request_user', 'System')
-        details_data.append([Paragraph("<b>Generated By:</b>", info_style), Paragraph(generated_by, info_style)])
-        
-        details_table = Table(details_data, colWidths=[1.5*inch, 4*inch])
-        details_table.setStyle(TableStyle([
+            pdfmetrics.registerFont(TTFont(name, filename))
+            return name
+        except (TTFError, OSError):
+            continue
+    logger.warning("No Unicode TTF font found, PDFs use %s", FALLBACK_FONT)
+    return FALLBACK_FONT
+
+
+@lru_cache(maxsize=None)
+def styles():
+    """Paragraph styles shared by every document"""
+    base = getSampleStyleSheet()
+    font = font_name()
+    return {
+        'title': ParagraphStyle(
+            'CustomTitle', parent=base['Heading1'], fontName=font, fontSize=14,
+            spaceAfter=20, alignment=TA_CENTER, textColor=colors.HexColor('#2c3e50'),
+        ),
+        'company': ParagraphStyle(
+            'CompanyStyle', parent=base['Heading2'], fontName=font, fontSize=16,
+            spaceAfter=10, alignment=TA_CENTER, textColor=colors.HexColor('#34495e'),
+        ),
+        'subtitle': ParagraphStyle(
+            'SubtitleStyle', parent=base['Heading3'], fontName=font, fontSize=12,
+            spaceAfter=15, alignment=TA_CENTER, textColor=colors.HexColor('#7f8c8d'),
+        ),
+        'info': ParagraphStyle(
+            'InfoStyle', parent=base['Normal'], fontName=font, fontSize=9,
+            spaceAfter=3, alignment=TA_LEFT,
+        ),
+        'normal': ParagraphStyle(
+            'CustomNormal', parent=base['Normal'], fontName=font, fontSize=9, spaceAfter=6,
+        ),
+        'footer': ParagraphStyle(
+            'FooterStyle', parent=base['Normal'], fontName=font, fontSize=8,
+            textColor=colors.HexColor('#7f8c8d'), alignment=TA_CENTER,
+        ),
+        'error': ParagraphStyle(
+            'ErrorStyle', parent=base['Heading1'], fontSize=14,
+            textColor=colors.red, alignment=TA_CENTER,
+        ),
+        'cell': base['Normal'],
+    }
+
+
+@lru_cache(maxsize=None)
+def table_style(name):
+    """
+    Table style templates. Cell ranges are relative (``-1`` is the last row),
+    so one ``TableStyle`` fits tables of any length.
+    """
+    font = font_name()
+    grid = [('VALIGN', (0, 0), (-1, -1), 'MIDDLE')]
+    if name == 'details':
+        return TableStyle([
             ('VALIGN', (0, 0), (-1, -1), 'TOP'),
             ('LEFTPADDING', (0, 0), (-1, -1), 0),
             ('RIGHTPADDING', (0, 0), (-1, -1), 0),
             ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ]))
-        
-        story.append(details_table)
-        story.append(Spacer(1, 15))
-        
-        # Get report format and sales data
-        report_format = context.get('report_format', 'detailed')
-        sales = context.get('sales', [])
-        
-        # Sales Data Table based on report format
-        if report_format == 'summary':
-            story.append(Paragraph("SALES SUMMARY", subtitle_style))
-            summary_table = create_summary_table(context)
-            if summary_table:
-                story.append(summary_table)
-            else:
-                story.append(Paragraph("No sales data available for the selected period.", normal_style))
-            
-            # ADD SUMMARY STATISTICS AFTER THE SUMMARY TABLE
-            story.append(Spacer(1, 15))
-            story.append(Paragraph("SUMMARY STATISTICS", subtitle_style))
-            summary_stats = create_summary_stats_table(context)
-            if summary_stats:
-                story.append(summary_stats)
-            
-        else:  # detailed report
-            story.append(Paragraph("DETAILED SALES TRANSACTIONS", subtitle_style))
-            detailed_table = create_detailed_table(context)
-            if detailed_table:
-                story.append(detailed_table)
-            else:
-                story.append(Paragraph("No sales transactions found for the selected criteria.", normal_style))
-        
-        story.append(Spacer(1, 15))
-        
-        # Footer with multilingual support
-        footer_text = context.get('footer_text', 'Shop Management System - Confidential Report')
-        footer_style = ParagraphStyle(
-            'FooterStyle',
-            parent=styles['Normal'],
-            fontName=FONT_NAME,
-            fontSize=8,
-            textColor=colors.HexColor('#7f8c8d'),
-            alignment=TA_CENTER
-        )
-        story.append(Paragraph(footer_text, footer_style))
-        
-        # Build PDF with page break support
-        def add_page_number(canvas, doc):
-            """Add page numbers to each page"""
-            page_num = canvas.getPageNumber()
-            text = f"Page {page_num}"
-            canvas.setFont(FONT_NAME, 8)
-            canvas.setFillColor(colors.HexColor('#7f8c8d'))
-            canvas.drawRightString(doc.pagesize[0] - 0.5*inch, 0.4*inch, text)
-            
-            # Add footer text on each page
-            canvas.setFont(FONT_NAME, 7)
-            canvas.drawString(0.5*inch, 0.4*inch, footer_text)
-        
-        # Build PDF with page number callback
-        doc.build(story, onFirstPage=add_page_number, onLaterPages=add_page_number)
-        
-        # Get PDF value from buffer
-        pdf = buffer.getvalue()
-        buffer.close()
+        ])
+    if name == 'stats':
+        return TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 9),
+
+            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f8f9fa')),
+            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+            ('FONTNAME', (0, 1), (-1, -1), font),
+            ('FONTSIZE', (0, 1), (-1, -1), 8),
+            ('ALIGN', (0, 1), (0, -1), 'LEFT'),
+            ('ALIGN', (1, 1), (1, -1), 'RIGHT'),
+
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#dee2e6')),
+        ] + grid)
+    if name == 'invoice':
+        return TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTNAME', (0, 1), (-1, -1), font),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+            ('ALIGN', (2, 0), (2, -1), 'CENTER'),
+            ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#dee2e6')),
+        ] + grid)
+    if name == 'statement':
+        return TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTNAME', (0, 1), (-1, -1), font),
+            ('FONTSIZE', (0, 0), (-1, -1), 8),
+            ('ALIGN', (3, 0), (-1, -1), 'RIGHT'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#dee2e6')),
+        ] + grid)
+    if name == 'invoice_totals':
+        return TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), font),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+            ('LINEABOVE', (0, -1), (-1, -1), 0.75, colors.HexColor('#2c3e50')),
+        ] + grid)
+    if name == 'summary':
+        header_size, body_size, amounts = 7, 6, (2, 8)
+    elif name in ('detailed', 'detailed_body'):
+        header_size, body_size, amounts = 6, 5.5, (4, 9)
+    else:
+        raise ValueError(f'Unknown table style: {name}')
+    first, last = amounts
+    if name == 'detailed_body':
+        # A chunk of the detailed report: header and sales, no totals row
+        return TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), header_size),
+
+            ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#ffffff')),
+            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+            ('FONTNAME', (0, 1), (-1, -1), font),
+            ('FONTSIZE', (0, 1), (-1, -1), body_size),
+            ('ALIGN', (0, 1), (0, -1), 'CENTER'),
+            ('ALIGN', (first, 1), (last, -1), 'RIGHT'),
+
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#bdc3c7')),
+        ] + grid)
+    return TableStyle([
+        # Header row
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), header_size),
+
+        # Data rows
+        ('BACKGROUND', (0, 1), (-1, -2), colors.HexColor('#ffffff')),
+        ('TEXTCOLOR', (0, 1), (-1, -2), colors.black),
+        ('FONTNAME', (0, 1), (-1, -2), font),
+        ('FONTSIZE', (0, 1), (-1, -2), body_size),
+        ('ALIGN', (0, 1), (0, -2), 'CENTER'),  # S/N column
+        ('ALIGN', (first, 1), (last, -2), 'RIGHT'),  # Amount columns
+
+        # Totals row
+        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#34495e')),
+        ('TEXTCOLOR', (0, -1), (-1, -1), colors.whitesmoke),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, -1), (-1, -1), header_size),
+        ('ALIGN', (first, -1), (last, -1), 'RIGHT'),
+
+        # Grid
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#bdc3c7')),
+    ] + grid)
+
+
+class RenderedPdf(bytes):
+    """PDF content that also carries its page count and render time"""
+
+    def __new__(cls, content, pages=0, seconds=0.0):
+        pdf = super().__new__(cls, content)
+        pdf.pages = pages
+        pdf.seconds = seconds
         return pdf
-        
-    except Exception as e:
-        print(f"PDF generation error: {str(e)}")
-        import traceback
-        traceback.print_exc()  # This will print the full traceback
-        # Return a simple PDF with error message
-        return create_error_pdf(str(e))
 
-def create_error_pdf(error_message):
-    """Create a simple PDF with error message"""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    story = []
-    
-    styles = getSampleStyleSheet()
-    error_style = ParagraphStyle(
-        'ErrorStyle',
-        parent=styles['Heading1'],
-        fontSize=14,
-        textColor=colors.red,
-        alignment=TA_CENTER
+
+RenderStats = namedtuple('RenderStats', 'pages seconds')
+
+
+class _LazyStory(list):
+    """
+    Story whose flowables after ``head`` come from an iterator and are only
+    created when the layout engine is about to need them. ReportLab consumes
+    the story from the front, so only a couple of flowables exist at a time.
+    """
+
+    def __init__(self, head, tail):
+        super().__init__(head)
+        self._tail = iter(tail)
+
+    def __len__(self):
+        # Keep one flowable of lookahead for keepWithNext handling
+        while super().__len__() < 2:
+            flowable = next(self._tail, None)
+            if flowable is None:
+                break
+            self.append(flowable)
+        return super().__len__()
+
+
+def write_story(story, output, footer_text='', title='', tail=(), invariant=False):
+    """
+    Lay out ``story`` followed by the flowables from ``tail`` on A4 pages with
+    page numbers, writing the PDF to the file object ``output``. With
+    ``invariant`` the output has no timestamps or random IDs, so the same
+    content always gives the same bytes. Returns ``RenderStats``.
+    """
+    font = font_name()
+    started = time.perf_counter()
+    doc = SimpleDocTemplate(
+        output,
+        pagesize=A4,
+        topMargin=MARGIN,
+        bottomMargin=MARGIN,
+        leftMargin=MARGIN,
+        rightMargin=MARGIN,
+        title=title,
+        invariant=invariant,
     )
-    
-    story.append(Paragraph("PDF Generation Error", error_style))
-    story.append(Paragraph(f"Error: {error_message}", styles['Normal']))
-    
-    doc.build(story)
-    pdf = buffer.getvalue()
+
+    def add_page_number(canvas, doc):
+        """Page number and footer text on each page"""
+        canvas.setFont(font, 8)
+        canvas.setFillColor(colors.HexColor('#7f8c8d'))
+        canvas.drawRightString(doc.pagesize[0] - MARGIN, 0.4*inch, f"Page {canvas.getPageNumber()}")
+        canvas.setFont(font, 7)
+        canvas.drawString(MARGIN, 0.4*inch, footer_text)
+
+    doc.build(_LazyStory(story, tail), onFirstPage=add_page_number, onLaterPages=add_page_number)
+    stats = RenderStats(doc.page, time.perf_counter() - started)
+    logger.info("Rendered PDF %r: %d pages in %.3fs", title, stats.pages, stats.seconds)
+    return stats
+
+
+def render_story(story, footer_text='', title='', tail=(), invariant=False):
+    """Like ``write_story`` but returns the PDF as ``RenderedPdf``"""
+    buffer = BytesIO()
+    stats = write_story(story, buffer, footer_text, title, tail, invariant)
+    pdf = RenderedPdf(buffer.getvalue(), pages=stats.pages, seconds=stats.seconds)
     buffer.close()
     return pdf
 
-def create_summary_stats_table(context):
-    """Create summary statistics table"""
-    
-    # Calculate total actual paid from sales data (paid_amount - change_amount)
-    sales = context.get('sales', [])
-    total_actual_paid = sum(
-        max(0, float(sale.paid_amount or 0) - float(sale.change_amount or 0)) 
-        for sale in sales
+
+def sale_rows(sales):
+    """
+    Plain tuples (``SALE_ROW_FIELDS``) for a Sale queryset, computed by the
+    database: net = total - returned, due = max(total - paid, 0) and actual
+    paid = max(paid - change, 0), the same figures as the Sale properties.
+    """
+    ordering = sales.query.order_by
+    sales = by_id(sales)
+    if ordering:
+        sales = sales.order_by(*ordering)
+    return sales.annotate(
+        row_net=ExpressionWrapper(F('total_amount') - F('returned_amount'), output_field=MONEY),
+        row_due=due_expression(),
+        row_paid=actual_paid_expression(),
+    ).values_list(
+        'sale_date', 'invoice_number', 'customer_name', 'total_amount', 'discount_amount',
+        'tax_amount', 'row_net', 'row_due', 'row_paid', 'sold_by__username',
     )
-    
+
+
+def sale_day_rows(sales):
+    """
+    ``SALE_DAY_FIELDS`` tuples for a Sale queryset, oldest day first: the
+    same per-sale figures as ``sale_rows``, summed per day by the database
+    """
+    return by_id(sales).annotate(
+        date=TruncDate('sale_date'),
+    ).values('date').annotate(
+        day_gross=Sum('total_amount'),
+        day_discount=Sum('discount_amount'),
+        day_tax=Sum('tax_amount'),
+        day_net=Sum(F('total_amount') - F('returned_amount'), output_field=MONEY),
+        day_due=Sum(due_expression(), output_field=MONEY),
+        day_paid=Sum(actual_paid_expression(), output_field=MONEY),
+        day_returns=Sum('returned_amount'),
+        seller_count=Count('sold_by', distinct=True),
+        first_seller=Min('sold_by__username'),
+        last_seller=Max('sold_by__username'),
+    ).order_by('date').values_list(
+        'date', 'day_gross', 'day_discount', 'day_tax', 'day_net', 'day_due',
+        'day_paid', 'day_returns', 'seller_count', 'first_seller', 'last_seller',
+    )
+
+
+def _sales_report_story(context, rows):
+    """``(story, tail, footer_text, title)`` for the sales report"""
+    summary = context.get('report_format', 'detailed') == 'summary'
+    if rows is None:
+        sales = context.get('sales')
+        if sales is None:
+            rows = []
+        else:
+            rows = sale_day_rows(sales) if summary else sale_rows(sales)
+    style = styles()
+
+    story = []
+
+    company_name = context.get('company_name', 'SHOP MANAGEMENT SYSTEM')
+    report_title = context.get('report_title', 'SALES REPORT')
+
+    story.append(Paragraph(company_name, style['company']))
+    story.append(Paragraph(report_title, style['title']))
+
+    current_datetime = datetime.now().strftime("%B %d, %Y at %I:%M %p")
+    story.append(Paragraph(f"Generated on: {current_datetime}", style['subtitle']))
+
+    # Report Details
+    report_type = context.get('report_type', 'daily').replace('_', ' ').title()
+    date_info = get_date_range_info(context)
+
+    details_data = [
+        [Paragraph("<b>Report Type:</b>", style['info']), Paragraph(report_type, style['info'])],
+        [Paragraph("<b>Date Range:</b>", style['info']), Paragraph(date_info, style['info'])],
+    ]
+
+    filters_info = get_filters_info(context)
+    if filters_info:
+        details_data.append([Paragraph("<b>Filters:</b>", style['info']), Paragraph(filters_info, style['info'])])
+
+    generated_by = context.get('request_user', 'System')
+    details_data.append([Paragraph("<b>Generated By:</b>", style['info']), Paragraph(generated_by, style['info'])])
+
+    details_table = Table(details_data, colWidths=[1.5*inch, 4*inch])
+    details_table.setStyle(table_style('details'))
+
+    story.append(details_table)
+    story.append(Spacer(1, 15))
+
+    footer_text = context.get('footer_text', 'Shop Management System - Confidential Report')
+    tail = []
+
+    if summary:
+        rows = list(rows)
+        story.append(Paragraph("SALES SUMMARY", style['subtitle']))
+        summary_table = create_summary_table(context, rows)
+        if summary_table:
+            story.append(summary_table)
+        else:
+            story.append(Paragraph("No sales data available for the selected period.", style['normal']))
+
+        story.append(Spacer(1, 15))
+        story.append(Paragraph("SUMMARY STATISTICS", style['subtitle']))
+        story.append(create_summary_stats_table(context, rows))
+
+    else:  # detailed report, built chunk by chunk as it is laid out
+        story.append(Paragraph("DETAILED SALES TRANSACTIONS", style['subtitle']))
+        if isinstance(rows, QuerySet):
+            rows = rows.iterator(chunk_size=DETAILED_CHUNK_ROWS)
+        tail = create_detailed_tables(context, rows)
+
+    def closing():
+        yield from tail
+        yield Spacer(1, 15)
+        yield Paragraph(footer_text, style['footer'])
+
+    return story, closing(), footer_text, report_title
+
+
+def generate_sales_report_pdf(context, rows=None):
+    """
+    Sales report PDF as ``RenderedPdf``. ``rows`` are ``SALE_ROW_FIELDS``
+    tuples, or ``SALE_DAY_FIELDS`` tuples for the summary format; by default
+    they are read from ``context['sales']`` with ``sale_rows``/``sale_day_rows``.
+    """
+    try:
+        story, tail, footer_text, title = _sales_report_story(context, rows)
+        return render_story(story, footer_text, title, tail)
+    except Exception as e:
+        logger.exception("PDF generation error")
+        return create_error_pdf(str(e))
+
+
+def write_sales_report_pdf(context, output, rows=None):
+    """Write the sales report PDF to the file object ``output``; returns ``RenderStats``"""
+    try:
+        story, tail, footer_text, title = _sales_report_story(context, rows)
+        return write_story(story, output, footer_text, title, tail)
+    except Exception as e:
+        logger.exception("PDF generation error")
+        output.seek(0)
+        output.truncate()
+        output.write(create_error_pdf(str(e)))
+        return RenderStats(1, 0.0)
+
+
+def sales_report_pdf_response(context, filename, rows=None):
+    """
+    Render the sales report into a temporary file and stream it back; the
+    file is removed when the response is closed
+    """
+    output = tempfile.TemporaryFile(suffix='.pdf')
+    stats = write_sales_report_pdf(context, output, rows)
+    output.seek(0)
+    response = FileResponse(output, as_attachment=True, filename=filename, content_type='application/pdf')
+    response['X-PDF-Pages'] = str(stats.pages)
+    response['X-PDF-Render-Time'] = f'{stats.seconds:.3f}'
+    return response
+
+
+def create_error_pdf(error_message):
+    """Create a simple PDF with error message"""
+    style = styles()
+    story = [
+        Paragraph("PDF Generation Error", style['error']),
+        Paragraph(f"Error: {error_message}", style['cell']),
+    ]
+    return render_story(story, title='PDF Generation Error')
+
+
+def create_summary_stats_table(context, days):
+    """Create summary statistics table from the ``SALE_DAY_FIELDS`` tuples in ``days``"""
+    currency_symbol = context.get('currency_symbol', '৳')
+    # Total actually kept: paid minus change, per sale
+    total_actual_paid = context.get('total_actual_paid')
+    if total_actual_paid is None:
+        total_actual_paid = sum(day[6] for day in days)
+
     stats_data = [
         ["Total Transactions:", f"{context.get('total_transactions', 0):,}"],
-        ["Gross Sales:", format_currency(context.get('gross_sales', 0), context.get('currency_symbol', '৳'))],
-        ["Returns:", format_currency(context.get('total_returns', 0), context.get('currency_symbol', '৳'))],
-        ["Net Sales:", format_currency(context.get('net_sales', 0), context.get('currency_symbol', '৳'))],
-        ["Total Due Amount:", format_currency(context.get('total_due_amount', 0), context.get('currency_symbol', '৳'))],
-        ["Total Paid Amount:", format_currency(total_actual_paid, context.get('currency_symbol', '৳'))],  # Use actual paid
+        ["Gross Sales:", format_currency(context.get('gross_sales', 0), currency_symbol)],
+        ["Returns:", format_currency(context.get('total_returns', 0), currency_symbol)],
+        ["Net Sales:", format_currency(context.get('net_sales', 0), currency_symbol)],
+        ["Total Due Amount:", format_currency(context.get('total_due_amount', 0), currency_symbol)],
+        ["Total Paid Amount:", format_currency(total_actual_paid, currency_symbol)],
         ["Total Items Sold:", f"{context.get('total_items_sold', 0):,}"],
         ["Items Returned:", f"{context.get('total_items_returned', 0):,}"],
         ["Net Items Sold:", f"{context.get('net_items_sold', 0):,}"],
-        ["Average Sale:", format_currency(context.get('average_sale', 0), context.get('currency_symbol', '৳'))],
+        ["Average Sale:", format_currency(context.get('average_sale', 0), currency_symbol)],
     ]
-    
-    data = [[Paragraph("<b>Metric</b>", getSampleStyleSheet()['Normal']), 
-             Paragraph("<b>Value</b>", getSampleStyleSheet()['Normal'])]] + stats_data
-    
+
+    header = styles()['cell']
+    data = [[Paragraph("<b>Metric</b>", header), Paragraph("<b>Value</b>", header)]] + stats_data
+
     table = Table(data, colWidths=[2.5*inch, 2*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 9),
-        
-        ('BACKGROUND', (0, 1), (-1, -1), colors.HexColor('#f8f9fa')),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), FONT_NAME),
-        ('FONTSIZE', (0, 1), (-1, -1), 8),
-        ('ALIGN', (0, 1), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 1), (1, -1), 'RIGHT'),
-        
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#dee2e6')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
-    
+    table.setStyle(table_style('stats'))
     return table
 
 def get_date_range_info(context):
@@ -367,240 +597,93 @@ def safe_text(text, max_length=30):
 def format_currency(amount, currency_symbol='৳'):
     """Format currency with symbol support"""
     try:
-        amount_float = float(amount)
-        return f"{currency_symbol}{amount_float:,.2f}"
-    except (ValueError, TypeError):
+        # Decimals are formatted as they are, without a float round trip
+        if not isinstance(amount, Decimal):
+            amount = Decimal(str(amount))
+        return f"{currency_symbol}{amount:,.2f}"
+    except (ArithmeticError, ValueError, TypeError):
         return f"{currency_symbol}0.00"
 
-def create_summary_table(context):
-    """Create summary table with multilingual support"""
-    sales = context.get('sales', [])
-    
-    if not sales:
+
+def create_summary_table(context, days):
+    """One row per day from the ``SALE_DAY_FIELDS`` tuples in ``days``"""
+    if not days:
         return None
-    
-    # Multilingual column headers - REMOVED: 'Net Items Sold' column
-    headers = [
-        'S/N', 'Date', 'Gross Sales', 'Discount', 'Tax', 'Net Sales',
-        'Due Amount', 'Paid Amount', 'Returns', 'Sales Person'  # REMOVED 'Net Items Sold'
-    ]
-    
-    # Prepare table data
-    data = [headers]
-    
-    # Group sales by date for summary view
-    sales_by_date = {}
-    for sale in sales:
-        sale_date = sale.sale_date.date()
-        if sale_date not in sales_by_date:
-            sales_by_date[sale_date] = {
-                'gross_sales': 0,
-                'discount': 0,
-                'tax': 0,
-                'net_sales': 0,
-                'due_amount': 0,
-                'paid_amount': 0,  # This will now store actual paid (paid_amount - change_amount)
-                'returns': 0,
-                'sales_persons': set()
-            }
-        
-        sales_by_date[sale_date]['gross_sales'] += float(sale.total_amount or 0)
-        sales_by_date[sale_date]['discount'] += float(sale.discount_amount or 0)
-        sales_by_date[sale_date]['tax'] += float(sale.tax_amount or 0)
-        sales_by_date[sale_date]['net_sales'] += float(sale.net_amount or 0)
-        sales_by_date[sale_date]['due_amount'] += float(sale.remaining_due or 0)
-        
-        # CHANGE: Use actual paid amount (paid_amount - change_amount) instead of just paid_amount
-        actual_paid = float(sale.paid_amount or 0) - float(sale.change_amount or 0)
-        sales_by_date[sale_date]['paid_amount'] += max(0, actual_paid)  # Ensure not negative
-        
-        sales_by_date[sale_date]['returns'] += float(sale.returned_amount or 0)
-        sales_by_date[sale_date]['sales_persons'].add(safe_text(sale.sold_by.username))
-    
-    # Add rows for each date
-    sn = 1
+
     currency_symbol = context.get('currency_symbol', '৳')
-    for date, summary in sorted(sales_by_date.items()):
-        sales_person = ', '.join(summary['sales_persons']) if len(summary['sales_persons']) <= 2 else 'Multiple'
-        
-        data.append([
+    data = [SUMMARY_HEADERS]
+    totals = [Decimal('0')] * 7
+    for sn, (date, *amounts, seller_count, first_seller, last_seller) in enumerate(days, 1):
+        if seller_count > 2:
+            sales_person = 'Multiple'
+        else:
+            sales_person = ', '.join(dict.fromkeys(filter(None, (first_seller, last_seller))))
+        data.append((
             str(sn),
             date.strftime("%Y-%m-%d"),
-            format_currency(summary['gross_sales'], currency_symbol),
-            format_currency(summary['discount'], currency_symbol),
-            format_currency(summary['tax'], currency_symbol),
-            format_currency(summary['net_sales'], currency_symbol),
-            format_currency(summary['due_amount'], currency_symbol),
-            format_currency(summary['paid_amount'], currency_symbol),  # This now shows actual paid
-            format_currency(summary['returns'], currency_symbol),
-            safe_text(sales_person, 15)
-        ])
-        sn += 1
-    
-    # Add totals row
-    total_gross = sum(item['gross_sales'] for item in sales_by_date.values())
-    total_discount = sum(item['discount'] for item in sales_by_date.values())
-    total_tax = sum(item['tax'] for item in sales_by_date.values())
-    total_net = sum(item['net_sales'] for item in sales_by_date.values())
-    total_due = sum(item['due_amount'] for item in sales_by_date.values())
-    total_paid = sum(item['paid_amount'] for item in sales_by_date.values())  # This now shows actual total paid
-    total_returns = sum(item['returns'] for item in sales_by_date.values())
-    
-    data.append([
+            *(format_currency(amount, currency_symbol) for amount in amounts),
+            safe_text(sales_person, 15),
+        ))
+        totals = [total + (amount or 0) for total, amount in zip(totals, amounts)]
+
+    data.append((
         '', 'TOTALS:',
-        format_currency(total_gross, currency_symbol),
-        format_currency(total_discount, currency_symbol),
-        format_currency(total_tax, currency_symbol),
-        format_currency(total_net, currency_symbol),
-        format_currency(total_due, currency_symbol),
-        format_currency(total_paid, currency_symbol),  # This now shows actual total paid
-        format_currency(total_returns, currency_symbol),
-        ''
-    ])
-    
-    # Create table with appropriate column widths - ADJUSTED for removed column
-    col_widths = [0.4*inch, 0.8*inch, 0.9*inch, 0.7*inch, 0.6*inch, 0.9*inch, 0.8*inch, 0.8*inch, 0.7*inch, 1.2*inch]
-    
-    table = Table(data, colWidths=col_widths, repeatRows=1)
-    
-    # Define table style - UPDATED column ranges
-    style = TableStyle([
-        # Header row
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 7),
-        
-        # Data rows
-        ('BACKGROUND', (0, 1), (-1, -2), colors.HexColor('#ffffff')),
-        ('TEXTCOLOR', (0, 1), (-1, -2), colors.black),
-        ('FONTNAME', (0, 1), (-1, -2), FONT_NAME),
-        ('FONTSIZE', (0, 1), (-1, -2), 6),
-        ('ALIGN', (0, 1), (0, -2), 'CENTER'),  # S/N column
-        ('ALIGN', (2, 1), (8, -2), 'RIGHT'),   # Amount columns (updated range)
-        
-        # Totals row
-        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#34495e')),
-        ('TEXTCOLOR', (0, -1), (-1, -1), colors.whitesmoke),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, -1), (-1, -1), 7),
-        ('ALIGN', (2, -1), (8, -1), 'RIGHT'),  # Updated range for totals
-        
-        # Grid
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#bdc3c7')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ])
-    
-    table.setStyle(style)
+        *(format_currency(total, currency_symbol) for total in totals),
+        '',
+    ))
+
+    table = Table(data, colWidths=SUMMARY_COL_WIDTHS, repeatRows=1)
+    table.setStyle(table_style('summary'))
     return table
 
-def create_detailed_table(context):
-    """Create detailed sales transactions table with multilingual support"""
-    sales = context.get('sales', [])
-    
-    if not sales:
-        return None
-    
-    # Multilingual column headers - REMOVED: 'Items Sold' column
-    headers = [
-        'S/N', 'Date', 'Invoice No', 'Customer', 'Gross Sales', 
-        'Discount', 'Tax', 'Net Sales', 'Due Amount', 'Paid Amount', 'Sold By'  # REMOVED 'Items Sold'
-    ]
-    
-    # Prepare table data
-    data = [headers]
-    
-    sn = 1
+
+def create_detailed_tables(context, rows):
+    """
+    Yield the detailed report as tables of ``DETAILED_CHUNK_ROWS`` sales, each
+    with the column header, followed by the totals. ``rows`` may be any
+    iterable of ``SALE_ROW_FIELDS`` tuples and is consumed lazily.
+    """
     currency_symbol = context.get('currency_symbol', '৳')
-    for sale in sales:
-        customer_name = safe_text(sale.customer_name or "Walk-in Customer", 20)
-        invoice_number = safe_text(sale.invoice_number[-8:], 8) if sale.invoice_number else "N/A"
-        sold_by = safe_text(sale.sold_by.username, 15)
-        
-        # CHANGE: Calculate actual paid amount for each sale
-        actual_paid = float(sale.paid_amount or 0) - float(sale.change_amount or 0)
-        actual_paid = max(0, actual_paid)  # Ensure not negative
-        
-        data.append([
-            str(sn),
-            sale.sale_date.strftime("%Y-%m-%d"),
-            invoice_number,
-            customer_name,
-            format_currency(sale.total_amount, currency_symbol),
-            format_currency(sale.discount_amount, currency_symbol),
-            format_currency(sale.tax_amount, currency_symbol),
-            format_currency(sale.net_amount, currency_symbol),
-            format_currency(sale.remaining_due, currency_symbol),
-            format_currency(actual_paid, currency_symbol),  # Use actual paid instead of paid_amount
-            sold_by
-        ])
+    totals = [0] * 6
+    chunk = [DETAILED_HEADERS]
+    sn = 0
+    for sale_date, invoice_number, customer_name, *amounts, sold_by in rows:
         sn += 1
-    
-    # Add totals row - recalculate with actual paid amounts
-    total_gross = sum(float(sale.total_amount or 0) for sale in sales)
-    total_discount = sum(float(sale.discount_amount or 0) for sale in sales)
-    total_tax = sum(float(sale.tax_amount or 0) for sale in sales)
-    total_net = sum(float(sale.net_amount or 0) for sale in sales)
-    total_due = sum(float(sale.remaining_due or 0) for sale in sales)
-    
-    # CHANGE: Calculate total actual paid (sum of all actual paid amounts)
-    total_paid = sum(
-        max(0, float(sale.paid_amount or 0) - float(sale.change_amount or 0)) 
-        for sale in sales
-    )
-    
-    data.append([
+        for index, amount in enumerate(amounts):
+            totals[index] += amount
+        chunk.append((
+            str(sn),
+            sale_date.strftime("%Y-%m-%d"),
+            safe_text(invoice_number[-8:], 8) if invoice_number else "N/A",
+            safe_text(customer_name or "Walk-in Customer", 20),
+            *[format_currency(amount, currency_symbol) for amount in amounts],
+            safe_text(sold_by, 15),
+        ))
+        if len(chunk) > DETAILED_CHUNK_ROWS:
+            table = Table(chunk, colWidths=DETAILED_COL_WIDTHS, repeatRows=1)
+            table.setStyle(table_style('detailed_body'))
+            yield table
+            chunk = [DETAILED_HEADERS]
+
+    if not sn:
+        yield Paragraph("No sales transactions found for the selected criteria.", styles()['normal'])
+        return
+
+    chunk.append((
         '', '', '', 'TOTALS:',
-        format_currency(total_gross, currency_symbol),
-        format_currency(total_discount, currency_symbol),
-        format_currency(total_tax, currency_symbol),
-        format_currency(total_net, currency_symbol),
-        format_currency(total_due, currency_symbol),
-        format_currency(total_paid, currency_symbol),  # This now shows actual total paid
-        ''
-    ])
-    
-    # Create table with appropriate column widths - ADJUSTED for removed column
-    col_widths = [0.3*inch, 0.6*inch, 0.8*inch, 1.0*inch, 0.8*inch, 0.7*inch, 0.6*inch, 0.8*inch, 0.7*inch, 0.7*inch, 0.9*inch]
-    
-    table = Table(data, colWidths=col_widths, repeatRows=1)
-    
-    # Define table style - UPDATED column ranges
-    style = TableStyle([
-        # Header row
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 6),
-        
-        # Data rows
-        ('BACKGROUND', (0, 1), (-1, -2), colors.HexColor('#ffffff')),
-        ('TEXTCOLOR', (0, 1), (-1, -2), colors.black),
-        ('FONTNAME', (0, 1), (-1, -2), FONT_NAME),
-        ('FONTSIZE', (0, 1), (-1, -2), 5.5),
-        ('ALIGN', (0, 1), (0, -2), 'CENTER'),  # S/N column
-        ('ALIGN', (4, 1), (9, -2), 'RIGHT'),   # Amount columns (updated range)
-        
-        # Totals row
-        ('BACKGROUND', (0, -1), (-1, -1), colors.HexColor('#34495e')),
-        ('TEXTCOLOR', (0, -1), (-1, -1), colors.whitesmoke),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, -1), (-1, -1), 6),
-        ('ALIGN', (4, -1), (9, -1), 'RIGHT'),  # Updated range for totals
-        
-        # Grid
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.HexColor('#bdc3c7')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ])
-    
-    table.setStyle(style)
-    return table
+        *[format_currency(amount, currency_symbol) for amount in totals],
+        '',
+    ))
+    table = Table(chunk, colWidths=DETAILED_COL_WIDTHS, repeatRows=1)
+    table.setStyle(table_style('detailed'))
+    yield table
+
 
 def create_pdf_response(pdf_content, filename):
     """Create HTTP response with PDF content"""
-    response = HttpResponse(content_type='application/pdf')
+    response = HttpResponse(pdf_content, content_type='application/pdf')
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    response.write(pdf_content)
-    return response
\ No newline at end of file
+    if isinstance(pdf_content, RenderedPdf):
+        response['X-PDF-Pages'] = str(pdf_content.pages)
+        response['X-PDF-Render-Time'] = f'{pdf_content.seconds:.3f}'
+    return response
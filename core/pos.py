@@ -0,0 +1,177 @@
+# core/pos.py
+"""
+POS checkout.
+
+``record_sale`` turns a checkout payload from the till into a Sale with its
+items, batch and stock updates. A payload may carry a client-generated
+``idempotency_key`` (stored on Sale with a unique index): a key that was
+already used returns the sale it created instead of recording it again, so a
+till can retry a checkout that timed out, or replay the sales it queued while
+offline, without creating duplicates.
+
+With ``PRERENDER_INVOICES`` on, the invoice PDF and receipt of a new sale are
+rendered as soon as it commits (see ``core/invoices.py``).
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import business_calendar
+from .invoices import prerender_after_commit
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+# Sales accepted in one offline sync request
+POS_SYNC_MAX_SALES = getattr(settings, 'POS_SYNC_MAX_SALES', 100)
+
+
+def _idempotency_key(data):
+    key = str(data.get('idempotency_key') or '').strip()
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise ValueError(f'idempotency_key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters')
+    return key or None
+
+
+def _sale_date(data):
+    """When the sale was rung up: the till's timestamp for queued sales, else now"""
+    value = data.get('sale_date')
+    if not value:
+        return timezone.now()
+    sale_date = parse_datetime(str(value))
+    if sale_date is None:
+        raise ValueError(f'Invalid sale_date: {value}')
+    if timezone.is_naive(sale_date):
+        sale_date = timezone.make_aware(sale_date)
+    return sale_date
+
+
+def _create_sale(data, user, idempotency_key):
+    from .models import Customer, Product, ProductBatch, Sale, SaleItem
+
+    sale_data = data.get('sale_data', [])
+    if not sale_data:
+        raise ValueError('No sale_data provided')
+
+    customer_name = data.get('customer_name', 'Walk-in Customer')
+    customer_phone = data.get('customer_phone', '')
+    customer_id = data.get('customer_id')
+
+    subtotal = Decimal(data.get('subtotal', 0))
+    discount_amount = Decimal(data.get('discount_amount', 0))
+    tax_amount = Decimal(data.get('tax_amount', 0))
+    total_amount = Decimal(data.get('total_amount', 0))
+    paid_amount = Decimal(data.get('paid_amount', 0))
+    change_amount = Decimal(data.get('change_amount', 0))
+    tax_percentage = Decimal(data.get('tax_percentage', 0))
+    discount_percentage = Decimal(data.get('discount_percentage', 0))
+
+    # Get customer instance if customer_id is provided
+    customer = None
+    if customer_id:
+        try:
+            customer = Customer.objects.get(id=customer_id)
+            # Use customer's actual name and phone
+            customer_name = customer.name
+            customer_phone = customer.phone
+        except Customer.DoesNotExist:
+            # Customer not found, proceed without customer link
+            pass
+
+    # Due sales need a registered customer
+    if paid_amount < total_amount and not customer:
+        raise ValueError('Due sales are only allowed for registered customers. Please register customer first.')
+
+    # Payment status is set in Sale.save()
+    sale = Sale.objects.create(
+        customer_name=customer_name,
+        customer_phone=customer_phone,
+        customer=customer,  # Link the customer (can be None for walk-in)
+        subtotal=subtotal,
+        discount_amount=discount_amount,
+        tax_amount=tax_amount,
+        total_amount=total_amount,
+        paid_amount=paid_amount,
+        change_amount=change_amount,
+        tax_percentage=tax_percentage,
+        discount_percentage=discount_percentage,
+        sold_by=user,
+        sale_date=_sale_date(data),
+        idempotency_key=idempotency_key,
+    )
+
+    # Preload products used in this sale to avoid N+1
+    product_ids = [int(item['product_id']) for item in sale_data if 'product_id' in item]
+    products_map = {p.id: p for p in Product.objects.filter(id__in=product_ids)}
+
+    for item in sale_data:
+        product = products_map.get(int(item['product_id']))
+        if not product:
+            raise ValueError(f"Product with id {item.get('product_id')} not found")
+
+        quantity = int(item.get('quantity', 0))
+        unit_price = Decimal(item.get('price', 0))
+        total_price = quantity * unit_price
+
+        sale_item = SaleItem(
+            sale=sale,
+            product=product,
+            quantity=quantity,
+            unit_price=unit_price,
+            total_price=total_price
+        )
+
+        # Handle batch tracking for products with expiry
+        if product.has_expiry:
+            # Earliest-expiring batch that still has stock
+            batch = ProductBatch.objects.filter(
+                product=product,
+                current_quantity__gt=0
+            ).exclude(
+                expiry_date__lt=business_calendar.today()  # Exclude expired
+            ).order_by('expiry_date').first()
+
+            if batch:
+                # Use the minimum of requested quantity and available batch quantity
+                batch_quantity = min(quantity, batch.current_quantity)
+                sale_item.batch = batch
+                batch.current_quantity -= batch_quantity
+                batch.save()
+
+        sale_item.save()
+
+        # Update product stock
+        product.current_stock = F('current_stock') - quantity
+        product.save()
+
+    return sale
+
+
+def record_sale(data, user):
+    """
+    Record one checkout. Returns ``(sale, created)``; ``created`` is False when
+    ``data['idempotency_key']`` was already used, in which case nothing is
+    written and the original sale is returned. Raises ``ValueError`` for an
+    invalid payload.
+    """
+    from .models import Sale
+
+    key = _idempotency_key(data)
+    if key:
+        existing = Sale.objects.filter(idempotency_key=key).first()
+        if existing:
+            return existing, False
+
+    try:
+        with transaction.atomic():
+            sale = _create_sale(data, user, key)
+            prerender_after_commit(sale.pk)
+            return sale, True
+    except IntegrityError:
+        # The same key committed by a concurrent retry
+        existing = Sale.objects.filter(idempotency_key=key).first() if key else None
+        if existing is None:
+            raise
+        return existing, False
@@ -0,0 +1,95 @@
+# core/reports.py
+"""
+Sales figures shared by the report pages and the sales report PDF.
+
+``sales_summary`` computes every total a sales report shows - gross, returns,
+net, subtotal, tax, discount, paid, due, transactions, items sold and items
+returned - in a single ``aggregate()``. Item and returned-item quantities are
+correlated subqueries per sale, so joining items never multiplies the sale
+amounts and no sale or return is loaded in Python.
+"""
+from decimal import Decimal
+
+from django.db.models import (
+    Count, DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, Value,
+)
+from django.db.models.functions import Coalesce, Greatest
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def by_id(sales):
+    """
+    ``sales`` re-selected by id. Filters across sale items make the report
+    querysets DISTINCT; selecting by id keeps DISTINCT from merging two sales
+    whose values happen to match, and drops their prefetches.
+    """
+    return sales.model.objects.filter(pk__in=sales.values('pk'))
+
+
+def due_expression():
+    """max(total - paid, 0), as ``Sale.remaining_due``"""
+    return Greatest(
+        ExpressionWrapper(F('total_amount') - F('paid_amount'), output_field=MONEY),
+        Value(0, output_field=MONEY),
+    )
+
+
+def actual_paid_expression():
+    """max(paid - change, 0): what the shop actually kept"""
+    return Greatest(
+        ExpressionWrapper(F('paid_amount') - F('change_amount'), output_field=MONEY),
+        Value(0, output_field=MONEY),
+    )
+
+
+def _quantity_per_sale(queryset, sale_field):
+    """Sum of ``quantity`` in ``queryset`` for the outer sale, 0 if none"""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{sale_field: OuterRef('pk')}).order_by().values(sale_field).annotate(
+                total=Sum('quantity'),
+            ).values('total')[:1],
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def sales_summary(sales):
+    """
+    Totals of a Sale queryset, from one query. Returned items count the
+    quantities of completed returns, like ``Sale.total_returned_quantity``.
+    """
+    from .models import SaleItem, SaleReturnItem
+
+    totals = by_id(sales).annotate(
+        item_quantity=_quantity_per_sale(SaleItem.objects.all(), 'sale'),
+        returned_quantity=_quantity_per_sale(
+            SaleReturnItem.objects.filter(sale_return__status='completed'), 'sale_return__sale',
+        ),
+    ).aggregate(
+        gross_sales=Sum('total_amount'),
+        total_returns=Sum('returned_amount'),
+        subtotal=Sum('subtotal'),
+        tax=Sum('tax_amount'),
+        discount=Sum('discount_amount'),
+        actual_paid=Sum(actual_paid_expression(), output_field=MONEY),
+        due=Sum(due_expression(), output_field=MONEY),
+        transactions=Count('id'),
+        items_sold=Sum('item_quantity'),
+        items_returned=Sum('returned_quantity'),
+    )
+
+    summary = {
+        key: value if value is not None else Decimal('0')
+        for key, value in totals.items()
+    }
+    summary['items_sold'] = totals['items_sold'] or 0
+    summary['items_returned'] = totals['items_returned'] or 0
+    summary['net_sales'] = summary['gross_sales'] - summary['total_returns']
+    summary['net_items_sold'] = summary['items_sold'] - summary['items_returned']
+    summary['average_sale'] = (
+        summary['net_sales'] / summary['transactions'] if summary['transactions'] else Decimal('0')
+    )
+    return summary
@@ -0,0 +1,296 @@
+# core/restore.py
+"""
+Restore for the backups written by ``core.backup``.
+
+Files are parsed as a stream - a dump is never read into memory - and:
+
+* consecutive single-row ``INSERT``s for the same table (the layout of the old
+  ``db_backup_*.sql`` files) are merged into multi-row statements;
+* foreign key and unique checks are off for the whole load;
+* secondary indexes and foreign keys are stripped from ``CREATE TABLE`` and
+  added back with one ``ALTER TABLE`` once the table's rows are in, which lets
+  InnoDB build each index in a single sorted pass;
+* the table files of a backup directory are loaded by a pool of worker
+  processes, each with its own connection.
+
+Every table file is checked against the manifest: the SHA-256 of the file
+content and the number of rows loaded must match what the backup recorded.
+"""
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.db import connection, connections
+
+from .backup import backup_chain, open_stream
+
+MAX_BATCH_ROWS = 1000
+MAX_BATCH_BYTES = 1024 * 1024
+
+_QUOTE_OR_ESCAPE = re.compile(rb"[\\']")
+_INSERT = re.compile(rb"\s*(INSERT|REPLACE) INTO (`[^`]+`)\s*(\([^)]*\))?\s*VALUES\s*")
+_SESSION_CHECKS = re.compile(rb"\s*SET (FOREIGN_KEY_CHECKS|UNIQUE_CHECKS)\s*=")
+_CREATE_TABLE = re.compile(rb"^CREATE TABLE `([^`]+)`", re.S)
+_DEFERRABLE = re.compile(rb"^\s*((UNIQUE |FULLTEXT |SPATIAL )?KEY|INDEX|CONSTRAINT `[^`]*` FOREIGN KEY) ")
+
+
+class _HashingReader:
+    """Iterates the lines of ``stream`` while hashing them"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.sha256 = hashlib.sha256()
+
+    def __iter__(self):
+        for line in self.stream:
+            self.sha256.update(line)
+            yield line
+
+
+def iter_statements(lines):
+    """
+    Yield the SQL statements in ``lines`` one at a time. Quotes are tracked so
+    a ``;`` or a raw newline inside a string value does not end a statement.
+    """
+    buffer = []
+    in_quote = False
+    escaped = False
+    for line in lines:
+        if not buffer and not in_quote and (line.startswith(b'--') or not line.strip()):
+            continue
+        buffer.append(line)
+
+        position = 0
+        if escaped:
+            position = 1
+            escaped = False
+        for match in _QUOTE_OR_ESCAPE.finditer(line, position):
+            start = match.start()
+            if start < position:
+                continue
+            if not in_quote:
+                if match.group() == b"'":
+                    in_quote = True
+                position = start + 1
+            elif match.group() == b'\\':
+                if start + 1 >= len(line):
+                    escaped = True
+                position = start + 2
+            elif line[start + 1:start + 2] == b"'":
+                position = start + 2  # doubled quote
+            else:
+                in_quote = False
+                position = start + 1
+
+        if not in_quote and line.rstrip().endswith(b';'):
+            yield b''.join(buffer)
+            buffer = []
+    if buffer and b''.join(buffer).strip():
+        yield b''.join(buffer)
+
+
+def _count_rows(values):
+    """Rows in the VALUES part of an INSERT written by core.backup (one row per line)"""
+    return values.count(b'\n(') + 1
+
+
+def split_deferred_indexes(create_sql):
+    """
+    Remove secondary indexes and foreign keys from a ``CREATE TABLE`` statement.
+    Returns ``(create_sql, alter_sql or None)``.
+    """
+    match = _CREATE_TABLE.match(create_sql)
+    if not match:
+        return create_sql, None
+
+    lines = create_sql.split(b'\n')
+    kept = []
+    deferred = []
+    for line in lines:
+        if _DEFERRABLE.match(line):
+            deferred.append(line.strip().rstrip(b','))
+        else:
+            kept.append(line)
+    if not deferred:
+        return create_sql, None
+
+    # The last column/primary key line before ")" must not end with a comma
+    for index in range(len(kept) - 1, -1, -1):
+        if kept[index].lstrip().startswith(b')'):
+            kept[index - 1] = kept[index - 1].rstrip().rstrip(b',')
+            break
+
+    alter = b'ALTER TABLE `' + match.group(1) + b'` ' + b', '.join(b'ADD ' + clause for clause in deferred)
+    return b'\n'.join(kept), alter
+
+
+class _Loader:
+    """Executes a statement stream, merging single-row inserts and deferring indexes"""
+
+    def __init__(self, cursor, defer_indexes=True):
+        self.cursor = cursor
+        self.defer_indexes = defer_indexes
+        self.rows = {}
+        self.pending_alter = []
+        self._prefix = None
+        self._values = []
+        self._values_bytes = 0
+        self._batch_rows = 0
+
+    def _flush(self):
+        if self._values:
+            self.cursor.execute(self._prefix + b' VALUES ' + b',\n'.join(self._values))
+            self._prefix = None
+            self._values = []
+            self._values_bytes = 0
+            self._batch_rows = 0
+
+    def _finish_table(self):
+        self._flush()
+        for alter in self.pending_alter:
+            self.cursor.execute(alter)
+        self.pending_alter = []
+
+    def execute(self, statement):
+        if _SESSION_CHECKS.match(statement):
+            return  # the loader keeps the checks off until the deferred indexes are back
+
+        match = _INSERT.match(statement)
+        if match:
+            verb, table, columns = match.groups()
+            values = statement[match.end():].rstrip().rstrip(b';')
+            prefix = verb + b' INTO ' + table + (b' ' + columns if columns else b'')
+            name = table.strip(b'`').decode()
+            rows = _count_rows(values)
+            self.rows[name] = self.rows.get(name, 0) + rows
+
+            if prefix != self._prefix or self._batch_rows >= MAX_BATCH_ROWS or self._values_bytes >= MAX_BATCH_BYTES:
+                self._flush()
+                self._prefix = prefix
+            self._values.append(values)
+            self._values_bytes += len(values)
+            self._batch_rows += rows
+            return
+
+        if statement.lstrip().startswith((b'DROP TABLE', b'CREATE TABLE')):
+            self._finish_table()
+        else:
+            self._flush()
+
+        if self.defer_indexes and statement.lstrip().startswith(b'CREATE TABLE'):
+            statement, alter = split_deferred_indexes(statement.strip().rstrip(b';'))
+            if alter:
+                self.pending_alter.append(alter)
+        self.cursor.execute(statement)
+
+    def close(self):
+        self._finish_table()
+
+
+def _load_file(path, compression, defer_indexes=True):
+    """Load one file on ``connection`` and return ``(rows per table, sha256)``"""
+    connection.ensure_connection()
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute("SET FOREIGN_KEY_CHECKS=0")
+        cursor.execute("SET UNIQUE_CHECKS=0")
+        loader = _Loader(cursor, defer_indexes)
+        with open_stream(path, compression, 'rb') as stream:
+            reader = _HashingReader(stream)
+            for statement in iter_statements(reader):
+                loader.execute(statement)
+        loader.close()
+        cursor.execute("SET UNIQUE_CHECKS=1")
+        cursor.execute("SET FOREIGN_KEY_CHECKS=1")
+    finally:
+        cursor.close()
+    return loader.rows, reader.sha256.hexdigest()
+
+
+def _restore_table_worker(table, path, compression, defer_indexes):
+    """Runs in a worker process"""
+    started = time.monotonic()
+    try:
+        rows, sha256 = _load_file(path, compression, defer_indexes)
+    finally:
+        connection.close()
+    return table, rows.get(table, 0), sha256, time.monotonic() - started
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _check(table, entry, rows, sha256, problems):
+    if entry.get('sha256') and sha256 != entry['sha256']:
+        problems.append(f'{table}: checksum mismatch')
+    if rows != entry['rows']:
+        problems.append(f"{table}: loaded {rows} rows, manifest says {entry['rows']}")
+
+
+def restore_directory(directory, manifest, workers=1, defer_indexes=True, verify=True, progress=None):
+    """Load every table file of one backup directory; returns a list of verification problems"""
+    tables = list(manifest['tables'].items())
+    problems = []
+
+    def finished(table, rows, sha256, seconds):
+        entry = manifest['tables'][table]
+        if verify:
+            _check(table, entry, rows, sha256, problems)
+        if progress:
+            progress(table, rows, entry['rows'], seconds)
+
+    if workers <= 1:
+        for table, entry in tables:
+            started = time.monotonic()
+            loaded, sha256 = _load_file(os.path.join(directory, entry['file']), manifest['compression'], defer_indexes)
+            finished(table, loaded.get(table, 0), sha256, time.monotonic() - started)
+    else:
+        # Children must not share the parent's socket
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            futures = [
+                pool.submit(
+                    _restore_table_worker, table, os.path.join(directory, entry['file']),
+                    manifest['compression'], defer_indexes,
+                )
+                for table, entry in sorted(tables, key=lambda item: -item[1].get('bytes', 0))
+            ]
+            for future in as_completed(futures):
+                finished(*future.result())
+
+    if verify and manifest['type'] == 'full':
+        with connection.cursor() as cursor:
+            for table, entry in tables:
+                cursor.execute(f"SELECT COUNT(*) FROM `{table}`")
+                count = cursor.fetchone()[0]
+                if count != entry['rows']:
+                    problems.append(f"{table}: table has {count} rows after restore, manifest says {entry['rows']}")
+    return problems
+
+
+def restore_backup(path, workers=1, defer_indexes=True, verify=True, progress=None):
+    """
+    Restore ``path``: a backup directory (with its base and earlier increments
+    replayed first) or an old single-file ``.sql``/``.sql.gz`` dump. Returns
+    the list of verification problems; empty means everything matched.
+    """
+    if os.path.isfile(path):
+        compression = 'gzip' if path.endswith('.gz') else 'none'
+        started = time.monotonic()
+        rows, _ = _load_file(path, compression, defer_indexes)
+        if progress:
+            for table, count in rows.items():
+                progress(table, count, None, time.monotonic() - started)
+        return []
+
+    problems = []
+    for directory, manifest in backup_chain(path):
+        def report(table, rows, expected, seconds, name=os.path.basename(directory)):
+            if progress:
+                progress(f'{name} {table}', rows, expected, seconds)
+        problems += restore_directory(directory, manifest, workers, defer_indexes, verify, report)
+    return problems
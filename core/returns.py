@@ -0,0 +1,373 @@
+# core/returns.py
+"""
+Stock side of purchase and sale returns.
+
+Completing a purchase return takes the returned units out of product stock and
+their batches; reverting a completed return puts them back. Completing a sale
+return puts the returned units back and, for an exchange, issues the exchange
+product. Every operation locks the affected products and batches up front,
+applies the deltas with one grouped UPDATE per table and inserts the
+StockMovement rows with ``bulk_create``, so the number of queries does not grow
+with the number of items.
+
+The functions that write must be called inside ``transaction.atomic()``.
+"""
+import uuid
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Case, When, Value, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import business_calendar
+from .expiry import invalidate_expiry_cache
+
+
+def _grouped_delta(totals):
+    """``Case`` yielding the per-row delta from ``{pk: quantity}``"""
+    return Case(
+        *[When(pk=pk, then=Value(quantity)) for pk, quantity in totals.items()],
+        default=Value(0),
+    )
+
+
+def _sum_by(rows, key):
+    totals = {}
+    for row in rows:
+        totals[row[key]] = totals.get(row[key], 0) + row['quantity']
+    return totals
+
+
+def _return_items(purchase_return):
+    return list(purchase_return.items.values(
+        'id', 'batch_id', 'quantity',
+        'purchase_order_item_id', 'purchase_order_item__product_id', 'purchase_order_item__expiry_date',
+    ).order_by('id'))
+
+
+def _lock_return(purchase_return):
+    """Lock the return row and give back its committed status"""
+    from .models import PurchaseReturn
+
+    return PurchaseReturn.objects.select_for_update().values_list('status', flat=True).get(pk=purchase_return.pk)
+
+
+def _refresh_supplier_bill(purchase_order):
+    """SupplierBill.save() recalculates due amount and status from the returns"""
+    from .models import SupplierBill
+
+    supplier_bill = SupplierBill.objects.filter(purchase_order=purchase_order).first()
+    if supplier_bill:
+        supplier_bill.save()
+    return supplier_bill
+
+
+def complete_purchase_return(purchase_return):
+    """
+    Take the returned quantities out of stock. Items without a batch are
+    skipped; batches that end up empty are deleted.
+    """
+    from .models import Product, ProductBatch, PurchaseReturnItem, StockMovement
+
+    if _lock_return(purchase_return) == 'completed':
+        raise ValidationError('This return has already been completed.')
+
+    items = [item for item in _return_items(purchase_return) if item['batch_id']]
+    for item in items:
+        item['product_id'] = item['purchase_order_item__product_id']
+
+    product_totals = _sum_by(items, 'product_id')
+    batch_totals = _sum_by(items, 'batch_id')
+
+    products = Product.objects.select_for_update().filter(pk__in=product_totals).in_bulk()
+    batches = ProductBatch.objects.select_for_update().filter(pk__in=batch_totals).in_bulk()
+
+    for product_id, quantity in product_totals.items():
+        product = products[product_id]
+        if product.current_stock < quantity:
+            raise ValidationError(
+                f'Cannot return {quantity} units. Only {product.current_stock} available for {product.name}.'
+            )
+    for batch_id, quantity in batch_totals.items():
+        batch = batches[batch_id]
+        if batch.current_quantity < quantity:
+            raise ValidationError(
+                f'Cannot return {quantity} units from batch {batch.batch_number}. '
+                f'Only {batch.current_quantity} available.'
+            )
+
+    emptied = [pk for pk, quantity in batch_totals.items() if batches[pk].current_quantity == quantity]
+    remaining = {pk: quantity for pk, quantity in batch_totals.items() if pk not in emptied}
+
+    if product_totals:
+        Product.objects.filter(pk__in=product_totals).update(
+            current_stock=F('current_stock') - _grouped_delta(product_totals)
+        )
+    if remaining:
+        ProductBatch.objects.filter(pk__in=remaining).update(
+            current_quantity=F('current_quantity') - _grouped_delta(remaining)
+        )
+
+    now = timezone.now()
+    StockMovement.objects.bulk_create([
+        StockMovement(
+            product_id=item['product_id'],
+            movement_type='return_out',
+            quantity=-item['quantity'],
+            batch_number=batches[item['batch_id']].batch_number,
+            reference_number=purchase_return.return_number,
+            notes=f"Purchase return completed - {purchase_return.return_number}",
+            movement_date=now,
+        )
+        for item in items
+    ], batch_size=500)
+
+    if emptied:
+        # Detach this return's items first - the FK cascades and would
+        # otherwise delete the items along with their empty batches
+        PurchaseReturnItem.objects.filter(
+            purchase_return=purchase_return, batch_id__in=emptied
+        ).update(batch=None)
+        ProductBatch.objects.filter(pk__in=emptied).delete()
+
+    purchase_order = purchase_return.purchase_order
+    if purchase_order.status != 'returned':
+        purchase_order.status = 'returned'
+        purchase_order.save()
+
+    _refresh_supplier_bill(purchase_order)
+    transaction.on_commit(invalidate_expiry_cache)
+
+
+def reverse_purchase_return(purchase_return):
+    """
+    Put the quantities of a completed return back into stock. Items whose
+    batch was deleted on completion get a RESTORED-... batch.
+    """
+    from .models import Product, ProductBatch, PurchaseReturnItem, StockMovement
+
+    if _lock_return(purchase_return) != 'completed':
+        raise ValidationError('Only a completed return can be reversed.')
+
+    items = _return_items(purchase_return)
+    for item in items:
+        item['product_id'] = item['purchase_order_item__product_id']
+
+    product_totals = _sum_by(items, 'product_id')
+    batch_totals = _sum_by([item for item in items if item['batch_id']], 'batch_id')
+
+    products = Product.objects.select_for_update().filter(pk__in=product_totals).in_bulk()
+    batches = ProductBatch.objects.select_for_update().filter(pk__in=batch_totals).in_bulk()
+
+    if product_totals:
+        Product.objects.filter(pk__in=product_totals).update(
+            current_stock=F('current_stock') + _grouped_delta(product_totals)
+        )
+    if batch_totals:
+        ProductBatch.objects.filter(pk__in=batch_totals).update(
+            current_quantity=F('current_quantity') + _grouped_delta(batch_totals)
+        )
+
+    # Recreate batches deleted when the return was completed
+    restored = {}
+    for item in items:
+        if item['batch_id']:
+            continue
+        product = products[item['product_id']]
+        restored[item['id']] = ProductBatch(
+            product_id=item['product_id'],
+            batch_number=f"RESTORED-{item['id']}-{uuid.uuid4().hex[:6].upper()}",
+            manufacture_date=business_calendar.today(),
+            expiry_date=item['purchase_order_item__expiry_date'] if product.has_expiry else None,
+            quantity=item['quantity'],
+            current_quantity=item['quantity'],
+            purchase_order_item_id=item['purchase_order_item_id'],
+        )
+    if restored:
+        ProductBatch.objects.bulk_create(restored.values())
+        # bulk_create does not return primary keys on MySQL, so look them up by batch number
+        restored_ids = dict(ProductBatch.objects.filter(
+            batch_number__in=[batch.batch_number for batch in restored.values()]
+        ).values_list('batch_number', 'id'))
+        relinked = []
+        for item_id, batch in restored.items():
+            relinked.append(PurchaseReturnItem(id=item_id, batch_id=restored_ids[batch.batch_number]))
+        PurchaseReturnItem.objects.bulk_update(relinked, ['batch'])
+
+    now = timezone.now()
+    StockMovement.objects.bulk_create([
+        StockMovement(
+            product_id=item['product_id'],
+            movement_type='return_in',
+            quantity=item['quantity'],
+            batch_number=(
+                batches[item['batch_id']].batch_number if item['batch_id'] else restored[item['id']].batch_number
+            ),
+            reference_number=purchase_return.return_number,
+            notes=f"Return status reversed from completed - {purchase_return.return_number}",
+            movement_date=now,
+        )
+        for item in items
+    ], batch_size=500)
+
+    purchase_order = purchase_return.purchase_order
+    purchase_order.status = 'completed'
+    purchase_order.save()
+
+    _refresh_supplier_bill(purchase_order)
+    transaction.on_commit(invalidate_expiry_cache)
+
+
+def sale_returned_quantities(sale_item_ids):
+    """``{sale_item_id: quantity already returned}`` in one grouped query"""
+    from .models import SaleReturnItem
+
+    rows = SaleReturnItem.objects.filter(sale_item_id__in=sale_item_ids).values('sale_item_id').annotate(
+        total=Sum('quantity')
+    ).order_by()
+    returned = {sale_item_id: 0 for sale_item_id in sale_item_ids}
+    for row in rows:
+        returned[row['sale_item_id']] = row['total'] or 0
+    return returned
+
+
+def sale_items_with_returns(sale):
+    """Items of ``sale`` annotated with ``returned_qty``, products and batches joined"""
+    return sale.items.select_related('product', 'batch').annotate(
+        returned_qty=Coalesce(Sum('returns__quantity'), 0)
+    )
+
+
+def create_sale_return_items(sale_return, items_data):
+    """
+    Create the SaleReturnItem rows of ``sale_return`` from the posted lines
+    (``sale_item_id``, ``quantity``, ``reason``, ``notes``) and return the
+    total refund. Raises ValidationError if a line does not belong to the sale
+    or asks for more than is left to return.
+    """
+    from .models import SaleItem, SaleReturnItem
+
+    sale_item_ids = [int(item['sale_item_id']) for item in items_data]
+    sale_items = SaleItem.objects.filter(
+        sale=sale_return.sale, id__in=sale_item_ids
+    ).select_related('product').in_bulk()
+    returned = sale_returned_quantities(sale_item_ids)
+
+    requested = {}
+    return_items = []
+    total_refund = Decimal('0')
+    for item_data in items_data:
+        sale_item = sale_items.get(int(item_data['sale_item_id']))
+        if sale_item is None:
+            raise ValidationError(f'Sale item not found: {item_data["sale_item_id"]}')
+
+        # The same line may be posted twice, so check the running total
+        requested[sale_item.id] = requested.get(sale_item.id, 0) + item_data['quantity']
+        if requested[sale_item.id] > sale_item.quantity - returned[sale_item.id]:
+            raise ValidationError(f'Return quantity for {sale_item.product.name} exceeds available quantity.')
+
+        total_price = item_data['quantity'] * sale_item.unit_price
+        return_items.append(SaleReturnItem(
+            sale_return=sale_return,
+            sale_item=sale_item,
+            quantity=item_data['quantity'],
+            unit_price=sale_item.unit_price,
+            total_price=total_price,
+            reason=item_data['reason'],
+            notes=item_data['notes'] or '',
+            batch_id=sale_item.batch_id,
+        ))
+        total_refund += total_price
+
+    SaleReturnItem.objects.bulk_create(return_items, batch_size=500)
+    return total_refund
+
+
+def complete_sale_return(sale_return):
+    """
+    Put the returned units back into stock and their batches. For a money
+    refund the refund is added to the sale's returned amount; for a product
+    exchange the exchange quantity is taken out of the exchange product.
+    """
+    from .models import Product, ProductBatch, Sale, SaleReturn, StockMovement
+
+    status = SaleReturn.objects.select_for_update().values_list('status', flat=True).get(pk=sale_return.pk)
+    if status != 'approved':
+        raise ValidationError('Only an approved return can be completed.')
+
+    items = list(sale_return.items.values(
+        'quantity', 'batch_id', 'batch__batch_number', 'sale_item__product_id'
+    ).order_by('id'))
+    for item in items:
+        item['product_id'] = item['sale_item__product_id']
+
+    product_deltas = _sum_by(items, 'product_id')
+    batch_totals = _sum_by([item for item in items if item['batch_id']], 'batch_id')
+
+    is_exchange = sale_return.return_type == 'product'
+    if is_exchange:
+        exchange_product_id = sale_return.exchange_product_id
+        exchange_quantity = sale_return.exchange_quantity
+        if not exchange_product_id or exchange_quantity <= 0:
+            raise ValidationError('Exchange product and quantity are required for product exchange!')
+
+    locked_ids = set(product_deltas)
+    if is_exchange:
+        locked_ids.add(exchange_product_id)
+    products = Product.objects.select_for_update().filter(pk__in=locked_ids).in_bulk()
+    list(ProductBatch.objects.select_for_update().filter(pk__in=batch_totals).values_list('pk', flat=True))
+
+    if is_exchange:
+        exchange_product = products[exchange_product_id]
+        if exchange_product.current_stock < exchange_quantity:
+            raise ValidationError(
+                f'Insufficient stock for exchange product! Available: {exchange_product.current_stock}'
+            )
+        product_deltas[exchange_product_id] = product_deltas.get(exchange_product_id, 0) - exchange_quantity
+
+    if product_deltas:
+        Product.objects.filter(pk__in=product_deltas).update(
+            current_stock=F('current_stock') + _grouped_delta(product_deltas)
+        )
+    if batch_totals:
+        ProductBatch.objects.filter(pk__in=batch_totals).update(
+            current_quantity=F('current_quantity') + _grouped_delta(batch_totals)
+        )
+
+    now = timezone.now()
+    notes = (
+        f"Sale return exchange - {sale_return.return_number}" if is_exchange
+        else f"Sale return completed - {sale_return.return_number}"
+    )
+    movements = [
+        StockMovement(
+            product_id=item['product_id'],
+            movement_type='return_in',
+            quantity=item['quantity'],
+            batch_number=item['batch__batch_number'] or '',
+            reference_number=sale_return.return_number,
+            notes=notes,
+            movement_date=now,
+        )
+        for item in items
+    ]
+    if is_exchange:
+        movements.append(StockMovement(
+            product_id=exchange_product_id,
+            movement_type='sale_out',
+            quantity=exchange_quantity,
+            reference_number=sale_return.return_number,
+            notes=f"Exchange for return - {sale_return.return_number}",
+            movement_date=now,
+        ))
+    StockMovement.objects.bulk_create(movements, batch_size=500)
+
+    if not is_exchange:
+        # Sale.save() also refreshes the customer's due amount
+        original_sale = Sale.objects.select_for_update().get(pk=sale_return.sale_id)
+        original_sale.returned_amount += sale_return.refund_amount
+        original_sale.save()
+
+    transaction.on_commit(invalidate_expiry_cache)
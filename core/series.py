@@ -0,0 +1,209 @@
+# core/series.py
+"""
+Time-bucketed series for the report charts.
+
+``series`` runs one ``GROUP BY`` query per call - the date field truncated
+with ``TruncHour``/``TruncDay``/``TruncWeek``/``TruncMonth``/``TruncYear`` in
+the shop's time zone - and fills the buckets without rows with zeros in
+Python, so a chart always gets one point per hour/day/week/month of the
+range. Ranges are whole trading days (see ``core/business_calendar.py``):
+``start`` and ``end`` are dates, both included; day and larger buckets follow
+trading days and hour buckets are local wall-clock hours.
+
+The charts of the daily sales, purchase, profit and due collection reports
+and the bill summary API use it, and ``/api/series/`` serves it as JSON.
+"""
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import (
+    Coalesce, Greatest, TruncDay, TruncHour, TruncMonth, TruncWeek, TruncYear,
+)
+from django.utils import timezone
+
+from .business_calendar import day_window, shop_timezone, trading_day_expression, trading_hours
+from .reports import MONEY, by_id
+
+BUCKETS = {
+    'hour': TruncHour,
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+# Largest number of points one call may return
+SERIES_MAX_POINTS = getattr(settings, 'SERIES_MAX_POINTS', 2000)
+
+
+def _net_cost():
+    """
+    Cost of what a sale kept after returns, per sale: for each item,
+    max(quantity - returned, 0) x the product's cost price, as ``Sale.get_net_cost``
+    """
+    from .models import SaleItem, SaleReturnItem
+
+    returned = Coalesce(
+        Subquery(
+            SaleReturnItem.objects.filter(sale_item=OuterRef('pk')).order_by().values('sale_item').annotate(
+                total=Sum('quantity'),
+            ).values('total')[:1],
+        ),
+        0,
+    )
+    item_cost = SaleItem.objects.filter(sale=OuterRef('pk')).annotate(
+        net_quantity=Greatest(F('quantity') - returned, 0),
+    ).order_by().values('sale').annotate(
+        total=Sum(ExpressionWrapper(F('net_quantity') * F('product__cost_price'), output_field=MONEY)),
+    ).values('total')[:1]
+    return Coalesce(Subquery(item_cost, output_field=MONEY), Value(0, output_field=MONEY))
+
+
+def _metric(name):
+    """``(queryset, date field, aggregates, view permission)`` of a metric"""
+    from .models import DuePayment, PurchaseOrder, Sale, SupplierBill
+
+    net_sales = Sum(F('total_amount') - F('returned_amount'), output_field=MONEY)
+    if name == 'sales':
+        return Sale.objects.all(), 'sale_date', {
+            'value': net_sales,
+            'gross': Sum('total_amount'),
+            'returns': Sum('returned_amount'),
+            'count': Count('id'),
+        }, 'daily_sale_report'
+    if name == 'profit':
+        return Sale.objects.annotate(net_cost=_net_cost()), 'sale_date', {
+            'value': Sum(F('total_amount') - F('returned_amount') - F('net_cost'), output_field=MONEY),
+            'revenue': net_sales,
+            'cost': Sum('net_cost'),
+            'count': Count('id'),
+        }, 'admin'
+    if name == 'purchases':
+        return PurchaseOrder.objects.all(), 'order_date', {
+            'value': Sum('total_amount'),
+            'count': Count('id'),
+        }, 'purchase_report'
+    if name == 'bills':
+        return SupplierBill.objects.all(), 'bill_date', {
+            'value': Sum('total_amount'),
+            'paid': Sum('paid_amount'),
+            'count': Count('id'),
+        }, None
+    if name == 'collections':
+        return DuePayment.objects.all(), 'payment_date', {
+            'value': Sum('amount'),
+            'count': Count('id'),
+        }, 'due_collection_report'
+    raise ValueError(f'Unknown metric: {name}')
+
+
+METRICS = ('sales', 'profit', 'purchases', 'bills', 'collections')
+
+
+def metric_permission(name):
+    """View code needed to read a metric; ``'admin'`` for admins only, None for any user"""
+    return _metric(name)[3]
+
+
+def bucket_start(value, bucket):
+    """Start of the bucket holding ``value`` (a date, or a naive local datetime for hours)"""
+    if bucket == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    if isinstance(value, datetime):
+        value = value.date()
+    if bucket == 'week':
+        return value - timedelta(days=value.weekday())
+    if bucket == 'month':
+        return value.replace(day=1)
+    if bucket == 'year':
+        return value.replace(month=1, day=1)
+    return value
+
+
+def _next(value, bucket):
+    if bucket == 'hour':
+        return value + timedelta(hours=1)
+    if bucket == 'day':
+        return value + timedelta(days=1)
+    if bucket == 'week':
+        return value + timedelta(days=7)
+    if bucket == 'month':
+        return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return value.replace(year=value.year + 1)
+
+
+def bucket_label(value, bucket):
+    if bucket == 'hour':
+        return value.strftime('%H:00')
+    if bucket == 'day':
+        return value.strftime('%b %d')
+    if bucket == 'week':
+        return f"Week {value.isocalendar()[1]}"
+    if bucket == 'month':
+        return value.strftime('%b %Y')
+    return str(value.year)
+
+
+def _buckets(start, end, bucket):
+    """Every bucket start from ``start`` to ``end`` (dates, inclusive)"""
+    if bucket == 'hour':
+        current, stop = trading_hours(start)[0], trading_hours(end)[-1] + timedelta(hours=1)
+    else:
+        current, stop = bucket_start(start, bucket), end + timedelta(days=1)
+    buckets = []
+    while current < stop:
+        buckets.append(current)
+        if len(buckets) > SERIES_MAX_POINTS:
+            raise ValueError(f'More than {SERIES_MAX_POINTS} points; use a larger bucket or a shorter range')
+        current = _next(current, bucket)
+    return buckets
+
+
+def series(metric, bucket, start, end, queryset=None):
+    """
+    One point per ``bucket`` from ``start`` to ``end`` (dates, inclusive):
+    ``{'bucket', 'label', 'value', ...}`` with the metric's aggregates, zero
+    where nothing happened. ``queryset`` narrows the metric's rows, e.g. to a
+    category. Raises ``ValueError`` for an unknown metric or bucket.
+    """
+    if bucket not in BUCKETS:
+        raise ValueError(f'Unknown bucket: {bucket}')
+    rows, field, aggregates, _ = _metric(metric)
+    if queryset is not None:
+        rows = rows.filter(pk__in=by_id(queryset).values('pk'))
+    buckets = _buckets(start, end, bucket)
+
+    tz = shop_timezone()
+    since, until = day_window(start, end)
+    grouped = rows.filter(**{
+        f'{field}__gte': since,
+        f'{field}__lt': until,
+    }).annotate(
+        series_bucket=BUCKETS[bucket](field if bucket == 'hour' else trading_day_expression(field), tzinfo=tz),
+    ).values('series_bucket').annotate(**aggregates).order_by('series_bucket')
+
+    found = {}
+    for row in grouped:
+        key = timezone.localtime(row.pop('series_bucket'), tz).replace(tzinfo=None)
+        found[key if bucket == 'hour' else key.date()] = row
+
+    zero = {name: 0 for name in aggregates}
+    points = []
+    for key in buckets:
+        values = found.get(key) or zero
+        points.append({
+            'bucket': key,
+            'label': bucket_label(key, bucket),
+            **{name: value or 0 for name, value in values.items()},
+        })
+    return points
+
+
+def parse_range(value, default):
+    """A ``YYYY-MM-DD`` query parameter as a date, or ``default`` when empty"""
+    if not value:
+        return default
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'Invalid date: {value}')
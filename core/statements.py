@@ -0,0 +1,361 @@
+# core/statements.py
+"""
+Customer statements.
+
+A statement is one chronological ledger of everything that moved a
+customer's balance:
+
+- a sale debits its total and credits what was paid at the counter (paid
+  minus change, minus what later due payments put on it);
+- a due payment credits its amount (its split across invoices is recorded
+  in ``DueAllocation``);
+- a completed return shows its refund as both a credit (goods back) and a
+  debit (cash paid out at the counter), so it does not move the balance, as
+  returns leave ``Customer.total_due`` alone.
+
+The three sources are merged with ``UNION ALL`` and the running balance is a
+``SUM(debit - credit) OVER (ORDER BY ...)`` window over the customer's whole
+history, so a page of the statement costs one query whatever its position,
+and the opening balance of a period comes from the same rows. Django cannot
+put a window over a union, so the outer query is SQL built around the
+querysets' own SQL, run on the database the router picks for reading sales
+(the replica inside a ``@read_only_db`` view).
+"""
+import csv
+import tempfile
+from collections import namedtuple
+from datetime import timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, router
+from django.http import FileResponse, StreamingHttpResponse
+from django.db.models import CharField, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, Spacer, Table
+
+from .business_calendar import day_start, local_time
+from .pdf_utils import format_currency, safe_text, styles, table_style, write_story
+from .reports import MONEY
+
+COLUMNS = ('entry_date', 'sort_order', 'entry_id', 'kind', 'reference', 'detail', 'debit', 'credit')
+# Same-moment entries: sale first, then payments, then returns
+SALE, PAYMENT, RETURN = 'sale', 'payment', 'return'
+ORDER = 'entry_date, sort_order, entry_id'
+CENT = Decimal('0.01')
+SHOP_NAME = getattr(settings, 'SHOP_NAME', 'Shop Management System')
+HEADERS = ('Date', 'Reference', 'Description', 'Debit', 'Credit', 'Balance')
+COL_WIDTHS = [1.2*inch, 1.3*inch, 1.9*inch, 0.9*inch, 0.9*inch, 1.0*inch]
+PDF_CHUNK_ROWS = 200
+
+StatementEntry = namedtuple('StatementEntry', 'date kind reference detail debit credit balance')
+
+
+def _sales(customer):
+    from .models import DueAllocation, Sale
+
+    allocated = Coalesce(
+        Subquery(
+            DueAllocation.objects.filter(sale=OuterRef('pk')).order_by().values('sale').annotate(
+                total=Sum('amount'),
+            ).values('total')[:1],
+            output_field=MONEY,
+        ),
+        Value(0, output_field=MONEY),
+    )
+    return Sale.objects.filter(customer=customer).annotate(
+        entry_date=F('sale_date'),
+        sort_order=Value(0, output_field=IntegerField()),
+        entry_id=F('pk'),
+        kind=Value(SALE, output_field=CharField()),
+        reference=F('invoice_number'),
+        detail=Value('', output_field=CharField()),
+        debit=F('total_amount'),
+        credit=Greatest(
+            F('paid_amount') - F('change_amount') - allocated,
+            Value(0, output_field=MONEY),
+            output_field=MONEY,
+        ),
+    )
+
+
+def _payments(customer):
+    from .models import DuePayment
+
+    return DuePayment.objects.filter(customer=customer).annotate(
+        entry_date=F('payment_date'),
+        sort_order=Value(1, output_field=IntegerField()),
+        entry_id=F('pk'),
+        kind=Value(PAYMENT, output_field=CharField()),
+        reference=F('reference_number'),
+        detail=F('payment_method'),
+        debit=Value(0, output_field=MONEY),
+        credit=F('amount'),
+    )
+
+
+def _returns(customer):
+    from .models import SaleReturn
+
+    return SaleReturn.objects.filter(sale__customer=customer, status='completed').annotate(
+        entry_date=F('return_date'),
+        sort_order=Value(2, output_field=IntegerField()),
+        entry_id=F('pk'),
+        kind=Value(RETURN, output_field=CharField()),
+        reference=F('return_number'),
+        detail=F('sale__invoice_number'),
+        debit=F('refund_amount'),
+        credit=F('refund_amount'),
+    )
+
+
+def _ledger_sql(customer, alias):
+    """``(sql, params)`` of the customer's entries with ``COLUMNS`` on ``alias``, unordered"""
+    parts, params = [], []
+    for queryset in (_sales(customer), _payments(customer), _returns(customer)):
+        query = queryset.using(alias).order_by().values(*COLUMNS).query
+        sql, part_params = query.get_compiler(using=alias).as_sql()
+        # Select by name: the column order of values() is not guaranteed
+        parts.append(f"SELECT {', '.join(COLUMNS)} FROM ({sql}) part")
+        params.extend(part_params)
+    return ' UNION ALL '.join(parts), params
+
+
+def _datetime_param(connection, value):
+    return connection.ops.adapt_datetimefield_value(value)
+
+
+def _money(value):
+    # SQLite hands back floats from arithmetic on decimal columns
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+def _aware(value):
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if timezone.is_naive(value):
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return value
+
+
+class Statement:
+    """
+    The ledger of ``customer`` for trading days ``start`` to ``end`` (dates,
+    inclusive; ``None`` for open-ended). Slicing returns ``StatementEntry``
+    tuples with the running balance, so a Statement can be handed to a
+    ``Paginator``; iterating reads the whole period in chunks.
+    """
+    chunk_size = 500
+
+    def __init__(self, customer, start=None, end=None):
+        from .models import Sale
+
+        self.customer = customer
+        # Resolved once, so every query of the statement reads the same database
+        self.alias = router.db_for_read(Sale)
+        self.start = start
+        self.end = end
+        self.since = day_start(start) if start else None
+        self.until = day_start(end + timedelta(days=1)) if end else None
+        self._count = None
+        self._summary = None
+
+    @property
+    def connection(self):
+        return connections[self.alias]
+
+    def _period(self):
+        """``(where, params)`` limiting the entries to the period"""
+        conditions, params = [], []
+        if self.since:
+            conditions.append('entry_date >= %s')
+            params.append(_datetime_param(self.connection, self.since))
+        if self.until:
+            conditions.append('entry_date < %s')
+            params.append(_datetime_param(self.connection, self.until))
+        return ' AND '.join(conditions) or '1 = 1', params
+
+    def count(self):
+        if self._count is None:
+            ledger, params = _ledger_sql(self.customer, self.alias)
+            where, period_params = self._period()
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"SELECT COUNT(*) FROM ({ledger}) ledger WHERE {where}", params + period_params)
+                self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def entries(self, offset=0, limit=None):
+        """The period's entries from ``offset``, in order, with running balances"""
+        ledger, params = _ledger_sql(self.customer, self.alias)
+        where, period_params = self._period()
+        limit = self.count() if limit is None else limit
+        sql = (
+            f"SELECT entry_date, kind, reference, detail, debit, credit, balance FROM ("
+            f"SELECT {', '.join(COLUMNS)}, SUM(debit - credit) OVER (ORDER BY {ORDER}) AS balance "
+            f"FROM ({ledger}) ledger"
+            f") statement WHERE {where} ORDER BY {ORDER} LIMIT %s OFFSET %s"
+        )
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params + period_params + [limit, offset])
+            rows = cursor.fetchall()
+        return [
+            StatementEntry(
+                local_time(_aware(entry_date)), kind, reference or '', detail or '',
+                _money(debit), _money(credit), _money(balance),
+            )
+            for entry_date, kind, reference, detail, debit, credit, balance in rows
+        ]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(self.count())
+            return self.entries(start, max(stop - start, 0))
+        entries = self.entries(index, 1)
+        if not entries:
+            raise IndexError('Statement index out of range')
+        return entries[0]
+
+    def __iter__(self):
+        for offset in range(0, self.count(), self.chunk_size):
+            yield from self.entries(offset, self.chunk_size)
+
+    def summary(self):
+        """Opening balance, period debits and credits and closing balance, from one query"""
+        if self._summary is None:
+            ledger, params = _ledger_sql(self.customer, self.alias)
+            before = '1 = 0'
+            before_params = []
+            if self.since:
+                before, before_params = 'entry_date < %s', [_datetime_param(self.connection, self.since)]
+            where, period_params = self._period()
+            sql = (
+                f"SELECT "
+                f"SUM(CASE WHEN {before} THEN debit - credit ELSE 0 END), "
+                f"SUM(CASE WHEN {where} THEN debit ELSE 0 END), "
+                f"SUM(CASE WHEN {where} THEN credit ELSE 0 END) "
+                f"FROM ({ledger}) ledger"
+            )
+            with self.connection.cursor() as cursor:
+                # Placeholders in SQL order: the three CASEs, then the ledger in FROM
+                cursor.execute(sql, before_params + period_params + period_params + params)
+                opening, debits, credits = (_money(value) for value in cursor.fetchone())
+            self._summary = {
+                'opening_balance': opening,
+                'debits': debits,
+                'credits': credits,
+                'closing_balance': opening + debits - credits,
+            }
+        return self._summary
+
+
+def describe(entry):
+    """One-line description of a ``StatementEntry``"""
+    if entry.kind == SALE:
+        return 'Sale'
+    if entry.kind == PAYMENT:
+        from .models import DuePayment
+
+        method = dict(DuePayment.PAYMENT_METHODS).get(entry.detail, entry.detail)
+        return f"Due payment ({method})" if method else 'Due payment'
+    return f"Return on {entry.detail}, refunded"
+
+
+def _period_label(statement):
+    if statement.start and statement.end:
+        return f"{statement.start:%b %d, %Y} - {statement.end:%b %d, %Y}"
+    if statement.start:
+        return f"From {statement.start:%b %d, %Y}"
+    if statement.end:
+        return f"Up to {statement.end:%b %d, %Y}"
+    return 'All transactions'
+
+
+class _Echo:
+    """File-like object handing each written CSV line back to the writer's caller"""
+
+    def write(self, value):
+        return value
+
+
+def statement_csv_response(statement, filename):
+    """The statement as CSV, streamed chunk by chunk"""
+    def rows():
+        writer = csv.writer(_Echo())
+        summary = statement.summary()
+        yield writer.writerow(HEADERS)
+        yield writer.writerow(['', '', 'Opening balance', '', '', summary['opening_balance']])
+        for entry in statement:
+            yield writer.writerow([
+                entry.date.strftime('%Y-%m-%d %H:%M'), entry.reference, describe(entry),
+                entry.debit, entry.credit, entry.balance,
+            ])
+        yield writer.writerow(['', '', 'Closing balance', summary['debits'], summary['credits'], summary['closing_balance']])
+
+    response = StreamingHttpResponse(rows(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def _entry_tables(statement):
+    """The entries as tables of ``PDF_CHUNK_ROWS`` rows, read as ReportLab lays them out"""
+    rows = []
+    for entry in statement:
+        rows.append((
+            entry.date.strftime('%Y-%m-%d %H:%M'),
+            safe_text(entry.reference, 20),
+            safe_text(describe(entry), 32),
+            format_currency(entry.debit) if entry.debit else '',
+            format_currency(entry.credit) if entry.credit else '',
+            format_currency(entry.balance),
+        ))
+        if len(rows) == PDF_CHUNK_ROWS:
+            yield _entry_table(rows)
+            rows = []
+    if rows:
+        yield _entry_table(rows)
+
+
+def _entry_table(rows):
+    table = Table([HEADERS] + rows, colWidths=COL_WIDTHS, repeatRows=1)
+    table.setStyle(table_style('statement'))
+    return table
+
+
+def statement_pdf_response(statement, filename):
+    """
+    Render the statement into a temporary file and stream it back; the
+    entries are read in chunks while the pages are laid out
+    """
+    style = styles()
+    customer = statement.customer
+    summary = statement.summary()
+    story = [
+        Paragraph(SHOP_NAME, style['company']),
+        Paragraph('Customer Statement', style['title']),
+        Paragraph(f"{safe_text(customer.name, 60)} ({customer.phone}) - {_period_label(statement)}", style['info']),
+        Spacer(1, 8),
+    ]
+    totals = Table([
+        ('Opening balance', format_currency(summary['opening_balance'])),
+        ('Debits', format_currency(summary['debits'])),
+        ('Credits', format_currency(summary['credits'])),
+        ('Closing balance', format_currency(summary['closing_balance'])),
+    ], colWidths=[1.5*inch, 1.3*inch], hAlign='LEFT')
+    totals.setStyle(table_style('invoice_totals'))
+    story += [totals, Spacer(1, 12)]
+
+    output = tempfile.TemporaryFile(suffix='.pdf')
+    stats = write_story(
+        story, output, f"Statement of {customer.name}", f"Statement {customer.name}",
+        tail=_entry_tables(statement),
+    )
+    output.seek(0)
+    response = FileResponse(output, as_attachment=True, filename=filename, content_type='application/pdf')
+    response['X-PDF-Pages'] = str(stats.pages)
+    return response
@@ -1,3 +1,4 @@
+import builtins
 from django import template
 
 register = template.Library()
@@ -6,7 +7,7 @@ register = template.Library()
 def abs(value):
     """Return the absolute value of the number."""
     try:
-        return abs(value)
+        return builtins.abs(value)
     except (TypeError, ValueError):
         return value
     
@@ -1,3 +1,258 @@
+import csv
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db.models import Sum
 from django.test import TestCase
+from django.urls import reverse
+
+from . import cache as cache_helper
+from .aging import AGING_NAMESPACE
+from . import business_calendar
+from .business_calendar import day_start
+from .dues import allocate_due_payment
+from .models import Category, Customer, DueAllocation, DuePayment, Product, ProductBatch, Sale, SaleReturn
+from .statements import Statement, statement_csv_response
+
+
+class DueTestMixin:
+    def setUp(self):
+        self.user = User.objects.create_user('cashier', password='test')
+        self.customer = Customer.objects.create(name='Due Customer', phone='01700000000')
+
+    def make_sale(self, number, total, paid='0', day=date(2025, 1, 1), hour=10):
+        return Sale.objects.create(
+            invoice_number=f'T{number:03d}',
+            customer=self.customer,
+            customer_name=self.customer.name,
+            total_amount=Decimal(total),
+            paid_amount=Decimal(paid),
+            sold_by=self.user,
+            sale_date=day_start(day) + timedelta(hours=hour),
+        )
+
+    def pay(self, amount, **kwargs):
+        return allocate_due_payment(self.customer, Decimal(amount), self.user, **kwargs)
+
+
+class AllocateDuePaymentTests(DueTestMixin, TestCase):
+    def test_partial_payment_runs_oldest_first(self):
+        first = self.make_sale(1, '100', day=date(2025, 1, 1))
+        second = self.make_sale(2, '50', paid='20', day=date(2025, 1, 2))
+        third = self.make_sale(3, '80', day=date(2025, 1, 3))
+
+        payment = self.pay('120')
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual(first.paid_amount, Decimal('100'))
+        self.assertEqual(first.payment_status, 'paid')
+        self.assertEqual(second.paid_amount, Decimal('40'))
+        self.assertEqual(second.payment_status, 'partial')
+        self.assertEqual(third.paid_amount, Decimal('0'))
+        self.assertEqual(third.payment_status, 'due')
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.total_due, Decimal('90'))
+        self.assertEqual(
+            sorted(payment.allocations.values_list('sale__invoice_number', 'amount')),
+            [('T001', Decimal('100')), ('T002', Decimal('20'))],
+        )
+        self.assertEqual([detail['allocated_amount'] for detail in payment.allocated_details], [100.0, 20.0])
+
+    def test_exact_payment_clears_every_invoice(self):
+        self.make_sale(1, '100')
+        self.make_sale(2, '50', paid='20', day=date(2025, 1, 2))
+
+        payment = self.pay('130')
+
+        self.assertFalse(Sale.objects.exclude(payment_status='paid').exists())
+        self.assertFalse(Sale.objects.exclude(change_amount=0).exists())
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.total_due, Decimal('0'))
+        self.assertEqual(payment.allocations.aggregate(total=Sum('amount'))['total'], Decimal('130'))
+
+    def test_over_payment_is_rejected(self):
+        sale = self.make_sale(1, '100')
+
+        with self.assertRaises(ValueError):
+            self.pay('150')
+
+        sale.refresh_from_db()
+        self.assertEqual(sale.paid_amount, Decimal('0'))
+        self.assertFalse(DuePayment.objects.exists())
+        self.assertFalse(DueAllocation.objects.exists())
+
+    def test_non_positive_payment_is_rejected(self):
+        self.make_sale(1, '100')
+
+        with self.assertRaises(ValueError):
+            self.pay('0')
+
+    def test_over_payment_kept_as_advance(self):
+        self.make_sale(1, '100')
+
+        payment = self.pay('150', allow_advance=True)
+
+        self.assertEqual(payment.amount, Decimal('150'))
+        self.assertEqual(Sale.objects.get().payment_status, 'paid')
+        self.assertEqual(list(payment.allocations.values_list('amount', flat=True)), [Decimal('100')])
+        self.assertEqual(payment.allocated_details[-1]['invoice_number'], 'ADVANCE')
+        self.assertEqual(payment.allocated_details[-1]['allocated_amount'], 50.0)
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.total_due, Decimal('0'))
+
+    def test_query_count_does_not_grow_with_invoices(self):
+        for invoices in (3, 30):
+            Sale.objects.all().delete()
+            for number in range(invoices):
+                self.make_sale(number, '10', day=date(2025, 1, 1) + timedelta(days=number))
+            self.customer.update_due_amount()
+            with self.assertNumQueries(10):
+                self.pay(str(10 * invoices))
+            self.assertFalse(Sale.objects.exclude(payment_status='paid').exists())
+
+
+class StatementTests(DueTestMixin, TestCase):
+    def balances(self, entries):
+        return [entry.balance for entry in entries]
+
+    def test_running_balance_matches_total_due(self):
+        self.make_sale(1, '100', paid='30', day=date(2025, 1, 1))
+        self.make_sale(2, '50', day=date(2025, 1, 10))
+        self.pay('80')
+
+        statement = Statement(self.customer)
+        entries = list(statement)
+
+        self.customer.refresh_from_db()
+        self.assertEqual(self.customer.total_due, Decimal('40'))
+        self.assertEqual([entry.kind for entry in entries], ['sale', 'sale', 'payment'])
+        # The paid-off invoices keep only what was paid at the counter as their credit
+        self.assertEqual([entry.credit for entry in entries], [Decimal('30.00'), Decimal('0.00'), Decimal('80.00')])
+        self.assertEqual(self.balances(entries), [Decimal('70.00'), Decimal('120.00'), Decimal('40.00')])
+        self.assertEqual(entries[-1].balance, self.customer.total_due)
+        self.assertEqual(statement.summary(), {
+            'opening_balance': Decimal('0.00'),
+            'debits': Decimal('150.00'),
+            'credits': Decimal('110.00'),
+            'closing_balance': self.customer.total_due,
+        })
+
+    def test_period_starts_from_opening_balance(self):
+        self.make_sale(1, '100', paid='30', day=date(2025, 1, 1))
+        self.make_sale(2, '50', day=date(2025, 1, 10))
+        self.make_sale(3, '40', day=date(2025, 1, 20))
+        payment = self.pay('20')
+        DuePayment.objects.filter(pk=payment.pk).update(payment_date=day_start(date(2025, 1, 12)))
+
+        statement = Statement(self.customer, start=date(2025, 1, 5), end=date(2025, 1, 15))
+        entries = list(statement)
+
+        self.assertEqual(len(statement), 2)
+        self.assertEqual([entry.reference for entry in entries], ['T002', ''])
+        self.assertEqual(self.balances(entries), [Decimal('120.00'), Decimal('100.00')])
+        self.assertEqual(statement.summary(), {
+            'opening_balance': Decimal('70.00'),
+            'debits': Decimal('50.00'),
+            'credits': Decimal('20.00'),
+            'closing_balance': Decimal('100.00'),
+        })
+
+    def test_completed_return_leaves_balance_alone(self):
+        sale = self.make_sale(1, '100', paid='100')
+        for status in ('completed', 'pending'):
+            SaleReturn.objects.create(
+                return_number=f'SR-{status}', sale=sale, reason='defective', return_type='money',
+                refund_amount=Decimal('25'), status=status, return_date=sale.sale_date + timedelta(hours=1),
+            )
+
+        entries = list(Statement(self.customer))
+
+        self.assertEqual([entry.kind for entry in entries], ['sale', 'return'])
+        self.assertEqual((entries[1].debit, entries[1].credit), (Decimal('25.00'), Decimal('25.00')))
+        self.assertEqual(self.balances(entries), [Decimal('0.00'), Decimal('0.00')])
+
+    def test_slicing_and_pagination(self):
+        for number in range(7):
+            self.make_sale(number, '10', day=date(2025, 1, 1) + timedelta(days=number))
+        statement = Statement(self.customer)
+        statement.chunk_size = 2
+
+        page = Paginator(statement, 3).page(2)
+
+        self.assertEqual(page.paginator.num_pages, 3)
+        self.assertEqual(self.balances(page), [Decimal('40.00'), Decimal('50.00'), Decimal('60.00')])
+        self.assertEqual(statement[5].balance, Decimal('60.00'))
+        self.assertEqual([entry.reference for entry in statement[2:4]], ['T002', 'T003'])
+        self.assertEqual(statement[10:], [])
+        self.assertEqual(list(statement), statement.entries())
+        with self.assertRaises(IndexError):
+            statement[7]
+
+    def test_csv_export(self):
+        self.make_sale(1, '100', paid='30', day=date(2025, 1, 1))
+        self.make_sale(2, '50', day=date(2025, 1, 10))
+        statement = Statement(self.customer, start=date(2025, 1, 5))
+
+        response = statement_csv_response(statement, 'statement.csv')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="statement.csv"')
+        self.assertEqual(rows[0], ['Date', 'Reference', 'Description', 'Debit', 'Credit', 'Balance'])
+        self.assertEqual(rows[1], ['', '', 'Opening balance', '', '', '70.00'])
+        self.assertEqual(rows[2][1:], ['T002', 'Sale', '50.00', '0.00', '120.00'])
+        self.assertEqual(rows[3], ['', '', 'Closing balance', '50.00', '0.00', '120.00'])
+        self.assertEqual(len(rows), 4)
+
+
+class AgingCacheTests(DueTestMixin, TestCase):
+    def test_report_is_dropped_on_commit(self):
+        version = cache_helper.get_version(AGING_NAMESPACE)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.make_sale(1, '100')
+            self.assertEqual(cache_helper.get_version(AGING_NAMESPACE), version)
+
+        self.assertTrue(callbacks)
+        self.assertNotEqual(cache_helper.get_version(AGING_NAMESPACE), version)
+
+
+class ExpiryReportTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='test'))
+        product = Product.objects.create(
+            name='Milk', category=Category.objects.create(name='Dairy'), sku='MILK',
+            cost_price=Decimal('10'), selling_price=Decimal('12'), has_expiry=True, expiry_warning_days=30,
+        )
+        today = business_calendar.today()
+        for number, days in enumerate((-1, 5, 20, 60)):
+            ProductBatch.objects.create(
+                product=product, batch_number=f'B{number}', quantity=1,
+                expiry_date=today + timedelta(days=days),
+            )
+
+    def report(self, **params):
+        return self.client.get(reverse('expiry_report'), params).context
+
+    def test_tiles_follow_the_product_threshold(self):
+        context = self.report()
+
+        self.assertEqual(len(context['batches']), 2)
+        self.assertEqual(context['total_near_expiry'], 2)
+        self.assertEqual(context['total_value_near_expiry'], Decimal('20'))
+        self.assertEqual(context['total_expired'], 1)
+        self.assertEqual(context['total_good'], 1)
+
+    def test_tiles_follow_the_days_window(self):
+        context = self.report(days=10)
 
-# Create your tests here.
+        self.assertEqual([batch.batch_number for batch in context['batches']], ['B1'])
+        self.assertEqual(context['total_near_expiry'], 1)
+        self.assertEqual(context['total_value_near_expiry'], Decimal('10'))
+        self.assertEqual(context['total_expired'], 1)
+        self.assertEqual(context['total_good'], 2)
+        self.assertEqual(len(self.report(days=10, include_expired='on')['batches']), 2)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 
 urlpatterns = [
     # Dashboard
@@ -14,7 +14,10 @@ urlpatterns = [
     
     # POS & Sales
     path('pos/', views.pos_sale, name='pos_sale'),
+    path('pos/sync/', views.pos_sync, name='pos_sync'),
     path('invoice/<str:invoice_number>/', views.generate_invoice, name='generate_invoice'),
+    path('invoice/<str:invoice_number>/pdf/', views.invoice_pdf, name='invoice_pdf'),
+    path('invoice/<str:invoice_number>/receipt/', views.invoice_receipt, name='invoice_receipt'),
     
     # Purchase Orders
     path('purchase-order/create/', views.purchase_order_create, name='purchase_order_create'),
@@ -36,6 +39,9 @@ urlpatterns = [
     path('supplier-bills/<int:bill_id>/create-payment/', views.create_payment, name='create_payment'),
     path('bill-dashboard/', views.bill_dashboard, name='bill_dashboard'),
     path('api/bill-summary/', views.bill_summary_api, name='bill_summary_api'),
+    path('api/series/', views.series_api, name='series_api'),
+    path('aging/<str:kind>/', views.aging_report, name='aging_report'),
+    path('api/aging/<str:kind>/', views.aging_api, name='aging_api'),
     
 
 
@@ -51,7 +57,7 @@ urlpatterns = [
     
     # API endpoints
     path('api/po-items/<int:po_id>/', views.get_po_items, name='get_po_items'),
-    path('api/batches/<int:product_id>/', views.get_batches_for_product, name='get_batches_for_product'),
+    path('api/batches/<int:product_id>/', async_views.get_batches_for_product, name='get_batches_for_product'),
     path('get-batches-for-po-item/<int:po_item_id>/', views.get_batches_for_po_item, name='get_batches_for_po_item'),
     # Sale Return URLs
     path('sale-returns/', views.sale_return_list, name='sale_return_list'),
@@ -65,23 +71,25 @@ urlpatterns = [
     path('generate-sales-report/', views.generate_sales_report, name='generate_sales_report'),
     path('products/<int:pk>/edit/', views.product_edit, name='product_edit'),
     path('products/<int:pk>/delete/', views.product_delete, name='product_delete'),
-    path('api/search-product/', views.search_product_by_barcode, name='search_product_by_barcode'),
-    path('search-customer/', views.search_customer, name='search_customer'),
-    path('get-customer-due-details/<int:customer_id>/', views.get_customer_due_details, name='get_customer_due_details'),
+    path('api/search-product/', async_views.search_product_by_barcode, name='search_product_by_barcode'),
+    path('api/products/lookup/', async_views.batch_lookup, name='batch_lookup'),
+    path('search-customer/', async_views.search_customer, name='search_customer'),
+    path('get-customer-due-details/<int:customer_id>/', async_views.get_customer_due_details, name='get_customer_due_details'),
     path('make-due-payment/', views.make_due_payment, name='make_due_payment'),
      # Customer Due Reports
     path('customer-due-report/', views.customer_due_report, name='customer_due_report'),
     path('due-collection-report/', views.due_collection_report, name='due_collection_report'),
     path('process-due-payment/', views.process_due_payment, name='process_due_payment'),
-    path('get-customer-due-details/<int:customer_id>/', views.get_customer_due_details, name='get_customer_due_details'),
+    path('get-customer-due-details/<int:customer_id>/', async_views.get_customer_due_details, name='get_customer_due_details'),
+    path('customer-statement/<int:customer_id>/', views.customer_statement, name='customer_statement'),
     path('debug-customer-due/<int:customer_id>/', views.debug_customer_due, name='debug_customer_due'),
     path('force-update-customer-due/<int:customer_id>/', views.force_update_customer_due, name='force_update_customer_due'),
     path('refresh-all-due-amounts/', views.refresh_all_due_amounts, name='refresh_all_due_amounts'),
     path('force-update-all-due-amounts/', views.force_update_all_due_amounts, name='force_update_all_due_amounts'),
-    path('get-product-details/', views.get_product_details, name='get_product_details'),
-    path('api/categories/search/', views.search_categories, name='search_categories'),
+    path('get-product-details/', async_views.get_product_details, name='get_product_details'),
+    path('api/categories/search/', async_views.search_categories, name='search_categories'),
     path('api/categories/create/', views.create_category, name='create_category'),
-    path('api/suppliers/search/', views.search_suppliers, name='search_suppliers'),
+    path('api/suppliers/search/', async_views.search_suppliers, name='search_suppliers'),
     path('api/suppliers/create/', views.create_supplier, name='create_supplier'),
     path('users/', views.user_management, name='user_management'),
     path('users/create/', views.create_user, name='create_user'),
@@ -14,11 +14,29 @@ from .models import *
 from .forms import *
 from django.db.models.functions import Coalesce
 from decimal import Decimal, InvalidOperation
-from .pdf_utils import generate_sales_report_pdf, create_pdf_response
-from django.http import HttpResponse
+from .pdf_utils import sales_report_pdf_response
+from .reports import sales_summary
+from .series import metric_permission, parse_range, series
+from . import business_calendar
+from .business_calendar import day_filter, since_filter, until_filter
+from django.http import Http404, HttpResponse, HttpResponseForbidden
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from .decorators import admin_required, view_permission_required
+from .decorators import admin_required, view_permission_required, read_only_db, can_access_view, is_admin_user
+from .dashboard import get_dashboard_metrics, low_stock_page
+from .pos import POS_SYNC_MAX_SALES, record_sale
+from .invoices import PDF, RECEIPT, invoice_file_response
+from .dues import allocate_due_payment
+from . import aging
+from .statements import Statement, describe, statement_csv_response, statement_pdf_response
+from .returns import (
+    complete_purchase_return, reverse_purchase_return, complete_sale_return,
+    create_sale_return_items, sale_items_with_returns,
+)
+from .expiry import (
+    EXPIRED, NEAR_EXPIRY, GOOD, batches_in_bucket, bucket_expression,
+    classify_batches, get_expiry_summary, write_off_expired_batches,
+)
 
 
 
@@ -27,57 +45,11 @@ def role_required(role):
 
 @login_required
 def dashboard(request):
-    today = timezone.now().date()
-    
-    # FIXED: Use total_amount instead of net_amount for database queries
-    daily_stats = Sale.objects.filter(sale_date__date=today).aggregate(
-        total_sales=Sum('total_amount'),  # Use total_amount, not net_amount
-        total_transactions=Count('id')
-    )
-    
-    # Calculate net sales manually
-    daily_net_sales = Sale.objects.filter(sale_date__date=today).aggregate(
-        net_sales=Sum(F('total_amount') - F('returned_amount'))
-    )['net_sales'] or 0
-
-    total_products = Product.objects.count()
-
-    low_stock_products = Product.objects.filter(current_stock__lte=F('min_stock_level'))
-    low_stock_count = low_stock_products.count()
-
-    # Recent sales (last 10)
-    recent_sales = Sale.objects.select_related('sold_by').prefetch_related('items__product').all().order_by('-sale_date')[:10]
-
-    # Supplier bill statistics
-    bill_stats = SupplierBill.objects.aggregate(
-        total_bills=Count('id'),
-        total_amount=Sum('total_amount'),
-        total_paid=Sum('paid_amount'),
-        total_due=Sum('due_amount')
-    )
-    
-    # Overdue bills
-    overdue_bills = SupplierBill.objects.filter(
-        status='overdue', 
-        due_date__lt=today
+    context = get_dashboard_metrics()
+    # Only the requested page of low stock products is loaded
+    context['low_stock_products'] = low_stock_page(
+        request.GET.get('low_stock_page'), context['low_stock_count']
     )
-    overdue_amount = overdue_bills.aggregate(Sum('due_amount'))['due_amount__sum'] or 0
-
-    context = {
-        'daily_sales': daily_stats['total_sales'] or 0,
-        'daily_net_sales': daily_net_sales,  # Add net sales
-        'total_transactions': daily_stats['total_transactions'] or 0,
-        'total_products': total_products,
-        'low_stock_products': low_stock_products,
-        'low_stock_count': low_stock_count,
-        'recent_sales': recent_sales,
-        'total_bills': bill_stats['total_bills'] or 0,
-        'total_bill_amount': bill_stats['total_amount'] or 0,
-        'total_paid': bill_stats['total_paid'] or 0,
-        'total_due': bill_stats['total_due'] or 0,
-        'overdue_bills_count': overdue_bills.count(),
-        'overdue_amount': overdue_amount,
-    }
     return render(request, 'core/dashboard.html', context)
 
 @login_required
@@ -332,131 +304,76 @@ def pos_sale(request):
 
     if request.method == 'POST':
         try:
-            # Parse JSON data from request body
             data = json.loads(request.body)
-            
-            sale_data = data.get('sale_data', [])
-            if not sale_data:
-                return JsonResponse({'success': False, 'error': 'No sale_data provided'})
-
-            customer_name = data.get('customer_name', 'Walk-in Customer')
-            customer_phone = data.get('customer_phone', '')
-            customer_id = data.get('customer_id')  # Get customer_id from request
-            
-            subtotal = Decimal(data.get('subtotal', 0))
-            discount_amount = Decimal(data.get('discount_amount', 0))
-            tax_amount = Decimal(data.get('tax_amount', 0))
-            total_amount = Decimal(data.get('total_amount', 0))
-            paid_amount = Decimal(data.get('paid_amount', 0))
-            change_amount = Decimal(data.get('change_amount', 0))
-            tax_percentage = Decimal(data.get('tax_percentage', 0))
-            discount_percentage = Decimal(data.get('discount_percentage', 0))
-
-            with transaction.atomic():
-                # Get customer instance if customer_id is provided
-                customer = None
-                if customer_id:
-                    try:
-                        customer = Customer.objects.get(id=customer_id)
-                        # Use customer's actual name and phone
-                        customer_name = customer.name
-                        customer_phone = customer.phone
-                    except Customer.DoesNotExist:
-                        # Customer not found, proceed without customer link
-                        pass
-
-                # CRITICAL FIX: Validate due sale for unregistered customers
-                if paid_amount < total_amount and not customer:
-                    return JsonResponse({
-                        'success': False, 
-                        'error': 'Due sales are only allowed for registered customers. Please register customer first.'
-                    })
-
-                # Create sale record with customer
-                sale = Sale.objects.create(
-                    customer_name=customer_name,
-                    customer_phone=customer_phone,
-                    customer=customer,  # Link the customer (can be None for walk-in)
-                    subtotal=subtotal,
-                    discount_amount=discount_amount,
-                    tax_amount=tax_amount,
-                    total_amount=total_amount,
-                    paid_amount=paid_amount,
-                    change_amount=change_amount,
-                    tax_percentage=tax_percentage,
-                    discount_percentage=discount_percentage,
-                    sold_by=request.user,
-                    sale_date=timezone.now()
-                )
-
-                # Payment status is automatically handled in Sale.save() method
-                # No need to manually set it here
-
-                # Preload products used in this sale to avoid N+1
-                product_ids = [int(item['product_id']) for item in sale_data if 'product_id' in item]
-                products_map = {p.id: p for p in Product.objects.filter(id__in=product_ids)}
-
-                for item in sale_data:
-                    product = products_map.get(int(item['product_id']))
-                    if not product:
-                        raise ValueError(f"Product with id {item.get('product_id')} not found")
-
-                    quantity = int(item.get('quantity', 0))
-                    unit_price = Decimal(item.get('price', 0))
-                    total_price = quantity * unit_price
-
-                    # Create sale item
-                    sale_item = SaleItem(
-                        sale=sale,
-                        product=product,
-                        quantity=quantity,
-                        unit_price=unit_price,
-                        total_price=total_price
-                    )
-
-                    # Handle batch tracking for products with expiry
-                    if product.has_expiry:
-                        # Find the oldest batch that has stock (FIFO)
-                        batch = ProductBatch.objects.filter(
-                            product=product,
-                            current_quantity__gt=0
-                        ).exclude(
-                            expiry_date__lt=timezone.now().date()  # Exclude expired
-                        ).order_by('expiry_date').first()
-                        
-                        if batch:
-                            # Use the minimum of requested quantity and available batch quantity
-                            batch_quantity = min(quantity, batch.current_quantity)
-                            sale_item.batch = batch
-                            batch.current_quantity -= batch_quantity
-                            batch.save()
-
-                    sale_item.save()
-
-                    # Update product stock
-                    product.current_stock = F('current_stock') - quantity
-                    product.save()
-
-                return JsonResponse({
-                    'success': True, 
-                    'invoice_number': sale.invoice_number, 
-                    'sale_id': sale.id,
-                    'payment_status': sale.payment_status
-                })
-
+            sale, created = record_sale(data, request.user)
         except json.JSONDecodeError:
             return JsonResponse({'success': False, 'error': 'Invalid JSON data'})
         except Exception as e:
             return JsonResponse({'success': False, 'error': str(e)})
 
+        return JsonResponse({
+            'success': True,
+            'invoice_number': sale.invoice_number,
+            'sale_id': sale.id,
+            'payment_status': sale.payment_status,
+            'replayed': not created,
+        })
+
     context = {'products': products, 'categories': categories}
     return render(request, 'core/pos_sale.html', context)
 
+@login_required
+@require_http_methods(["POST"])
+def pos_sync(request):
+    """
+    Submit the sales a till queued while offline, in the order they were rung
+    up. Every sale needs an ``idempotency_key``; a sale that already reached
+    the server (e.g. the previous sync timed out) is not recorded again and
+    its original invoice number is returned. Each sale is committed on its
+    own, so one bad sale does not hold back the rest of the queue.
+    """
+    try:
+        sales = json.loads(request.body).get('sales')
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON data'}, status=400)
+    if not isinstance(sales, list) or not sales:
+        return JsonResponse({'success': False, 'error': 'No sales provided'}, status=400)
+    if len(sales) > POS_SYNC_MAX_SALES:
+        return JsonResponse({
+            'success': False,
+            'error': f'At most {POS_SYNC_MAX_SALES} sales can be synced at once'
+        }, status=400)
+
+    results = []
+    for data in sales:
+        key = data.get('idempotency_key') if isinstance(data, dict) else None
+        if not key:
+            results.append({'idempotency_key': key, 'success': False, 'error': 'idempotency_key is required'})
+            continue
+        try:
+            sale, created = record_sale(data, request.user)
+        except Exception as e:
+            results.append({'idempotency_key': key, 'success': False, 'error': str(e)})
+            continue
+        results.append({
+            'idempotency_key': key,
+            'success': True,
+            'invoice_number': sale.invoice_number,
+            'sale_id': sale.id,
+            'payment_status': sale.payment_status,
+            'replayed': not created,
+        })
+
+    return JsonResponse({
+        'success': all(result['success'] for result in results),
+        'results': results,
+    })
+
 @login_required
 def generate_invoice(request, invoice_number):
     sale = get_object_or_404(Sale.objects.prefetch_related('items__product'), invoice_number=invoice_number)
 
-    total_items = sale.items.aggregate(total_items=Sum('quantity'))['total_items'] or 0
+    total_items = sum(item.quantity for item in sale.items.all())
 
     # Calculate profit for this sale
     total_cost = sum([item.quantity * item.product.cost_price for item in sale.items.all()])
@@ -469,6 +386,18 @@ def generate_invoice(request, invoice_number):
     }
     return render(request, 'core/invoice.html', context)
 
+@login_required
+def invoice_pdf(request, invoice_number):
+    """Stored invoice PDF, rendered on first request"""
+    sale = get_object_or_404(Sale, invoice_number=invoice_number)
+    return invoice_file_response(request, sale, PDF)
+
+@login_required
+def invoice_receipt(request, invoice_number):
+    """Stored plain-text receipt for the thermal printer, rendered on first request"""
+    sale = get_object_or_404(Sale, invoice_number=invoice_number)
+    return invoice_file_response(request, sale, RECEIPT)
+
 @login_required
 @view_permission_required('purchase_order_create')
 def purchase_order_create(request):
@@ -612,67 +541,40 @@ def purchase_order_create(request):
 
 @login_required
 @view_permission_required('daily_sale_report')
+@read_only_db
 def daily_sale_report(request):
     selected_date = request.GET.get('date')
     if selected_date:
         selected_date = datetime.strptime(selected_date, '%Y-%m-%d').date()
     else:
-        selected_date = timezone.now().date()
+        selected_date = business_calendar.today()
 
-    sales = Sale.objects.filter(sale_date__date=selected_date).select_related('sold_by').prefetch_related('items__product')
+    sales = Sale.objects.filter(day_filter('sale_date', selected_date)).select_related('sold_by').prefetch_related('items__product')
 
     sales_person = request.GET.get('sales_person')
     if sales_person:
         sales = sales.filter(sold_by_id=sales_person)
 
-    # FIXED: Use database fields for calculations
-    total_sales = sales.aggregate(total=Sum('total_amount'))['total'] or 0
-    total_returns = sales.aggregate(total=Sum('returned_amount'))['total'] or 0
-    net_sales = total_sales - total_returns
-    
-    total_items_sold = SaleItem.objects.filter(sale__in=sales).aggregate(total=Sum('quantity'))['total'] or 0
-    
-    # Calculate returned items
-    total_items_returned = 0
-    for sale in sales:
-        total_items_returned += sale.total_returned_quantity
-    
-    net_items_sold = total_items_sold - total_items_returned
-    average_sale = (net_sales / sales.count()) if sales.exists() else 0
-
-    subtotal_total = sales.aggregate(total=Sum('subtotal'))['total'] or 0
-    tax_total = sales.aggregate(total=Sum('tax_amount'))['total'] or 0
-    discount_total = sales.aggregate(total=Sum('discount_amount'))['total'] or 0
+    summary = sales_summary(sales)
 
     sales_users = User.objects.filter(sale__isnull=False).distinct()
 
-    top_products = SaleItem.objects.filter(sale__sale_date__date=selected_date).values('product__name', 'product__sku').annotate(
+    top_products = SaleItem.objects.filter(day_filter('sale__sale_date', selected_date)).values('product__name', 'product__sku').annotate(
         total_quantity=Sum('quantity'),
         total_amount=Sum('total_price')
     ).order_by('-total_quantity')[:5]
 
-    last_7_days = []
-    last_7_days_data = []
-    for i in range(6, -1, -1):
-        date = selected_date - timedelta(days=i)
-        # FIXED: Use database fields for daily sales data
-        day_sales = Sale.objects.filter(sale_date__date=date).aggregate(
-            total=Sum('total_amount') - Sum('returned_amount')
-        )['total'] or 0
-        last_7_days.append(date.strftime('%b %d'))
-        last_7_days_data.append(float(day_sales))
-
-    hourly_sales = []
-    hourly_labels = []
-    for hour in range(9, 21):
-        hour_sales = Sale.objects.filter(
-            sale_date__date=selected_date,
-            sale_date__hour=hour
-        ).aggregate(
-            total=Sum('total_amount') - Sum('returned_amount')
-        )['total'] or 0
-        hourly_sales.append(float(hour_sales))
-        hourly_labels.append(f"{hour:02d}:00")
+    # Net sales per day for the last week and per shop hour (9:00-20:00)
+    last_7_days_points = series('sales', 'day', selected_date - timedelta(days=6), selected_date)
+    last_7_days = [point['label'] for point in last_7_days_points]
+    last_7_days_data = [float(point['value']) for point in last_7_days_points]
+
+    hourly_points = [
+        point for point in series('sales', 'hour', selected_date, selected_date)
+        if 9 <= point['bucket'].hour <= 20
+    ]
+    hourly_sales = [float(point['value']) for point in hourly_points]
+    hourly_labels = [point['label'] for point in hourly_points]
 
     all_products = Product.objects.all().order_by('name')
     all_categories = Category.objects.all().order_by('name')
@@ -682,22 +584,22 @@ def daily_sale_report(request):
     context = {
         'sales': sales,
         'selected_date': selected_date,
-        'total_sales': total_sales,  # Gross sales
-        'net_sales': net_sales,      # Net sales after returns
-        'total_returns': total_returns,  # Total returns
-        'total_items_sold': total_items_sold,
-        'total_items_returned': total_items_returned,
-        'net_items_sold': net_items_sold,
-        'average_sale': average_sale,
-        'subtotal_total': subtotal_total,
-        'tax_total': tax_total,
-        'discount_total': discount_total,
+        'total_sales': summary['gross_sales'],  # Gross sales
+        'net_sales': summary['net_sales'],      # Net sales after returns
+        'total_returns': summary['total_returns'],  # Total returns
+        'total_items_sold': summary['items_sold'],
+        'total_items_returned': summary['items_returned'],
+        'net_items_sold': summary['net_items_sold'],
+        'average_sale': summary['average_sale'],
+        'subtotal_total': summary['subtotal'],
+        'tax_total': summary['tax'],
+        'discount_total': summary['discount'],
         'sales_users': sales_users,
         'top_products': top_products,
-        'today': timezone.now().date(),
-        'yesterday': timezone.now().date() - timedelta(days=1),
-        'week_ago': timezone.now().date() - timedelta(days=7),
-        'month_start': timezone.now().replace(day=1).date(),
+        'today': business_calendar.today(),
+        'yesterday': business_calendar.today() - timedelta(days=1),
+        'week_ago': business_calendar.today() - timedelta(days=7),
+        'month_start': business_calendar.today().replace(day=1),
         'last_7_days_labels': last_7_days,
         'last_7_days_data': last_7_days_data,
         'hourly_sales': hourly_sales,
@@ -776,6 +678,7 @@ def stock_report(request):
 
 @login_required
 @view_permission_required('purchase_report')
+@read_only_db
 def purchase_report(request):
     purchases = PurchaseOrder.objects.select_related('supplier', 'created_by').prefetch_related('items').all()
     suppliers = Supplier.objects.all()
@@ -786,9 +689,9 @@ def purchase_report(request):
     status_filter = request.GET.get('status')
 
     if start_date:
-        purchases = purchases.filter(order_date__date__gte=start_date)
+        purchases = purchases.filter(since_filter('order_date', datetime.strptime(start_date, '%Y-%m-%d').date()))
     if end_date:
-        purchases = purchases.filter(order_date__date__lte=end_date)
+        purchases = purchases.filter(until_filter('order_date', datetime.strptime(end_date, '%Y-%m-%d').date()))
     if supplier_filter:
         purchases = purchases.filter(supplier_id=supplier_filter)
     if status_filter:
@@ -811,14 +714,10 @@ def purchase_report(request):
     for supplier in top_suppliers:
         supplier.avg_value = (supplier.total_value or 0) / supplier.order_count if supplier.order_count else 0
 
-    today = timezone.now().date()
-    trend_data = []
-    trend_labels = []
-    for i in range(29, -1, -1):
-        date = today - timedelta(days=i)
-        day_purchases = PurchaseOrder.objects.filter(order_date__date=date).aggregate(total=Sum('total_amount'))['total'] or 0
-        trend_data.append(float(day_purchases))
-        trend_labels.append(date.strftime('%b %d'))
+    today = business_calendar.today()
+    trend_points = series('purchases', 'day', today - timedelta(days=29), today)
+    trend_data = [float(point['value']) for point in trend_points]
+    trend_labels = [point['label'] for point in trend_points]
 
     week_start = today - timedelta(days=today.weekday())
     week_end = week_start + timedelta(days=6)
@@ -855,6 +754,7 @@ def purchase_report(request):
 
 @login_required
 @admin_required
+@read_only_db
 def profit_report(request):
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
@@ -862,9 +762,9 @@ def profit_report(request):
     period = request.GET.get('period', 'monthly')
 
     if not start_date:
-        start_date = timezone.now().replace(day=1).date()
+        start_date = business_calendar.today().replace(day=1)
     if not end_date:
-        end_date = timezone.now().date()
+        end_date = business_calendar.today()
 
     if isinstance(start_date, str):
         start_date = datetime.strptime(start_date, '%Y-%m-%d').date()
@@ -872,7 +772,7 @@ def profit_report(request):
         end_date = datetime.strptime(end_date, '%Y-%m-%d').date()
 
     sales = Sale.objects.filter(
-        sale_date__date__range=[start_date, end_date]
+        day_filter('sale_date', start_date, end_date)
     ).prefetch_related('items__product', 'returns__items')
 
     if category_filter:
@@ -914,54 +814,17 @@ def profit_report(request):
 
     categories = Category.objects.all()
 
-    # Generate trend data
-    trend_labels, revenue_data, profit_data = [], [], []
-    current_date = start_date
-    while current_date <= end_date:
-        if period == 'daily':
-            period_start, period_end = current_date, current_date
-            label = current_date.strftime('%b %d')
-            current_date += timedelta(days=1)
-        elif period == 'weekly':
-            period_start = current_date - timedelta(days=current_date.weekday())
-            period_end = period_start + timedelta(days=6)
-            label = f"Week {current_date.isocalendar()[1]}"
-            current_date = period_end + timedelta(days=1)
-        elif period == 'monthly':
-            month_start = current_date.replace(day=1)
-            next_month = month_start.replace(day=28) + timedelta(days=4)
-            period_end = next_month - timedelta(days=next_month.day)
-            period_start = month_start
-            label = month_start.strftime('%b %Y')
-            current_date = period_end + timedelta(days=1)
-        else: # yearly
-            period_start = current_date.replace(month=1, day=1)
-            period_end = current_date.replace(month=12, day=31)
-            label = str(current_date.year)
-            current_date = current_date.replace(year=current_date.year + 1, month=1, day=1)
-
-        date_sales = sales.filter(sale_date__date__range=[period_start, period_end])
-        
-        # Calculate period revenue properly
-        period_gross = date_sales.aggregate(total=Sum('total_amount'))['total'] or 0
-        period_returns = date_sales.aggregate(total=Sum('returned_amount'))['total'] or 0
-        period_revenue = period_gross - period_returns
-        
-        # Calculate period cost properly
-        period_cost = Decimal('0')
-        for sale in date_sales:
-            period_cost += sale.get_net_cost()
-
-        period_profit = period_revenue - period_cost
-
-        trend_labels.append(label)
-        revenue_data.append(float(period_revenue))
-        profit_data.append(float(period_profit))
+    # Generate trend data: net revenue and profit per period, one query
+    bucket = {'daily': 'day', 'weekly': 'week', 'monthly': 'month'}.get(period, 'year')
+    trend_points = series('profit', bucket, start_date, end_date, queryset=sales if category_filter else None)
+    trend_labels = [point['label'] for point in trend_points]
+    revenue_data = [float(point['revenue']) for point in trend_points]
+    profit_data = [float(point['value']) for point in trend_points]
 
     # Top products by NET profit (after returns)
     top_products = []
     product_sales = SaleItem.objects.filter(
-        sale__sale_date__date__range=[start_date, end_date]
+        day_filter('sale__sale_date', start_date, end_date)
     ).select_related('product', 'product__category')
     
     # Calculate net profit for each product
@@ -1045,7 +908,7 @@ def profit_report(request):
     best_product = top_products[0] if top_products else {'product__name': 'N/A', 'total_profit': 0}
     best_category = category_profits[0] if category_profits else {'name': 'N/A', 'total_profit': 0}
 
-    today = timezone.now().date()
+    today = business_calendar.today()
     week_start = today - timedelta(days=today.weekday())
     week_end = week_start + timedelta(days=6)
     month_start = today.replace(day=1)
@@ -1141,7 +1004,7 @@ def supplier_bills(request):
             total_effective_due += bill.due_amount
     
     # Count overdue and returned bills
-    today = timezone.now().date()
+    today = business_calendar.today()
     overdue_bills_count = 0
     returned_bills_count = 0
     
@@ -1218,14 +1081,14 @@ def supplier_bill_detail(request, pk):
         is_overdue = bill.is_overdue
     except AttributeError:
         # Fallback overdue calculation
-        today = timezone.now().date()
+        today = business_calendar.today()
         due_date = bill.due_date.date() if hasattr(bill.due_date, 'date') else bill.due_date
         is_overdue = bill.due_amount > 0 and due_date < today
 
     context = {
         'bill': bill,
         'payments': payments,
-        'today': timezone.now().date(),
+        'today': business_calendar.today(),
         'total_paid': total_paid,
         'remaining_due': remaining_due,
         'payment_percentage': payment_percentage,
@@ -1284,7 +1147,7 @@ def create_payment(request, bill_id):
         initial_amount = bill.effective_due_amount
         form = PaymentForm(bill=bill, initial={
             'amount': initial_amount,
-            'payment_date': timezone.now().date()
+            'payment_date': business_calendar.today()
         })
     
     context = {
@@ -1295,8 +1158,9 @@ def create_payment(request, bill_id):
     return render(request, 'core/create_payment.html', context)
 
 @login_required
+@read_only_db
 def bill_dashboard(request):
-    today = timezone.now().date()
+    today = business_calendar.today()
     
     # Get all bills with related data
     bills = SupplierBill.objects.select_related('supplier', 'purchase_order')
@@ -1390,22 +1254,112 @@ def bill_dashboard(request):
     }
     return render(request, 'core/bill_dashboard.html', context)
 
+def _aging_allowed(user, kind):
+    permission = aging.PERMISSIONS[kind]
+    return permission is None or can_access_view(user, permission)
+
+@login_required
+def aging_report(request, kind):
+    """Receivables or payables per customer/supplier in 0-30/31-60/61-90/90+ day buckets"""
+    if kind not in aging.KINDS:
+        raise Http404('Unknown aging report')
+    if not _aging_allowed(request.user, kind):
+        return HttpResponseForbidden("You don't have permission to access this page.")
+    report = aging.aging_report(kind)
+    context = {
+        'report': report,
+        'rows': [
+            (party, [party[key] for key, _ in report['buckets']])
+            for party in report['parties']
+        ],
+        'bucket_totals': [(label, report['totals'][key]) for key, label in report['buckets']],
+        'is_payables': kind == aging.PAYABLES,
+    }
+    return render(request, 'core/aging_report.html', context)
+
+@login_required
+def aging_api(request, kind):
+    """The aging report as JSON: ``/api/aging/receivables/`` or ``/api/aging/payables/``"""
+    if kind not in aging.KINDS:
+        return JsonResponse({'success': False, 'error': f'Unknown aging report: {kind}'}, status=404)
+    if not _aging_allowed(request.user, kind):
+        return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    report = aging.aging_report(kind)
+
+    def amounts(values):
+        return {
+            name: float(value) if isinstance(value, Decimal) else value.isoformat() if hasattr(value, 'isoformat') else value
+            for name, value in values.items()
+        }
+
+    return JsonResponse({
+        'success': True,
+        'kind': kind,
+        'as_of': report['as_of'].isoformat(),
+        'buckets': [{'key': key, 'label': label} for key, label in report['buckets']],
+        'totals': amounts(report['totals']),
+        'parties': [amounts(party) for party in report['parties']],
+    })
+
+@login_required
+@read_only_db
+def series_api(request):
+    """
+    Chart data: ``?metric=sales|profit|purchases|bills&bucket=hour|day|week|month|year
+    &from=YYYY-MM-DD&to=YYYY-MM-DD`` (local dates, both included; the last 30
+    days by default). Empty buckets are returned as zeros.
+    """
+    metric = request.GET.get('metric', 'sales')
+    bucket = request.GET.get('bucket', 'day')
+    try:
+        permission = metric_permission(metric)
+        end = parse_range(request.GET.get('to'), business_calendar.today())
+        start = parse_range(request.GET.get('from'), end - timedelta(days=29))
+        if start > end:
+            raise ValueError('from must not be after to')
+        if permission == 'admin':
+            allowed = is_admin_user(request.user)
+        else:
+            allowed = permission is None or can_access_view(request.user, permission)
+        if not allowed:
+            return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+        points = series(metric, bucket, start, end)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+
+    return JsonResponse({
+        'success': True,
+        'metric': metric,
+        'bucket': bucket,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'timezone': business_calendar.SHOP_TIME_ZONE,
+        'labels': [point['label'] for point in points],
+        'points': [
+            {
+                name: value.isoformat() if name == 'bucket' else float(value) if isinstance(value, Decimal) else value
+                for name, value in point.items()
+            }
+            for point in points
+        ],
+    })
+
 @login_required
 def bill_summary_api(request):
     """API endpoint for bill summary data"""
-    today = timezone.now().date()
+    today = business_calendar.today()
     last_year = today - timedelta(days=365)
     
     # Monthly bill data
-    monthly_data = SupplierBill.objects.filter(
-        bill_date__gte=last_year
-    ).extra(
-        {'month': "strftime('%%Y-%%m', bill_date)"}
-    ).values('month').annotate(
-        total_amount=Sum('total_amount'),
-        paid_amount=Sum('paid_amount'),
-        bill_count=Count('id')
-    ).order_by('month')
+    monthly_data = [
+        {
+            'month': point['bucket'].strftime('%Y-%m'),
+            'total_amount': point['value'],
+            'paid_amount': point['paid'],
+            'bill_count': point['count'],
+        }
+        for point in series('bills', 'month', last_year, today)
+    ]
     
     # Status distribution
     status_data = SupplierBill.objects.values('status').annotate(
@@ -1420,13 +1374,13 @@ def bill_summary_api(request):
         'total_amount': SupplierBill.objects.aggregate(total=Sum('total_amount'))['total'] or 0,
         'total_paid': SupplierBill.objects.aggregate(total=Sum('paid_amount'))['total'] or 0,
         'overdue_count': SupplierBill.objects.filter(
-            due_date__lt=today,
+            due_date__lt=business_calendar.day_start(today),
             due_amount__gt=0
         ).count(),
     }
     
     return JsonResponse({
-        'monthly_data': list(monthly_data),
+        'monthly_data': monthly_data,
         'status_data': list(status_data),
         'current_stats': current_stats,
     })
@@ -1764,54 +1718,29 @@ def purchase_order_detail(request, purchase_id):
 @view_permission_required('expiry_report')
 def expiry_report(request):
     """View for showing products nearing expiry"""
-    today = timezone.now().date()
+    today = business_calendar.today()
     
-    # Get filter parameters
-    days_threshold = int(request.GET.get('days', 30))
+    # Get filter parameters - without 'days' each product's own expiry_warning_days is used
+    days_param = request.GET.get('days')
+    days_threshold = int(days_param) if days_param else None
     category_filter = request.GET.get('category')
     include_expired = request.GET.get('include_expired', False)
     
-    # Calculate threshold date
-    threshold_date = today + timedelta(days=days_threshold)
-    
-    # Get ALL batches first (not just nearing expiry)
-    batches = ProductBatch.objects.select_related('product', 'product__category').filter(
-        current_quantity__gt=0
-    )
-    
-    # Apply category filter to ALL batches
+    batches = ProductBatch.objects.select_related('product', 'product__category')
     if category_filter:
         batches = batches.filter(product__category_id=category_filter)
     
-    # Create filtered queryset for display
-    display_batches = batches.filter(expiry_date__lte=threshold_date)
+    # Bucket every live batch in SQL, by the 'days' window when given
+    batches = classify_batches(batches, today, days=days_threshold)
     
-    if not include_expired:
-        display_batches = display_batches.filter(expiry_date__gte=today)
+    shown_buckets = [NEAR_EXPIRY, EXPIRED] if include_expired else [NEAR_EXPIRY]
+    display_batches = batches.filter(expiry_bucket__in=shown_buckets)
     
     # Sort by expiry date (soonest first)
     display_batches = display_batches.order_by('expiry_date')
     
-    # Calculate statistics from ALL batches (not just filtered ones)
-    total_batches = batches.count()
-    expired_batches_count = batches.filter(expiry_date__lt=today).count()
-    near_expiry_batches_count = batches.filter(
-        expiry_date__gte=today,
-        expiry_date__lte=threshold_date
-    ).count()
-    good_batches_count = batches.filter(
-        expiry_date__gt=threshold_date
-    ).count()
-    
-    # Calculate values for display batches
-    total_value_near_expiry = sum(
-        batch.current_quantity * batch.product.cost_price 
-        for batch in display_batches.filter(expiry_date__gte=today)
-    )
-    total_value_expired = sum(
-        batch.current_quantity * batch.product.cost_price 
-        for batch in display_batches.filter(expiry_date__lt=today)
-    )
+    # Counts and values for ALL batches come from one cached aggregate, bucketed the same way
+    summary = get_expiry_summary(today, category_filter, days_threshold)
     
     categories = Category.objects.all()
     
@@ -1820,12 +1749,12 @@ def expiry_report(request):
         'categories': categories,
         'today': today,
         'days_threshold': days_threshold,
-        'total_batches': total_batches,  # But count ALL batches
-        'total_near_expiry': near_expiry_batches_count,  # From ALL batches
-        'total_expired': expired_batches_count,  # From ALL batches
-        'total_good': good_batches_count,  # From ALL batches
-        'total_value_near_expiry': total_value_near_expiry,
-        'total_value_expired': total_value_expired,
+        'total_batches': summary['total_batches'],
+        'total_near_expiry': summary[NEAR_EXPIRY]['count'],
+        'total_expired': summary[EXPIRED]['count'],
+        'total_good': summary[GOOD]['count'],
+        'total_value_near_expiry': summary[NEAR_EXPIRY]['value'],
+        'total_value_expired': summary[EXPIRED]['value'],
         'include_expired': include_expired,
     }
     return render(request, 'core/expiry_report.html', context)
@@ -2021,151 +1950,12 @@ def update_return_status(request, return_id):
                 with transaction.atomic():
                     # Handle status change to "Completed" - adjust stock and batch quantities
                     if new_status == 'completed' and old_status != 'completed':
-                        print("DEBUG: Processing completion...")
-                        batches_to_delete = []  # Track batches that become empty
-                        
-                        # Process each return item and update stock and batch
-                        for return_item in purchase_return.items.all():
-                            product = return_item.purchase_order_item.product
-                            quantity = return_item.quantity
-                            batch = return_item.batch
-                            
-                            print(f"DEBUG: Processing item - Product: {product.name}, Quantity: {quantity}, Batch: {batch}")
-                            
-                            if not batch:
-                                continue  # Skip if no batch associated
-                                
-                            # Get current values BEFORE updating
-                            old_product_stock = product.current_stock
-                            old_batch_quantity = batch.current_quantity
-                            
-                            # Update product stock using direct calculation
-                            product.current_stock = old_product_stock - quantity
-                            if product.current_stock < 0:
-                                raise ValidationError(f'Cannot return {quantity} units. Only {old_product_stock} available for {product.name}.')
-                            product.save()
-                            
-                            print(f"DEBUG: Product stock updated from {old_product_stock} to {product.current_stock}")
-                            
-                            # Update batch quantity
-                            batch.current_quantity = old_batch_quantity - quantity
-                            if batch.current_quantity < 0:
-                                raise ValidationError(f'Cannot return {quantity} units from batch {batch.batch_number}. Only {old_batch_quantity} available.')
-                            
-                            # Check if batch should be deleted (quantity reached zero)
-                            if batch.current_quantity == 0:
-                                batches_to_delete.append(batch)
-                                print(f"DEBUG: Batch {batch.batch_number} will be deleted (quantity reached zero)")
-                            else:
-                                batch.save()
-                                print(f"DEBUG: Batch {batch.batch_number} updated from {old_batch_quantity} to {batch.current_quantity}")
-                            
-                            # Create stock movement record for return
-                            StockMovement.objects.create(
-                                product=product,
-                                movement_type='return_out',
-                                quantity=-quantity,
-                                batch_number=batch.batch_number if batch else '',
-                                reference_number=purchase_return.return_number,
-                                notes=f"Purchase return completed - {purchase_return.return_number}",
-                                movement_date=timezone.now()
-                            )
-                        
-                        # Delete batches that reached zero quantity
-                        for batch in batches_to_delete:
-                            batch.delete()
-                            print(f"DEBUG: Batch {batch.batch_number} deleted (quantity reached zero)")
-                        
-                        # Update Purchase Order status to "returned" if it's not already
-                        purchase_order = purchase_return.purchase_order
-                        if purchase_order.status != 'returned':
-                            purchase_order.status = 'returned'
-                            purchase_order.save()
-                            print(f"DEBUG: Purchase order status updated to 'returned'")
-                        
-                        # Update Supplier Bill if exists - FIXED SECTION
-                        try:
-                            supplier_bill = SupplierBill.objects.get(purchase_order=purchase_order)
-                            
-                            # Don't change total_amount - keep original for tracking
-                            # Just let the save() method handle status based on returns
-                            supplier_bill.save()  # This will recalculate status
-                            
-                            print(f"DEBUG: Supplier bill status updated to: {supplier_bill.status}")
-                            
-                        except SupplierBill.DoesNotExist:
-                            print("DEBUG: No supplier bill found for this purchase order")
-                        
+                        complete_purchase_return(purchase_return)
                         messages.success(request, f'Return status updated to completed. Stock/batch quantities adjusted, purchase order marked as returned, and supplier bill updated.')
                     
                     # Handle reversal if status changed from "Completed" to something else
                     elif old_status == 'completed' and new_status != 'completed':
-                        print("DEBUG: Processing reversal...")
-                        # Reverse the stock and batch adjustment
-                        for return_item in purchase_return.items.all():
-                            product = return_item.purchase_order_item.product
-                            quantity = return_item.quantity
-                            batch = return_item.batch
-                            
-                            # Get current values BEFORE updating
-                            old_product_stock = product.current_stock
-                            
-                            # Update product stock using direct calculation
-                            product.current_stock = old_product_stock + quantity
-                            product.save()
-                            
-                            print(f"DEBUG: Product stock reversed from {old_product_stock} to {product.current_stock}")
-                            
-                            # For batch restoration, we need to handle this differently
-                            # since the batch might have been deleted
-                            if not batch:
-                                # Batch was deleted, we need to recreate it
-                                po_item = return_item.purchase_order_item
-                                batch = ProductBatch.objects.create(
-                                    product=product,
-                                    batch_number=f"RESTORED-{return_item.id}-{uuid.uuid4().hex[:6].upper()}",
-                                    manufacture_date=timezone.now().date(),
-                                    expiry_date=po_item.expiry_date if product.has_expiry else None,
-                                    quantity=quantity,
-                                    current_quantity=quantity,
-                                    purchase_order_item=po_item
-                                )
-                                return_item.batch = batch
-                                return_item.save()
-                                print(f"DEBUG: Recreated batch {batch.batch_number} with quantity {quantity}")
-                            else:
-                                # Batch still exists, just update quantity
-                                old_batch_quantity = batch.current_quantity
-                                batch.current_quantity = old_batch_quantity + quantity
-                                batch.save()
-                                print(f"DEBUG: Batch {batch.batch_number} reversed from {old_batch_quantity} to {batch.current_quantity}")
-                            
-                            # Create reverse stock movement record
-                            StockMovement.objects.create(
-                                product=product,
-                                movement_type='return_in',
-                                quantity=quantity,
-                                batch_number=batch.batch_number if batch else '',
-                                reference_number=purchase_return.return_number,
-                                notes=f"Return status reversed from completed - {purchase_return.return_number}",
-                                movement_date=timezone.now()
-                            )
-                        
-                        # Revert Purchase Order status back to "completed"
-                        purchase_order = purchase_return.purchase_order
-                        purchase_order.status = 'completed'
-                        purchase_order.save()
-                        print(f"DEBUG: Purchase order status reverted to 'completed'")
-                        
-                        # Revert Supplier Bill changes
-                        try:
-                            supplier_bill = SupplierBill.objects.get(purchase_order=purchase_order)
-                            supplier_bill.save()  # This will recalculate status based on current returns
-                            print(f"DEBUG: Supplier bill status reverted to: {supplier_bill.status}")
-                            
-                        except SupplierBill.DoesNotExist:
-                            print("DEBUG: No supplier bill found for this purchase order")
-                        
+                        reverse_purchase_return(purchase_return)
                         messages.warning(request, f'Return status updated and all adjustments (stock, batches, purchase order, supplier bill) have been reversed.')
                     
                     # Regular status update (not involving completed status)
@@ -2202,6 +1992,7 @@ def update_return_status(request, return_id):
 
 def batch_management(request):
     """View for managing product batches"""
+    today = business_calendar.today()
     batches = ProductBatch.objects.select_related('product', 'product__category').all()
     
     # Filters
@@ -2213,25 +2004,20 @@ def batch_management(request):
         batches = batches.filter(product_id=product_filter)
     if category_filter:
         batches = batches.filter(product__category_id=category_filter)
-    if expiry_status == 'expired':
-        batches = batches.filter(expiry_date__lt=timezone.now().date())
-    elif expiry_status == 'near_expiry':
-        warning_date = timezone.now().date() + timedelta(days=30)
-        batches = batches.filter(
-            expiry_date__lte=warning_date,
-            expiry_date__gte=timezone.now().date()
-        )
-    elif expiry_status == 'good':
-        warning_date = timezone.now().date() + timedelta(days=30)
-        batches = batches.filter(expiry_date__gt=warning_date)
     
-    # Statistics
-    total_batches = batches.count()
-    expired_batches = batches.filter(expiry_date__lt=timezone.now().date()).count()
-    near_expiry_batches = batches.filter(
-        expiry_date__lte=timezone.now().date() + timedelta(days=30),
-        expiry_date__gte=timezone.now().date()
-    ).count()
+    # Near expiry follows each product's own expiry_warning_days
+    batches = batches.annotate(expiry_bucket=bucket_expression(today))
+    if expiry_status in (EXPIRED, NEAR_EXPIRY, GOOD):
+        batches = batches.filter(expiry_bucket=expiry_status)
+        if expiry_status == GOOD:
+            batches = batches.filter(expiry_date__isnull=False)
+    
+    # Statistics in one query
+    stats = batches.aggregate(
+        total_batches=Count('id'),
+        expired_batches=Count('id', filter=Q(expiry_bucket=EXPIRED)),
+        near_expiry_batches=Count('id', filter=Q(expiry_bucket=NEAR_EXPIRY)),
+    )
     
     # Sort by expiry date
     batches = batches.order_by('expiry_date', 'product__name')
@@ -2247,10 +2033,10 @@ def batch_management(request):
         'batches': page_obj,
         'products': products,
         'categories': categories,
-        'total_batches': total_batches,
-        'expired_batches': expired_batches,
-        'near_expiry_batches': near_expiry_batches,
-        'today': timezone.now().date(),
+        'total_batches': stats['total_batches'],
+        'expired_batches': stats['expired_batches'],
+        'near_expiry_batches': stats['near_expiry_batches'],
+        'today': today,
     }
     return render(request, 'core/batch_management.html', context)
 
@@ -2258,6 +2044,28 @@ def batch_management(request):
 @view_permission_required('write_off_expired')
 def write_off_expired(request):
     """View for writing off expired products"""
+    if request.method == 'POST' and request.POST.get('bulk_action'):
+        # Write off every expired batch (or the selected ones) in one transaction
+        try:
+            batch_ids = [int(batch_id) for batch_id in request.POST.getlist('batch_ids')] or None
+        except ValueError:
+            messages.error(request, 'Invalid batch selection.')
+            return redirect('write_off_expired')
+        reason = request.POST.get('reason', 'Expired')
+        
+        with transaction.atomic():
+            result = write_off_expired_batches(request.user, batch_ids=batch_ids, reason=reason)
+        
+        if result['batches']:
+            messages.success(
+                request,
+                f"Written off {result['quantity']} units from {result['batches']} expired batches "
+                f"({result['products']} products)"
+            )
+        else:
+            messages.info(request, 'No expired batches to write off.')
+        return redirect('write_off_expired')
+    
     if request.method == 'POST':
         batch_id = request.POST.get('batch_id')
         quantity = int(request.POST.get('quantity', 0))
@@ -2294,13 +2102,20 @@ def write_off_expired(request):
         return redirect('batch_management')
     
     # GET request - show expired batches
-    expired_batches = ProductBatch.objects.filter(
-        expiry_date__lt=timezone.now().date(),
-        current_quantity__gt=0
-    ).select_related('product').order_by('expiry_date')
+    expired_batches = batches_in_bucket(
+        EXPIRED, ProductBatch.objects.select_related('product')
+    ).order_by('expiry_date')
+    
+    totals = expired_batches.aggregate(
+        total_units=Sum('current_quantity'),
+        total_value=Sum('stock_value_db'),
+    )
     
     context = {
         'expired_batches': expired_batches,
+        'total_units': totals['total_units'] or 0,
+        'total_value': totals['total_value'] or Decimal('0'),
+        'today': business_calendar.today(),
     }
     return render(request, 'core/write_off_expired.html', context)
 
@@ -2315,19 +2130,6 @@ def get_po_items(request, po_id):
     
     return JsonResponse(list(items), safe=False)
 
-@login_required
-def get_batches_for_product(request, product_id):
-    """API endpoint to get batches for a product"""
-    batches = ProductBatch.objects.filter(
-        product_id=product_id,
-        current_quantity__gt=0
-    ).values('id', 'batch_number', 'expiry_date', 'current_quantity').order_by('expiry_date')
-    
-    batches_list = list(batches)
-    for batch in batches_list:
-        batch['expiry_date'] = batch['expiry_date'].strftime('%Y-%m-%d') if batch['expiry_date'] else None
-    
-    return JsonResponse(batches_list, safe=False)
 
 @login_required
 def get_batches_for_po_item(request, po_item_id):
@@ -2435,7 +2237,7 @@ def process_batch_creation(request, purchase_id):
                     batch = ProductBatch.objects.create(
                         product=item.product,
                         batch_number=batch_number,
-                        manufacture_date=timezone.now().date(),
+                        manufacture_date=business_calendar.today(),
                         expiry_date=expiry_date,
                         quantity=item.quantity,
                         current_quantity=item.quantity,
@@ -2525,7 +2327,7 @@ def sale_return_create(request):
     recent_sales = Sale.objects.select_related('sold_by').prefetch_related('items__product').all().order_by('-sale_date')[:10]
     
     # Get today's sales for stats
-    today_sales = Sale.objects.filter(sale_date__date=timezone.now().date())
+    today_sales = Sale.objects.filter(day_filter('sale_date', business_calendar.today()))
     
     context = {
         'recent_sales': recent_sales,
@@ -2578,41 +2380,12 @@ def add_sale_return_items(request, sale_id):
                 sale_return.delete()
                 return redirect('add_sale_return_items', sale_id=sale.id)
             
-            total_refund = 0
-            for item_data in items_data:
-                try:
-                    sale_item = SaleItem.objects.get(id=item_data['sale_item_id'])
-                    
-                    # Validate quantity doesn't exceed available
-                    total_returned = SaleReturnItem.objects.filter(
-                        sale_item=sale_item
-                    ).aggregate(total=Sum('quantity'))['total'] or 0
-                    
-                    remaining_qty = sale_item.quantity - total_returned
-                    
-                    if item_data['quantity'] > remaining_qty:
-                        messages.error(request, f'Return quantity for {sale_item.product.name} exceeds available quantity.')
-                        sale_return.delete()
-                        return redirect('add_sale_return_items', sale_id=sale.id)
-                    
-                    total_price = item_data['quantity'] * sale_item.unit_price
-                    
-                    return_item = SaleReturnItem.objects.create(
-                        sale_return=sale_return,
-                        sale_item=sale_item,
-                        quantity=item_data['quantity'],
-                        unit_price=sale_item.unit_price,
-                        total_price=total_price,
-                        reason=item_data['reason'],
-                        notes=item_data['notes'],
-                        batch=sale_item.batch
-                    )
-                    total_refund += total_price
-                    
-                except SaleItem.DoesNotExist:
-                    messages.error(request, f'Sale item not found: {item_data["sale_item_id"]}')
-                    sale_return.delete()
-                    return redirect('add_sale_return_items', sale_id=sale.id)
+            try:
+                total_refund = create_sale_return_items(sale_return, items_data)
+            except ValidationError as e:
+                messages.error(request, e.messages[0])
+                sale_return.delete()
+                return redirect('add_sale_return_items', sale_id=sale.id)
             
             # Update refund amount
             sale_return.refund_amount = total_refund
@@ -2657,13 +2430,7 @@ def add_sale_return_items(request, sale_id):
     
     # Get sale items with return information
     sale_items = []
-    for item in sale.items.all():
-        total_returned = SaleReturnItem.objects.filter(
-            sale_item=item
-        ).aggregate(total=Sum('quantity'))['total'] or 0
-        
-        remaining_qty = item.quantity - total_returned
-        
+    for item in sale_items_with_returns(sale):
         sale_items.append({
             'id': item.id,
             'product': item.product,
@@ -2671,8 +2438,8 @@ def add_sale_return_items(request, sale_id):
             'unit_price': item.unit_price,
             'total_price': item.total_price,
             'batch': item.batch,
-            'returned_quantity': total_returned,
-            'remaining_quantity': remaining_qty,
+            'returned_quantity': item.returned_qty,
+            'remaining_quantity': item.quantity - item.returned_qty,
         })
     
     # Get products for the template (for price data)
@@ -2784,136 +2551,25 @@ def process_sale_return(request, return_id):
                     print("DEBUG: Starting completion process...")
                     
                     # Process the return based on type
+                    if sale_return.return_type == 'product' and not sale_return.can_process_exchange:
+                        messages.error(request, f'Insufficient stock for exchange product! Available: {sale_return.exchange_product.current_stock}')
+                        return redirect('sale_return_detail', return_id=sale_return.id)
+                    
+                    complete_sale_return(sale_return)
+                    
+                    # Handle balance amount
+                    if sale_return.balance_amount != 0:
+                        balance_info = f"Balance amount: ৳{abs(sale_return.balance_amount):.2f}"
+                        if sale_return.balance_amount > 0:
+                            balance_info += " (Refund to customer)"
+                        else:
+                            balance_info += " (Payment from customer)"
+                        messages.info(request, balance_info)
+                    
                     if sale_return.return_type == 'money':
-                        print("DEBUG: Processing money refund...")
-                        
-                        # Update the original sale's returned amount
-                        original_sale = sale_return.sale
-                        original_sale.returned_amount += sale_return.refund_amount
-                        original_sale.save()
-                        print(f"DEBUG: Updated sale returned_amount to {original_sale.returned_amount}")
-                        
-                        # Update stock for returned items
-                        for return_item in sale_return.items.all():
-                            product = return_item.sale_item.product
-                            quantity = return_item.quantity
-                            batch = return_item.batch
-                            
-                            print(f"DEBUG: Processing item - {product.name}, Qty: {quantity}")
-                            
-                            # Update product stock
-                            old_product_stock = product.current_stock
-                            product.current_stock = old_product_stock + quantity
-                            product.save()
-                            product.refresh_from_db()
-                            
-                            print(f"DEBUG: Product {product.name} stock updated from {old_product_stock} to {product.current_stock}")
-                            
-                            # Update batch quantity if batch exists
-                            if batch:
-                                old_batch_quantity = batch.current_quantity
-                                batch.current_quantity = old_batch_quantity + quantity
-                                batch.save()
-                                batch.refresh_from_db()
-                                print(f"DEBUG: Batch {batch.batch_number} updated from {old_batch_quantity} to {batch.current_quantity}")
-                            
-                            # Create stock movement record
-                            StockMovement.objects.create(
-                                product=product,
-                                movement_type='return_in',
-                                quantity=quantity,
-                                batch_number=batch.batch_number if batch else '',
-                                reference_number=sale_return.return_number,
-                                notes=f"Sale return completed - {sale_return.return_number}",
-                                movement_date=timezone.now()
-                            )
-                        
-                        # Handle balance amount for money returns
-                        if sale_return.balance_amount != 0:
-                            balance_info = f"Balance amount: ৳{abs(sale_return.balance_amount):.2f}"
-                            if sale_return.balance_amount > 0:
-                                balance_info += " (Refund to customer)"
-                            else:
-                                balance_info += " (Payment from customer)"
-                            messages.info(request, balance_info)
-                        
                         messages.success(request, f'Money refund processed. Stock updated and refund recorded.')
-                    
                     elif sale_return.return_type == 'product':
-                        print("DEBUG: Processing product exchange...")
-                        
-                        if not sale_return.exchange_product or sale_return.exchange_quantity <= 0:
-                            messages.error(request, 'Exchange product and quantity are required for product exchange!')
-                            return redirect('sale_return_detail', return_id=sale_return.id)
-                        
-                        if not sale_return.can_process_exchange:
-                            messages.error(request, f'Insufficient stock for exchange product! Available: {sale_return.exchange_product.current_stock}')
-                            return redirect('sale_return_detail', return_id=sale_return.id)
-                        
-                        # Process returned items (add back to stock)
-                        for return_item in sale_return.items.all():
-                            product = return_item.sale_item.product
-                            quantity = return_item.quantity
-                            batch = return_item.batch
-                            
-                            # Update returned product stock
-                            old_product_stock = product.current_stock
-                            product.current_stock = old_product_stock + quantity
-                            product.save()
-                            product.refresh_from_db()
-                            
-                            print(f"DEBUG: Returned product {product.name} stock updated from {old_product_stock} to {product.current_stock}")
-                            
-                            # Update batch quantity if batch exists
-                            if batch:
-                                old_batch_quantity = batch.current_quantity
-                                batch.current_quantity = old_batch_quantity + quantity
-                                batch.save()
-                                batch.refresh_from_db()
-                                print(f"DEBUG: Batch {batch.batch_number} updated from {old_batch_quantity} to {batch.current_quantity}")
-                            
-                            # Create stock movement record for return
-                            StockMovement.objects.create(
-                                product=product,
-                                movement_type='return_in',
-                                quantity=quantity,
-                                batch_number=batch.batch_number if batch else '',
-                                reference_number=sale_return.return_number,
-                                notes=f"Sale return exchange - {sale_return.return_number}",
-                                movement_date=timezone.now()
-                            )
-                        
-                        # Process exchange product (reduce stock)
-                        exchange_product = sale_return.exchange_product
-                        exchange_quantity = sale_return.exchange_quantity
-                        
-                        old_exchange_stock = exchange_product.current_stock
-                        exchange_product.current_stock = old_exchange_stock - exchange_quantity
-                        exchange_product.save()
-                        exchange_product.refresh_from_db()
-                        
-                        print(f"DEBUG: Exchange product {exchange_product.name} stock updated from {old_exchange_stock} to {exchange_product.current_stock}")
-                        
-                        # Create stock movement for exchange out
-                        StockMovement.objects.create(
-                            product=exchange_product,
-                            movement_type='sale_out',
-                            quantity=exchange_quantity,
-                            reference_number=sale_return.return_number,
-                            notes=f"Exchange for return - {sale_return.return_number}",
-                            movement_date=timezone.now()
-                        )
-                        
-                        # Handle balance amount for product exchange
-                        if sale_return.balance_amount != 0:
-                            balance_info = f"Balance amount: ৳{abs(sale_return.balance_amount):.2f}"
-                            if sale_return.balance_amount > 0:
-                                balance_info += " (Refund to customer)"
-                            else:
-                                balance_info += " (Payment from customer)"
-                            messages.info(request, balance_info)
-                        
-                        messages.success(request, f'Product exchange processed. {exchange_quantity} units of {exchange_product.name} issued.')
+                        messages.success(request, f'Product exchange processed. {sale_return.exchange_quantity} units of {sale_return.exchange_product.name} issued.')
                     
                     # Update return status
                     sale_return.status = 'completed'
@@ -3015,7 +2671,7 @@ def sale_return_delete(request, return_id):
 
 @login_required
 @view_permission_required('generate_sales_report')
-
+@read_only_db
 def generate_sales_report(request):
     """Generate sales report based on filters"""
     print("DEBUG: generate_sales_report view called")
@@ -3044,42 +2700,42 @@ def generate_sales_report(request):
 
             # Build filters
             filters = Q()
-            today = timezone.now().date()
+            today = business_calendar.today()
             
             # Date range filtering
             if date_range == 'custom' and start_date and end_date:
                 start_date_obj = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end_date_obj = datetime.strptime(end_date, '%Y-%m-%d').date()
-                filters &= Q(sale_date__date__range=[start_date_obj, end_date_obj])
+                filters &= day_filter('sale_date', start_date_obj, end_date_obj)
                 print(f"DEBUG: Custom date range: {start_date} to {end_date}")
             elif date_range == 'today':
-                filters &= Q(sale_date__date=today)
+                filters &= day_filter('sale_date', today)
                 print(f"DEBUG: Today's date: {today}")
             elif date_range == 'yesterday':
                 yesterday = today - timedelta(days=1)
-                filters &= Q(sale_date__date=yesterday)
+                filters &= day_filter('sale_date', yesterday)
                 print(f"DEBUG: Yesterday's date: {yesterday}")
             elif date_range == 'this_week':
                 start_of_week = today - timedelta(days=today.weekday())
-                filters &= Q(sale_date__date__gte=start_of_week)
+                filters &= since_filter('sale_date', start_of_week)
                 print(f"DEBUG: This week from: {start_of_week}")
             elif date_range == 'last_week':
                 start_of_week = today - timedelta(days=today.weekday() + 7)
                 end_of_week = start_of_week + timedelta(days=6)
-                filters &= Q(sale_date__date__range=[start_of_week, end_of_week])
+                filters &= day_filter('sale_date', start_of_week, end_of_week)
                 print(f"DEBUG: Last week: {start_of_week} to {end_of_week}")
             elif date_range == 'this_month':
                 start_of_month = today.replace(day=1)
-                filters &= Q(sale_date__date__gte=start_of_month)
+                filters &= since_filter('sale_date', start_of_month)
                 print(f"DEBUG: This month from: {start_of_month}")
             elif date_range == 'last_month':
                 start_of_month = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
                 end_of_month = today.replace(day=1) - timedelta(days=1)
-                filters &= Q(sale_date__date__range=[start_of_month, end_of_month])
+                filters &= day_filter('sale_date', start_of_month, end_of_month)
                 print(f"DEBUG: Last month: {start_of_month} to {end_of_month}")
             else:
                 # Default to today
-                filters &= Q(sale_date__date=today)
+                filters &= day_filter('sale_date', today)
                 print(f"DEBUG: Default to today: {today}")
 
             # Additional filters based on report type
@@ -3096,27 +2752,11 @@ def generate_sales_report(request):
             # Apply filters to sales
             print("DEBUG: Querying sales data...")
             sales = Sale.objects.filter(filters).select_related('sold_by').prefetch_related('items__product', 'items__batch').distinct()
-            sales_count = sales.count()
-            print(f"DEBUG: Found {sales_count} sales records")
 
             # Calculate report statistics
-            total_sales = sales.aggregate(total=Sum('total_amount'))['total'] or 0
-            total_returns = sales.aggregate(total=Sum('returned_amount'))['total'] or 0
-            net_sales = total_sales - total_returns
-            total_transactions = sales.count()
-            
-            # Calculate items sold
-            total_items_sold = SaleItem.objects.filter(sale__in=sales).aggregate(total=Sum('quantity'))['total'] or 0
-            
-            # Calculate returned items
-            total_items_returned = 0
-            for sale in sales:
-                total_items_returned += sale.total_returned_quantity
-            
-            net_items_sold = total_items_sold - total_items_returned
-            average_sale = (net_sales / sales.count()) if sales.exists() else 0
-
-            print(f"DEBUG: Statistics - Gross: {total_sales}, Net: {net_sales}, Transactions: {total_transactions}")
+            summary = sales_summary(sales)
+            total_transactions = summary['transactions']
+            net_sales = summary['net_sales']
 
             # Get top products for this report
             top_products = SaleItem.objects.filter(sale__in=sales).values(
@@ -3142,13 +2782,15 @@ def generate_sales_report(request):
                 'request_user': request.user.get_full_name() or request.user.username,
                 
                 # Statistics
-                'gross_sales': total_sales,
+                'gross_sales': summary['gross_sales'],
                 'net_sales': net_sales,
-                'total_returns': total_returns,
-                'total_items_sold': total_items_sold,
-                'total_items_returned': total_items_returned,
-                'net_items_sold': net_items_sold,
-                'average_sale': average_sale,
+                'total_returns': summary['total_returns'],
+                'total_items_sold': summary['items_sold'],
+                'total_items_returned': summary['items_returned'],
+                'net_items_sold': summary['net_items_sold'],
+                'average_sale': summary['average_sale'],
+                'total_actual_paid': summary['actual_paid'],
+                'total_due_amount': summary['due'],
                 'total_transactions': total_transactions,
                 'top_products': top_products,
 
@@ -3193,23 +2835,10 @@ def generate_sales_report(request):
                 print("DEBUG: Generating PDF download...")
                 # Generate PDF using ReportLab
                 try:
-                    pdf_content = generate_sales_report_pdf(context)
-                    
-                    if pdf_content and len(pdf_content) > 100:  # Basic validation that PDF has content
-                        # Create filename
-                        filename = f"sales_report_{report_type}_{today}.pdf"
-                        
-                        # Return PDF response
-                        response = HttpResponse(pdf_content, content_type='application/pdf')
-                        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-                        print("DEBUG: PDF response created successfully")
-                        return response
-                    else:
-                        error_msg = "Generated PDF is empty or too small"
-                        print(f"DEBUG: {error_msg}, PDF size: {len(pdf_content) if pdf_content else 0}")
-                        messages.error(request, "Failed to generate PDF. The generated file was empty.")
-                        return redirect('daily_sale_report')
-                        
+                    filename = f"sales_report_{report_type}_{today}.pdf"
+                    # Rendered into a temporary file and streamed from there
+                    return sales_report_pdf_response(context, filename)
+
                 except Exception as pdf_error:
                     error_msg = f'PDF generation failed: {str(pdf_error)}'
                     print(f"DEBUG: {error_msg}")
@@ -3243,7 +2872,7 @@ def generate_sales_report(request):
                 'average_sale': 0,
                 'total_transactions': 0,
                 'top_products': [],
-                'today': timezone.now().date(),
+                'today': business_calendar.today(),
                 'company_name': 'Shop Management System',
                 'report_title': 'Sales Report',
                 'footer_text': 'Shop Management System - Confidential Report',
@@ -3332,159 +2961,25 @@ def product_delete(request, pk):
     
     return render(request, 'core/product_confirm_delete.html', {'product': product})
 
-@login_required
-def search_product_by_barcode(request):
-    """API endpoint to search product by barcode or name"""
-    query = request.GET.get('barcode', '').strip()
-    
-    if query:
-        try:
-            # First try exact barcode match (maintains existing functionality)
-            product = Product.objects.get(barcode=query)
-            return JsonResponse({
-                'success': True,
-                'product': {
-                    'id': product.id,
-                    'name': product.name,
-                    'sku': product.sku,
-                    'barcode': product.barcode,
-                    'selling_price': str(product.selling_price),
-                    'current_stock': product.current_stock,
-                    'has_expiry': product.has_expiry,
-                }
-            })
-        except Product.DoesNotExist:
-            # NEW: If no exact barcode match, search by name or partial barcode
-            products = Product.objects.filter(
-                Q(name__icontains=query) | 
-                Q(barcode__icontains=query) |
-                Q(sku__icontains=query)
-            )[:10]  # Limit results for performance
-            
-            if products.exists():
-                product_list = []
-                for product in products:
-                    product_list.append({
-                        'id': product.id,
-                        'name': product.name,
-                        'sku': product.sku,
-                        'barcode': product.barcode,
-                        'selling_price': str(product.selling_price),
-                        'current_stock': product.current_stock,
-                        'has_expiry': product.has_expiry,
-                    })
-                
-                return JsonResponse({
-                    'success': True,
-                    'products': product_list,
-                    'multiple': True  # Flag to indicate multiple results
-                })
-            
-            return JsonResponse({
-                'success': False,
-                'error': 'No products found with that name or barcode'
-            })
-    
-    return JsonResponse({
-        'success': False,
-        'error': 'No search query provided'
-    })
-
-
-def search_customer(request):
-    """Search customers by name or phone"""
-    query = request.GET.get('q', '')
-    if len(query) < 2:
-        return JsonResponse({'success': False, 'message': 'Please enter at least 2 characters'})
-    
-    customers = Customer.objects.filter(
-        Q(name__icontains=query) | Q(phone__icontains=query),
-        is_active=True
-    ).values('id', 'name', 'phone', 'total_due', 'credit_limit')[:10]
-    
-    return JsonResponse({
-        'success': True,
-        'customers': list(customers)
-    })
-
-def get_customer_due_details(request, customer_id):
-    """Get customer due details and due sales"""
-    try:
-        customer = Customer.objects.get(id=customer_id)
-        due_sales = Sale.objects.filter(
-            customer=customer,
-            payment_status__in=['due', 'partial']
-        ).values('invoice_number', 'sale_date', 'total_amount', 'paid_amount')
-        
-        # Calculate remaining due for each sale
-        for sale in due_sales:
-            sale['remaining_due'] = sale['total_amount'] - sale['paid_amount']
-        
-        return JsonResponse({
-            'success': True,
-            'customer': {
-                'id': customer.id,
-                'name': customer.name,
-                'phone': customer.phone,
-                'total_due': float(customer.total_due),
-                'credit_limit': float(customer.credit_limit),
-            },
-            'due_sales': list(due_sales)
-        })
-    except Customer.DoesNotExist:
-        return JsonResponse({'success': False, 'message': 'Customer not found'})
 
+@login_required
 def make_due_payment(request):
     """Process due payment for customer"""
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            customer_id = data.get('customer_id')
+            customer = Customer.objects.get(id=data.get('customer_id'))
             amount = Decimal(data.get('amount', 0))
-            payment_method = data.get('payment_method', 'cash')
-            notes = data.get('notes', '')
-            
-            customer = Customer.objects.get(id=customer_id)
-            
-            if amount <= 0:
-                return JsonResponse({'success': False, 'message': 'Invalid payment amount'})
-            
-            if amount > customer.total_due:
-                return JsonResponse({'success': False, 'message': 'Payment amount exceeds total due'})
-            
-            # Create due payment
-            due_payment = DuePayment.objects.create(
-                customer=customer,
-                amount=amount,
-                payment_method=payment_method,
-                notes=notes,
-                received_by=request.user
-            )
             
             # Update corresponding sales (FIFO method)
-            remaining_payment = amount
-            due_sales = Sale.objects.filter(
-                customer=customer,
-                payment_status__in=['due', 'partial']
-            ).order_by('sale_date')
-            
-            for sale in due_sales:
-                if remaining_payment <= 0:
-                    break
-                    
-                sale_due = sale.total_amount - sale.paid_amount
-                payment_to_apply = min(remaining_payment, sale_due)
-                
-                sale.paid_amount += payment_to_apply
-                remaining_payment -= payment_to_apply
-                
-                # Update sale payment status
-                if sale.paid_amount >= sale.total_amount:
-                    sale.payment_status = 'paid'
-                else:
-                    sale.payment_status = 'partial'
-                
-                sale.save()
+            allocate_due_payment(
+                customer,
+                amount,
+                request.user,
+                payment_method=data.get('payment_method', 'cash'),
+                notes=data.get('notes', ''),
+            )
+            customer.refresh_from_db(fields=['total_due'])
             
             return JsonResponse({
                 'success': True,
@@ -3494,6 +2989,10 @@ def make_due_payment(request):
             
         except Customer.DoesNotExist:
             return JsonResponse({'success': False, 'message': 'Customer not found'})
+        except InvalidOperation:
+            return JsonResponse({'success': False, 'message': 'Invalid payment amount'})
+        except ValueError as e:
+            return JsonResponse({'success': False, 'message': str(e)})
         except Exception as e:
             return JsonResponse({'success': False, 'message': f'Error processing payment: {str(e)}'})
     
@@ -3505,6 +3004,7 @@ def make_due_payment(request):
 
 @login_required
 @view_permission_required('customer_due_report')
+@read_only_db
 def customer_due_report(request):
     """Customer Due Report with accurate due calculation - FIXED VERSION"""
     # Get all active customers
@@ -3522,12 +3022,8 @@ def customer_due_report(request):
             Q(phone__icontains=customer_filter)
         )
     
-    # Force update due amounts for all filtered customers to ensure accuracy
-    for customer in customers:
-        customer.update_due_amount()
-        customer.refresh_from_db()  # Refresh to get updated values
-    
-    # Re-apply filters after updating due amounts
+    # total_due is kept current by Sale.save(), DuePayment.save() and
+    # allocate_due_payment, so this read-only view does not recalculate it
     if due_status == 'with_due':
         customers = customers.filter(total_due__gt=0)
     elif due_status == 'without_due':
@@ -3576,7 +3072,7 @@ def customer_due_report(request):
         'customers_with_due': customers_with_due,
         'total_due_amount': total_due_amount,
         'avg_due_per_customer': avg_due_per_customer,
-        'today': timezone.now().date(),
+        'today': business_calendar.today(),
         'filters': {
             'customer': customer_filter,
             'due_status': due_status,
@@ -3588,6 +3084,7 @@ def customer_due_report(request):
 
 @login_required
 @view_permission_required('due_collection_report')
+@read_only_db
 def due_collection_report(request):
     """Due Collection Report with filtering"""
     payments = DuePayment.objects.select_related('customer', 'received_by').all().order_by('-payment_date')
@@ -3625,18 +3122,11 @@ def due_collection_report(request):
     ).order_by('-total_amount')
     
     # Daily collection trend (last 30 days)
-    today = timezone.now().date()
+    today = business_calendar.today()
     start_date = today - timedelta(days=30)
-    
-    daily_collections = DuePayment.objects.filter(
-        payment_date__date__gte=start_date
-    ).values('payment_date__date').annotate(
-        total_amount=Sum('amount', output_field=DecimalField(max_digits=10, decimal_places=2)),
-        payment_count=Count('id')
-    ).order_by('payment_date__date')
-    
-    daily_labels = [collection['payment_date__date'].strftime('%Y-%m-%d') for collection in daily_collections]
-    daily_data = [float(collection['total_amount']) for collection in daily_collections]
+    daily_collections = series('collections', 'day', start_date, today)
+    daily_labels = [collection['bucket'].strftime('%Y-%m-%d') for collection in daily_collections]
+    daily_data = [float(collection['value']) for collection in daily_collections]
     
     # Top customers by collection
     top_customers = payments.values('customer__name', 'customer__phone').annotate(
@@ -3679,140 +3169,76 @@ def process_due_payment(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            customer_id = data.get('customer_id')
+            customer = Customer.objects.get(id=data.get('customer_id'))
             amount = Decimal(data.get('amount', 0))
-            payment_method = data.get('payment_method', 'cash')
-            notes = data.get('notes', '')
-            
-            customer = Customer.objects.get(id=customer_id)
-            
-            if amount <= 0:
-                return JsonResponse({
-                    'success': False, 
-                    'message': 'Payment amount must be greater than zero'
-                })
-            
-            # Get due invoices ordered by date (oldest first) - FIFO
-            due_invoices = Sale.objects.filter(
-                customer=customer,
-                payment_status__in=['due', 'partial']
-            ).order_by('sale_date', 'id')
-            
-            if not due_invoices.exists():
-                return JsonResponse({
-                    'success': False, 
-                    'message': 'Customer has no due invoices'
-                })
-            
-            total_due = sum(invoice.remaining_due for invoice in due_invoices)
-            
-            if amount > total_due:
-                return JsonResponse({
-                    'success': False, 
-                    'message': f'Payment amount (৳{amount}) exceeds total due (৳{total_due})'
-                })
             
             # Allocate payment to invoices using FIFO
-            allocated_payments = []
-            remaining_amount = amount
-            
-            with transaction.atomic():
-                for invoice in due_invoices:
-                    if remaining_amount <= 0:
-                        break
-                        
-                    invoice_due = invoice.remaining_due
-                    payment_to_apply = min(remaining_amount, invoice_due)
-                    
-                    # Record allocation details
-                    allocated_payments.append({
-                        'invoice_number': invoice.invoice_number,
-                        'sale_date': invoice.sale_date.strftime('%Y-%m-%d'),
-                        'due_amount': float(invoice_due),
-                        'allocated_amount': float(payment_to_apply),
-                        'remaining_due_after': float(invoice_due - payment_to_apply)
-                    })
-                    
-                    # Update sale
-                    invoice.paid_amount += payment_to_apply
-                    remaining_amount -= payment_to_apply
-                    
-                    # Update sale payment status
-                    if invoice.paid_amount >= invoice.total_amount:
-                        invoice.payment_status = 'paid'
-                    else:
-                        invoice.payment_status = 'partial'
-                    
-                    invoice.save()
-                
-                # Create due payment record
-                due_payment = DuePayment.objects.create(
-                    customer=customer,
-                    amount=amount,
-                    payment_method=payment_method,
-                    notes=notes,
-                    received_by=request.user,
-                    allocated_details=allocated_payments
-                )
-                
-                # CRITICAL FIX: Force update customer due amount
-                customer.refresh_from_db()
-                customer.update_due_amount()
-                customer.refresh_from_db()  # Refresh again to get updated total_due
+            due_payment = allocate_due_payment(
+                customer,
+                amount,
+                request.user,
+                payment_method=data.get('payment_method', 'cash'),
+                notes=data.get('notes', ''),
+            )
+            customer.refresh_from_db(fields=['total_due'])
             
             return JsonResponse({
                 'success': True,
                 'message': f'Payment of ৳{amount} processed successfully',
-                'allocated_payments': allocated_payments,
+                'allocated_payments': due_payment.allocated_details,
                 'new_total_due': float(customer.total_due)
             })
             
         except Customer.DoesNotExist:
             return JsonResponse({'success': False, 'message': 'Customer not found'})
+        except InvalidOperation:
+            return JsonResponse({'success': False, 'message': 'Invalid payment amount'})
+        except ValueError as e:
+            return JsonResponse({'success': False, 'message': str(e)})
         except Exception as e:
             return JsonResponse({'success': False, 'message': f'Error processing payment: {str(e)}'})
     
     return JsonResponse({'success': False, 'message': 'Invalid request method'})
 
+
 @login_required
-def get_customer_due_details(request, customer_id):
-    """Get detailed due information for a customer"""
+@view_permission_required('customer_due_report')
+@read_only_db
+def customer_statement(request, customer_id):
+    """Ledger of a customer's sales, due payments and returns with a running balance"""
+    customer = get_object_or_404(Customer, id=customer_id)
+    date_from = request.GET.get('date_from', '')
+    date_to = request.GET.get('date_to', '')
     try:
-        customer = Customer.objects.get(id=customer_id)
-        
-        # Get due invoices with details
-        due_invoices = Sale.objects.filter(
-            customer=customer,
-            payment_status__in=['due', 'partial']
-        ).order_by('sale_date').values(
-            'id', 'invoice_number', 'sale_date', 'total_amount', 
-            'paid_amount', 'payment_status'
-        )
-        
-        # Calculate remaining due for each invoice
-        for invoice in due_invoices:
-            invoice['remaining_due'] = invoice['total_amount'] - invoice['paid_amount']
-            invoice['sale_date'] = invoice['sale_date'].strftime('%Y-%m-%d %H:%M')
-        
-        total_due = sum(invoice['remaining_due'] for invoice in due_invoices)
-        
-        return JsonResponse({
-            'success': True,
-            'customer': {
-                'id': customer.id,
-                'name': customer.name,
-                'phone': customer.phone,
-                'total_due': float(total_due),
-                'credit_limit': float(customer.credit_limit),
-            },
-            'due_invoices': list(due_invoices),
-            'total_due_amount': float(total_due),
-            'due_invoice_count': len(due_invoices)
-        })
-    except Customer.DoesNotExist:
-        return JsonResponse({'success': False, 'message': 'Customer not found'})
-    
+        start = parse_range(date_from, None)
+        end = parse_range(date_to, None)
+    except ValueError as e:
+        messages.error(request, str(e))
+        start = end = None
+    statement = Statement(customer, start, end)
+
+    export = request.GET.get('format')
+    if export in ('csv', 'pdf'):
+        filename = f"statement_{customer.phone}_{business_calendar.today():%Y%m%d}.{export}"
+        if export == 'csv':
+            return statement_csv_response(statement, filename)
+        return statement_pdf_response(statement, filename)
+
+    paginator = Paginator(statement, 50)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    entries = [(entry, describe(entry)) for entry in page_obj]
 
+    context = {
+        'customer': customer,
+        'entries': entries,
+        'page_obj': page_obj,
+        'summary': statement.summary(),
+        'filters': {
+            'date_from': date_from,
+            'date_to': date_to,
+        },
+    }
+    return render(request, 'core/customer_statement.html', context)
 
 @login_required
 def debug_customer_due(request, customer_id):
@@ -3918,72 +3344,10 @@ def force_update_all_due_amounts(request):
             'success': False,
             'message': f'Error force updating due amounts: {str(e)}'
         })
-    
-
-
-
-@login_required
-def get_product_details(request):
-    """API endpoint to get product details for exchange"""
-    product_id = request.GET.get('product_id')
-    
-    if product_id:
-        try:
-            product = Product.objects.get(id=product_id)
-            return JsonResponse({
-                'success': True,
-                'product': {
-                    'id': product.id,
-                    'name': product.name,
-                    'sku': product.sku,
-                    'selling_price': str(product.selling_price),
-                    'current_stock': product.current_stock,
-                    'cost_price': str(product.cost_price),
-                }
-            })
-        except Product.DoesNotExist:
-            return JsonResponse({'success': False, 'error': 'Product not found'})
-    
-    return JsonResponse({'success': False, 'error': 'No product ID provided'})
-
 
 
 #category & Supplier
 
-@require_http_methods(["GET"])
-def search_categories(request):
-    query = request.GET.get('q', '').strip()
-    if len(query) < 2:
-        return JsonResponse([], safe=False)
-    
-    categories = Category.objects.filter(name__icontains=query)[:10]
-    results = []
-    for category in categories:
-        results.append({
-            'id': category.id,
-            'name': category.name,
-            'description': category.description
-        })
-    
-    return JsonResponse(results, safe=False)
-
-@require_http_methods(["GET"])
-def search_suppliers(request):
-    query = request.GET.get('q', '').strip()
-    if len(query) < 2:
-        return JsonResponse([], safe=False)
-    
-    suppliers = Supplier.objects.filter(name__icontains=query)[:10]
-    results = []
-    for supplier in suppliers:
-        results.append({
-            'id': supplier.id,
-            'name': supplier.name,
-            'contact_person': supplier.contact_person,
-            'phone': supplier.phone
-        })
-    
-    return JsonResponse(results, safe=False)
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -4054,5 +3418,3 @@ def create_supplier(request):
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)})
     
-
-
@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'core.middleware.SessionTouchMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -91,12 +92,63 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '3306'),
+        # Keep each worker's connection open between requests instead of
+        # reconnecting every time; 0 closes it after each request as before
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),  # seconds
+        # Ping a reused connection before the first query of a request so a
+        # connection MySQL dropped (wait_timeout, restart) is replaced
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
         }
     }
 }
 
+# Optional read replica for the report views (core/db_router.py)
+REPLICA_DATABASE = 'replica'
+REPLICA_MAX_LAG = int(os.getenv('DB_REPLICA_MAX_LAG', '30'))  # seconds; fall back to primary beyond this
+
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES[REPLICA_DATABASE] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'USER': os.getenv('DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.getenv('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+
+
+# Cache: locmem (default, per process), file, or redis (any Redis-compatible server)
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+
+if CACHE_BACKEND == 'redis':
+    _default_cache = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', 'redis://127.0.0.1:6379/1'),
+    }
+elif CACHE_BACKEND == 'file':
+    _default_cache = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('CACHE_DIR', str(BASE_DIR / 'cache')),
+    }
+else:
+    _default_cache = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'shop-man',
+    }
+
+CACHES = {
+    'default': {
+        **_default_cache,
+        'KEY_PREFIX': os.getenv('CACHE_KEY_PREFIX', 'shop_man'),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', '300')),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,7 +174,15 @@ AUTH_PASSWORD_VALIDATORS = [
 
 LANGUAGE_CODE = 'en-us'
 
-TIME_ZONE = 'UTC'
+# The shop's local time zone: the current time zone for display and forms, and
+# the zone trading days and hourly reports are cut in (core/business_calendar.py).
+# Set it explicitly (e.g. SHOP_TIME_ZONE=Asia/Dhaka); MySQL needs its time zone
+# tables loaded (mysql_tzinfo_to_sql) for non-UTC zones, see core/checks.py.
+SHOP_TIME_ZONE = os.getenv('SHOP_TIME_ZONE', 'UTC')
+TIME_ZONE = SHOP_TIME_ZONE
+# Local time a trading day starts at (HH:MM); sales rung up after midnight but
+# before this count towards the previous day, for shops that close late
+TRADING_DAY_START = os.getenv('TRADING_DAY_START', '00:00')
 
 USE_I18N = True
 
@@ -143,8 +203,12 @@ LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'login'
 SESSION_COOKIE_AGE = 1209600  # 2 weeks in seconds
-SESSION_SAVE_EVERY_REQUEST = True
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
+# Sessions: cached_db (default), signed_cookies or db
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.getenv('SESSION_BACKEND', 'cached_db')
+# Instead of saving the session on every request, core.middleware.SessionTouchMiddleware
+# extends an idle session at most once per interval
+SESSION_TOUCH_INTERVAL = int(os.getenv('SESSION_TOUCH_INTERVAL', '300'))  # seconds
 SESSION_COOKIE_SECURE = not DEBUG
 CSRF_COOKIE_SECURE = not DEBUG
 SECURE_BROWSER_XSS_FILTER = True